@@ -0,0 +1,102 @@
+"""
+Startup benchmark of the cli. Each command is run in a fresh interpreter, once with
+python -X importtime to find which modules it imports and how long they take, then repeatedly to
+measure its wall clock time. Results are printed as json.
+
+    python benchmarks/startup.py [--repeat N] [--output results.json] [--check]
+
+With --check, the exit status is 1 if the median time of a command exceeds its target, or if a
+command imports one of the modules that are only needed for plotting and data frames.
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = str(pathlib.Path(os.path.dirname(os.path.abspath(__file__))).parent.absolute())
+
+# Arguments of each command and its target median startup time, in seconds
+COMMANDS = {
+    "help": (["--help"], 0.5),
+    "parameters --list": (["parameters", "--list"], 0.5),
+    "normalizers --list": (["normalizers", "--list"], 0.5),
+}
+# Modules which must only be imported when they are used
+LAZY_MODULES = ("matplotlib", "pandas")
+
+
+def import_times(args: List[str]) -> Tuple[Dict[str, float], float]:
+    """Runs the cli with python -X importtime. Returns the cumulative import time in seconds of every
+    module it imported, nested modules included, and the total import time.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "cli.py", *args], cwd=ROOT, capture_output=True, text=True
+    )
+    times = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+        # Nested modules are indented by two more spaces per level
+        if not name[1:].startswith(" "):
+            total += int(cumulative) / 1e6
+    return times, total
+
+
+def wall_times(args: List[str], repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "cli.py", *args], cwd=ROOT, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(repeat: int = 5) -> Dict[str, Dict]:
+    results = {}
+    for name, (args, target) in COMMANDS.items():
+        modules, import_seconds = import_times(args)
+        times = wall_times(args, repeat)
+        results[name] = {
+            "target_seconds": target,
+            "median_seconds": statistics.median(times),
+            "min_seconds": min(times),
+            "import_seconds": import_seconds,
+            "lazy_modules_imported": [m for m in LAZY_MODULES if m in modules],
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cli startup benchmark.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs of each command")
+    parser.add_argument("--output", type=str, help="Write the results to a json file")
+    parser.add_argument("--check", action="store_true", help="Fail if a command misses its target")
+    args = parser.parse_args()
+
+    results = {"python": platform.python_version(), "commands": run(args.repeat)}
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.check:
+        failed = [
+            name for name, r in results["commands"].items()
+            if r["median_seconds"] > r["target_seconds"] or r["lazy_modules_imported"]
+        ]
+        if failed:
+            print(f"Startup targets missed: {', '.join(failed)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark suite on synthetic models and datasets, see synthetic.py. Every benchmark is run for each
+dataset size and timed repeat times, results are printed as json and can be written to a file to
+compare runs of different versions on the same machine.
+
+    python benchmarks/suite.py [--sizes 1000 100000 10000000] [--repeat 3] [--only evaluate] [--output results.json]
+
+Data points are only created for the benchmarks of row datasets, which are limited to --row-limit
+rows, the json storage is limited to --json-limit rows.
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+current_path = os.path.dirname(os.path.abspath(__file__))
+current_path = pathlib.Path(current_path).parent.absolute()
+sys.path.append(str(current_path))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pareto
+import scoring
+from dataset import ColumnarDataset, Dataset
+from helpers import encode_labels
+from model import Model
+from parameter import EnumParameter
+from synthetic import synthetic_columns, synthetic_dataset, synthetic_parameters
+
+DEFAULT_SIZES = [1000, 10_000, 100_000]
+
+
+def measure(function: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> List[float]:
+    """Times repeat calls of function, setup is called before each of them and is not timed."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+class Suite:
+    def __init__(self, repeat: int = 3, row_limit: int = 100_000, json_limit: int = 100_000, only: Optional[str] = None):
+        self.repeat = repeat
+        self.row_limit = row_limit
+        self.json_limit = json_limit
+        self.only = only
+        self.results = []
+
+    def record(self, benchmark: str, rows: int, function: Callable[[], Any], setup: Optional[Callable[[], Any]] = None) -> None:
+        if self.only is not None and self.only not in benchmark:
+            return
+        times = measure(function, self.repeat, setup)
+        self.results.append(
+            {
+                "benchmark": benchmark,
+                "rows": rows,
+                "seconds": min(times),
+                "median_seconds": statistics.median(times),
+                "rows_per_second": rows / min(times) if min(times) else None,
+            }
+        )
+        print(f"{benchmark:40} {rows:>10} rows {min(times):10.4f}s", file=sys.stderr)
+
+    def run(self, sizes: List[int]) -> List[Dict[str, Any]]:
+        storage = tempfile.mkdtemp()
+        storage_folders = Model.storage_folder, Dataset.storage_folder
+        Model.storage_folder = storage + "/model/"
+        Dataset.storage_folder = storage + "/dataset/"
+        try:
+            for n in sizes:
+                self.run_size(n)
+        finally:
+            Model.storage_folder, Dataset.storage_folder = storage_folders
+            shutil.rmtree(storage)
+        return self.results
+
+    def run_size(self, n: int) -> None:
+        parameters = synthetic_parameters()
+        columns = synthetic_columns(n)
+        for p in parameters:
+            values = columns[p.name]
+            kernel = "labels" if isinstance(p, EnumParameter) else p.normalizer.get_type()
+            self.record(f"normalize {p.name} {kernel}", n, lambda: p.evaluate_scores(values))
+            if p.takes_encoded_values:
+                encoded = encode_labels(values)
+                self.record(f"normalize {p.name} codes", n, lambda: p.evaluate_scores(encoded))
+
+        ds = synthetic_dataset(n)
+        ds.store_columns()
+        model = Model(name="synthetic", parameters=parameters, datasets=[ds])
+        ds = model.datasets[0].get()
+        plan = model.scoring_plan()
+        self.record("compile scoring plan", n, lambda: scoring.ScoringPlan.compile(parameters))
+        self.record(
+            "evaluate_dataset columnar", n,
+            lambda: scoring.evaluate_dataset(ds, plan), setup=ds._invalidate_scores,
+        )
+        self.record("evaluate_datasets columnar", n, model.evaluate_datasets, setup=ds._invalidate_scores)
+        self.record("total scores after a weight change", n, lambda: model.change_parameter_weight("price", 2.0))
+
+        self.record("dataframe", n, ds.dataframe, setup=ds._invalidate_dataframe)
+        self.record("dataframe multiindex", n, lambda: ds.dataframe(multiindex=True), setup=ds._invalidate_dataframe)
+        self.record("order_by_parameter_score", n, lambda: ds.order_by_parameter_score("price"), setup=ds._invalidate_dataframe)
+        self.record("top_k 10", n, lambda: ds.top_k(10))
+        self.record("page 1000-1010", n, lambda: ds.page(1000, 10))
+        self.record("pareto frontier", n, lambda: pareto.pareto_frontier(ds.score_matrix(ds.parameter_names())))
+        self.record("pareto layers 3", n, lambda: pareto.pareto_layers(ds.score_matrix(ds.parameter_names()), 3))
+
+        self.record("store_columns", n, ds.store_columns)
+        self.record("load_columns", n, lambda: ColumnarDataset.load_columns(ds.name))
+        self.record("load_columns and score", n, lambda: _load_and_score(ds.name, plan))
+        self.record("model store_binary", n, model.store_binary)
+        self.record("model load_binary", n, lambda: Model.load_binary(model.name))
+
+        if n <= self.json_limit:
+            self.record("store_json", n, ds.store_json)
+            self.record("load json columnar", n, lambda: ColumnarDataset(**Dataset.load_json(ds.name)))
+
+        if n <= self.row_limit:
+            rows = ds.to_dataset()
+            self.record("evaluate_dataset rows", n, lambda: scoring.evaluate_dataset(rows, plan), setup=rows._invalidate_scores)
+            self.record("dataframe rows", n, rows.dataframe, setup=rows._invalidate_dataframe)
+            self.record("store_json rows", n, rows.store_json)
+            self.record("load json rows", n, lambda: Dataset(**Dataset.load_json(rows.name)))
+
+
+def _load_and_score(name: str, plan: scoring.ScoringPlan) -> None:
+    ds = ColumnarDataset.load_columns(name)
+    ds._invalidate_scores()
+    scoring.evaluate_dataset(ds, plan)
+
+
+def environment() -> Dict[str, Any]:
+    import pandas
+    import pydantic
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=current_path, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pandas.__version__,
+        "pydantic": pydantic.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite on synthetic datasets.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of rows")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs of each benchmark")
+    parser.add_argument("--only", type=str, help="Only run the benchmarks whose name contains this")
+    parser.add_argument("--row-limit", type=int, default=100_000, help="Largest row dataset")
+    parser.add_argument("--json-limit", type=int, default=100_000, help="Largest dataset stored as json")
+    parser.add_argument("--output", type=str, help="Write the results to a json file")
+    args = parser.parse_args()
+
+    suite = Suite(args.repeat, args.row_limit, args.json_limit, args.only)
+    results = {"environment": environment(), "results": suite.run(args.sizes)}
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
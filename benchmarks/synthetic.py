@@ -0,0 +1,84 @@
+"""
+Synthetic models and datasets for the benchmarks. A model mixes numerical, boolean, time and enum
+parameters with absolute and relative normalizers, and its datasets are generated column by column
+with numpy, so that datasets of millions of rows can be built without creating data points.
+"""
+import datetime
+import os
+import pathlib
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+current_path = os.path.dirname(os.path.abspath(__file__))
+current_path = pathlib.Path(current_path).parent.absolute()
+sys.path.append(str(current_path))
+
+import normalization.normalization as normalization
+import parameter
+from dataset import ColumnarDataset, Dataset
+
+START_DATE = datetime.date(2000, 1, 1)
+END_DATE = datetime.date(2024, 1, 1)
+LABELS = {f"label {i}": float(i * 100 // 23) for i in range(24)}
+
+
+def synthetic_parameters() -> List[parameter.Parameter]:
+    """Returns one parameter of each kind and normalizer."""
+    return [
+        parameter.NumericalParameter(
+            name="price", unit="EUR", weight=3.0, value_range=(0, 10000),
+            normalizer=normalization.StepLinearNegative(threshold_low=1000, threshold_high=8000),
+        ),
+        parameter.NumericalParameter(
+            name="area", unit="m2", weight=2.0,
+            normalizer=normalization.StepLinearPositive(threshold_low=30, threshold_high=150),
+        ),
+        parameter.NumericalParameter(
+            name="rooms", unit="", weight=1.0, normalizer=normalization.Step(threshold=3),
+        ),
+        parameter.NumericalParameter(
+            name="rating", unit="stars", weight=1.5, normalizer=normalization.RelativeAscending(),
+        ),
+        parameter.BooleanParameter(name="parking", unit="", weight=0.5),
+        parameter.TimeParameter(
+            name="built", unit="", weight=1.0,
+            normalizer=normalization.StepAbsoluteTimeNormalizer(start_date=START_DATE, end_date=END_DATE),
+        ),
+        parameter.TimeParameter(
+            name="listed", unit="", weight=0.5, normalizer=normalization.RelativeTimeNormalizer(),
+        ),
+        parameter.EnumParameter(name="district", unit="", weight=1.0, labels=dict(LABELS)),
+    ]
+
+
+def synthetic_columns(n_rows: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    """Returns random values for the parameters of synthetic_parameters, one array per parameter."""
+    rng = np.random.default_rng(seed)
+    days = (END_DATE - START_DATE).days
+    dates = np.datetime64(START_DATE) + rng.integers(0, days, n_rows)
+    labels = np.array(list(LABELS), dtype=object)
+    return {
+        "price": rng.uniform(0, 10000, n_rows),
+        "area": rng.integers(10, 300, n_rows),
+        "rooms": rng.integers(1, 8, n_rows),
+        "rating": rng.integers(0, 6, n_rows),
+        "parking": rng.random(n_rows) < 0.5,
+        # Time parameters take python dates
+        "built": dates.astype(object),
+        "listed": np.roll(dates, 1).astype(object),
+        "district": labels[rng.integers(0, len(labels), n_rows)],
+    }
+
+
+def synthetic_dataset(n_rows: int, seed: int = 0, name: str = "synthetic") -> ColumnarDataset:
+    return ColumnarDataset.from_columns(
+        name, synthetic_columns(n_rows, seed), [f"alternative {i}" for i in range(n_rows)],
+        description=f"{n_rows} synthetic alternatives",
+    )
+
+
+def synthetic_row_dataset(n_rows: int, seed: int = 0, name: str = "synthetic") -> Dataset:
+    """Returns the synthetic dataset as data points."""
+    return synthetic_dataset(n_rows, seed, name).to_dataset()
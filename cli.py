@@ -1,6 +1,8 @@
 #!/usr/bin/env python3.10
 import argparse
+import atexit
 
+import instrumentation
 import normalization.normalization as normalization
 import parameter
 import user_interaction
@@ -9,6 +11,10 @@ parser = argparse.ArgumentParser(description='Decision making cli.')
 
 parser.add_argument('--version', action='version', version='%(prog)s 1.0')
 parser.add_argument('--verbose', action='store_true', help='verbose output')
+parser.add_argument(
+    '--profile', nargs='?', const='', metavar='PSTATS_FILE',
+    help='Print the time spent in each stage, and dump cProfile stats to PSTATS_FILE if given'
+)
 
 # Create subparsers
 subparsers = parser.add_subparsers(dest='command')
@@ -30,6 +36,7 @@ model_parser.add_argument('--rename', action='store_true', help='Change selected
 model_parser.add_argument('--delete-param', type=str, help='Delete selected model parameters')
 model_parser.add_argument('--add-param', action='store_true', help='Add a new parameter to the selected model')
 model_parser.add_argument('--weight-param', nargs='+', help='Change parameter weight <parameter> <weight>')
+model_parser.add_argument('--fit-weights', nargs='+', help='Fit parameter weights to a preferred order <dataset> <datapoint> <datapoint> ...')
 
 model_parser.add_argument('--create', action='store_true', help='Create model')
 model_parser.add_argument('--delete', action='store_true', help='Delete model')
@@ -38,16 +45,45 @@ model_parser.add_argument('--add-dataset', action='store_true', help='Add datase
 model_parser.add_argument('--list-datasets', action='store_true', help='List datasets in model')
 model_parser.add_argument('--delete-dataset', type=str, help='Add dataset to model')
 model_parser.add_argument('--evaluate-datasets', action='store_true', help='Evaluate datasets in model')
+model_parser.add_argument('--jobs', type=int, default=1, help='Number of processes evaluating datasets, 0 for all cores')
+model_parser.add_argument('--skip-invalid', action='store_true', help='Score the valid datapoints and report the invalid ones')
 
 # Create parser for "dataset" command
 dataset_parser = subparsers.add_parser('dataset', help='Dataset related commands')
 dataset_parser.add_argument('--name', type=str, help='Select dataset')
 dataset_parser.add_argument('--add-datapoint', action='store_true', help='Rename datapoint')
+dataset_parser.add_argument('--store-columns', action='store_true', help='Store dataset in the binary columnar format')
+dataset_parser.add_argument('--import', dest='import_path', type=str, help='Import datapoints from a csv or jsonl file, into the binary columns if the dataset is stored with --store-columns, which is much faster for large files than json')
+dataset_parser.add_argument('--model', type=str, help='Model whose parameters the imported columns map to, its catalog is updated on import or when storing columns')
+dataset_parser.add_argument('--format', choices=['csv', 'jsonl'], help='Format of the imported file, by default its extension')
+dataset_parser.add_argument('--chunk-size', type=int, default=10000, help='Number of rows read at a time when importing')
+dataset_parser.add_argument('--name-column', type=str, default='name', help='Column holding the datapoint names')
+dataset_parser.add_argument('--pareto', nargs='*', metavar='PARAMETER', help='Show the Pareto frontier on the scores of the parameters, all by default')
+dataset_parser.add_argument('--layers', type=int, default=1, help='Number of Pareto layers to show')
 # dataset_parser.add_argument('--rename-datapoint', type=str, help='Create dataset')
 
+# Create parser for "serve" command
+serve_parser = subparsers.add_parser('serve', help='Serve scoring requests on localhost, keeping models loaded')
+serve_parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+serve_parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+serve_parser.add_argument('--model', nargs='*', default=[], help='Models to load at startup, others are loaded on first use')
+serve_parser.add_argument('--check-interval', type=float, default=1.0, help='Seconds between checks of the model files for changes')
+
 # Parse the command-line arguments
 args = parser.parse_args()
 
+if args.profile is not None:
+    instrumentation.enable()
+    # Registered first, so that it runs after the profile is dumped
+    atexit.register(instrumentation.print_report)
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        atexit.register(profiler.dump_stats, args.profile)
+        atexit.register(profiler.disable)
+        profiler.enable()
+
 # Perform actions based on the parsed command
 if args.command == 'parameters':
     if args.list:
@@ -72,6 +108,9 @@ elif args.command == 'model':
         elif args.weight_param:
             param_name, param_weight = args.weight_param
             user_interaction.change_model_parameter_weight(selected_model, param_name, param_weight)
+        elif args.fit_weights:
+            dataset_name, *preferred_order = args.fit_weights
+            user_interaction.fit_model_weights(selected_model, dataset_name, preferred_order)
         elif args.delete:
             user_interaction.delete_model(selected_model)
         elif args.add_dataset:
@@ -81,7 +120,9 @@ elif args.command == 'model':
         elif args.delete_dataset:
             user_interaction.delete_model_dataset(selected_model, args.delete_dataset)
         elif args.evaluate_datasets:
-            user_interaction.evaluate_model_datasets(selected_model)
+            if args.jobs < 0:
+                parser.error('--jobs must be 0 or more')
+            user_interaction.evaluate_model_datasets(selected_model, args.jobs or None, args.skip_invalid)
 
 elif args.command == 'dataset':
     if args.name:
@@ -89,3 +130,15 @@ elif args.command == 'dataset':
         if args.add_datapoint:
             print(f"Add datapoint to {selected_dataset}")
             # user_interaction.add_dataset_datapoint(selected_dataset)
+        elif args.store_columns:
+            user_interaction.store_dataset_columns(selected_dataset, args.model)
+        elif args.pareto is not None:
+            user_interaction.show_pareto_frontier(selected_dataset, args.pareto or None, args.layers)
+        elif args.import_path:
+            if not args.model:
+                parser.error('--import requires --model')
+            user_interaction.import_dataset(
+                selected_dataset, args.model, args.import_path, args.format, args.chunk_size, args.name_column
+            )
+elif args.command == 'serve':
+    user_interaction.serve_models(args.host, args.port, args.model, args.check_interval, args.verbose)
@@ -1,12 +1,34 @@
+import heapq
+import json
+import os
+import pathlib
+import shutil
+import tempfile
 from collections import namedtuple
-from typing import ClassVar, List, Optional
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
-from pandas import DataFrame as df
-from pydantic import BaseModel
+import numpy as np
+from pydantic import BaseModel, PrivateAttr, model_serializer
 
+import pareto
+from helpers import EncodedLabels, encode_labels, to_epoch_microseconds
 from storable import Storable
 
+if TYPE_CHECKING:
+    # pandas is slow to import, it is only imported by the methods that build or read frames
+    from pandas import DataFrame as df
+    from pandas import Series
+
 ParameterData = namedtuple("ParameterData", ["name", "value", "score"])
+DataframeCacheInfo = namedtuple("DataframeCacheInfo", ["hits", "misses", "cached"])
+# Rows appended to a ColumnarDataset: parameter names, then arrays ordered like the names
+_ColumnChunk = namedtuple("_ColumnChunk", ["names", "row_names", "values", "scores", "total_scores"])
+
+# Version of the binary columnar format written by ColumnarDataset.store_columns
+COLUMNS_FORMAT_VERSION = 2
+# Versions which ColumnarDataset.load_columns can read, 1 has no dictionary encoded columns
+READABLE_COLUMNS_FORMAT_VERSIONS = (1, 2)
 
 
 class DataPoint(BaseModel):
@@ -18,17 +40,242 @@ class DataPoint(BaseModel):
 class Dataset(Storable):
     description: Optional[str] = None
     data_points: Optional[List[DataPoint]] = None
+    # Score fingerprint of each parameter whose stored scores are up to date
+    score_fingerprints: Optional[Dict[str, str]] = None
+    # Content hash of each value column when it was last scored, see helpers.column_hash
+    value_hashes: Optional[Dict[str, str]] = None
     storage_folder: ClassVar[str] = "data/dataset/"
+    # Parameter names and (data points, parameters) matrix of the stored scores
+    _score_matrix: Optional[Tuple[List[str], np.ndarray]] = PrivateAttr(default=None)
+    # Cached frames by layout, see dataframe()
+    _dataframes: Dict[bool, Any] = PrivateAttr(default_factory=dict)
+    _dataframe_hits: int = PrivateAttr(default=0)
+    _dataframe_misses: int = PrivateAttr(default=0)
+    # Sorted values and ranks of the relative columns by parameter name, see scoring.add_data_points
+    _order_statistics: Dict[str, Any] = PrivateAttr(default_factory=dict)
 
     def add_data_point(self, data_point: DataPoint) -> None:
         if self.data_points is None:
             self.data_points = []
         self.data_points.append(data_point)
+        self._invalidate_scores()
 
     def delete_data_point(self, data_point_name: str) -> None:
         self.data_points = [dp for dp in self.data_points if dp.name != data_point_name]
+        self._invalidate_scores()
+
+    def _invalidate_scores(self) -> None:
+        self.score_fingerprints = None
+        self.value_hashes = None
+        self._score_matrix = None
+        self._order_statistics = {}
+        self._invalidate_dataframe()
+
+    def _invalidate_dataframe(self) -> None:
+        self._dataframes = {}
+
+    def __getstate__(self) -> Dict[Any, Any]:
+        # The caches are not stored with the dataset
+        state = super().__getstate__()
+        state['__pydantic_private__'] = {
+            **state['__pydantic_private__'], '_score_matrix': None, '_dataframes': {}, '_order_statistics': {}
+        }
+        return state
+
+    @classmethod
+    def load(cls, name: str) -> "Dataset":
+        """Loads a dataset from its binary columns if they were stored, see
+        ColumnarDataset.store_columns, or else from its json file.
+        """
+        if cls.stored_columns_path(name) is not None:
+            return ColumnarDataset.load_columns(name)
+        return cls(**cls.load_json(name))
+
+    @classmethod
+    def columns_path(cls, name: str) -> str:
+        return f"{cls.storage_folder}/{name}.columns"
+
+    @classmethod
+    def stored_columns_path(cls, name: str) -> Optional[str]:
+        """Returns the directory of the stored columns of a dataset, or the previous directory if
+        store_columns was interrupted while swapping them, None if the columns were never stored.
+        """
+        for folder in (cls.columns_path(name), cls.columns_path(name) + ".old"):
+            if os.path.isdir(folder):
+                return folder
+        return None
+
+    def store(self) -> None:
+        """Stores the dataset in its json file, or in its binary columns if they were stored,
+        since Dataset.load reads those first.
+        """
+        if self.stored_columns_path(self.name) is not None:
+            ColumnarDataset.from_dataset(self).store_columns()
+        else:
+            self.store_json()
+
+    def parameter_names(self) -> List[str]:
+        if not self.data_points:
+            return []
+        return [p.name for p in self.data_points[0].parameter_datas]
+
+    def columns(self, encoded: bool = False) -> Tuple[List[str], List[List[Any]]]:
+        """Returns the parameter names, in the order of the first data point,
+        and one list of values per parameter. If encoded, the columns which the dataset keeps
+        dictionary encoded are returned as helpers.EncodedLabels.
+        """
+        names, value_columns, _ = _transpose(self.name, self.data_points)
+        return names, value_columns
+
+    def score_columns(self) -> Tuple[List[str], List[np.ndarray]]:
+        """Returns the parameter names and one array of stored scores per parameter."""
+        names, _, score_columns = _transpose(self.name, self.data_points, with_scores=True)
+        return names, [_as_scores(scores) for scores in score_columns]
+
+    def score_matrix(self, names: List[str]) -> np.ndarray:
+        """Returns the stored scores as a (data points, parameters) matrix whose columns are
+        ordered as names. The matrix is cached until the dataset is modified.
+        """
+        if self._score_matrix is None:
+            score_names, score_columns = self.score_columns()
+            matrix = np.column_stack(score_columns) if score_columns else np.empty((0, 0))
+            self._score_matrix = (score_names, matrix)
+        score_names, matrix = self._score_matrix
+        if score_names != names:
+            matrix = matrix[:, [score_names.index(name) for name in names]]
+        return matrix
+
+    def data_point_names(self) -> List[Optional[str]]:
+        return [dp.name for dp in self.data_points] if self.data_points else []
+
+    def iter_data_points(self) -> Iterator[DataPoint]:
+        return iter(self.data_points or [])
+
+    def data_points_at(self, indices: Sequence[int]) -> List[DataPoint]:
+        return [self.data_points[i] for i in indices]
+
+    def column(self, name: str, kind: str = "score") -> np.ndarray:
+        """Returns the values (kind "value") or the scores (kind "score") of a parameter,
+        or the total scores if name is "total_score". Missing scores are NaN.
+        """
+        if name == "total_score":
+            return _as_scores([dp.total_score for dp in self.iter_data_points()])
+        if kind == "score":
+            return self.score_matrix([name])[:, 0]
+        if kind == "value":
+            names, value_columns = self.columns()
+            return _as_column(value_columns[names.index(name)])
+        raise ValueError(f"Unknown column kind {kind}, expected 'value' or 'score'")
+
+    def encoded_column(self, name: str, values: Optional[Sequence[Any]] = None) -> EncodedLabels:
+        """Returns the values of a parameter dictionary encoded, see helpers.encode_labels.
+        values is the value column of the parameter, if the caller already has it.
+        """
+        if isinstance(values, EncodedLabels):
+            return values
+        return encode_labels(self.column(name, "value") if values is None else values)
+
+    def top_k(
+        self, k: int, by: str = "total_score", kind: str = "score", ascending: bool = False
+    ) -> List[DataPoint]:
+        """Returns the k best data points by total score, or by the value or score of a parameter,
+        without sorting the whole dataset.
+        """
+        return self.page(0, k, by, kind, ascending)
+
+    def page(
+        self, offset: int, limit: int, by: str = "total_score", kind: str = "score", ascending: bool = False
+    ) -> List[DataPoint]:
+        """Returns the data points ranked offset to offset + limit by total score, or by the value
+        or score of a parameter. Only the first offset + limit data points are sorted.
+        Ties keep the order of the data points in the dataset, missing scores come last.
+        """
+        keys = self.column(by, kind)
+        indices = _ranking_indices(keys, offset + limit, ascending)[offset:]
+        return self.data_points_at(indices)
+
+    def pareto_frontier(self, parameter_names: Optional[List[str]] = None) -> List[DataPoint]:
+        """Returns the data points which are not dominated by another data point on the scores of the
+        parameters, all of them by default, in the order of the dataset. See pareto.pareto_layers.
+        """
+        return self.pareto_layers(parameter_names, 1)[0]
+
+    def pareto_layers(self, parameter_names: Optional[List[str]] = None, layers: int = 1) -> List[List[DataPoint]]:
+        """Returns the first Pareto layers of the data points on the scores of the parameters: the
+        frontier, then the frontier of the other data points and so on.
+        """
+        names = self.parameter_names()
+        parameter_names = names if parameter_names is None else parameter_names
+        for name in parameter_names:
+            if name not in names:
+                raise ValueError(f"Parameter {name} not found in dataset {self.name}")
+        point_layers = pareto.pareto_layers(self.score_matrix(list(parameter_names)), layers)
+        return [self.data_points_at(np.flatnonzero(point_layers == layer)) for layer in range(layers)]
+
+    def set_scores(self, names: List[str], scores: np.ndarray, total_scores: np.ndarray) -> None:
+        """Writes a (data points, parameters) score matrix, whose columns are ordered as names,
+        and the total scores back to the data points.
+        """
+        index = {name: j for j, name in enumerate(names)}
+        for dp, row, total_score in zip(self.data_points, scores.tolist(), total_scores.tolist()):
+            dp.parameter_datas = [
+                ParameterData(p.name, p.value, row[index[p.name]]) for p in dp.parameter_datas
+            ]
+            dp.total_score = total_score
+        self._score_matrix = (list(names), scores)
+        self._invalidate_dataframe()
+
+    def set_total_scores(self, total_scores: np.ndarray) -> None:
+        for dp, total_score in zip(self.data_points, total_scores.tolist()):
+            dp.total_score = total_score
+        self._invalidate_dataframe()
+
+    def dataframe(self, multiindex: bool = False) -> "df":
+        """Returns a copy of the dataset as a DataFrame. The frame is built once and cached until the
+        dataset is modified by its methods (adding or deleting data points, scoring).
+        By default each cell holds a (value, score) tuple. With multiindex, the columns are indexed
+        by (parameter, "value") and (parameter, "score"), plus ("total_score", "score"), and have
+        numeric or datetime dtypes.
+        """
+        return self._cached_dataframe(multiindex).copy()
+
+    def dataframe_cache_info(self) -> DataframeCacheInfo:
+        return DataframeCacheInfo(self._dataframe_hits, self._dataframe_misses, bool(self._dataframes))
+
+    def _cached_dataframe(self, multiindex: bool = False) -> "df":
+        if multiindex not in self._dataframes:
+            self._dataframe_misses += 1
+            if multiindex:
+                self._dataframes[multiindex] = self._build_multiindex_dataframe()
+            else:
+                self._dataframes[multiindex] = self._build_dataframe()
+        else:
+            self._dataframe_hits += 1
+        return self._dataframes[multiindex]
+
+    def _build_multiindex_dataframe(self) -> "df":
+        from pandas import DataFrame as df
+
+        names, value_columns = self.columns()
+        if not names:
+            return df({})
+        _, score_columns = self.score_columns()
+        data = {}
+        date_columns = []
+        for name, values, scores in zip(names, value_columns, score_columns):
+            data[(name, "value")] = _typed_values(values)
+            data[(name, "score")] = scores
+            if _is_date_column(values):
+                date_columns.append(name)
+        data[("total_score", "score")] = self.column("total_score")
+        frame = df(data, index=self.data_point_names())
+        # Dates and datetimes are both datetime64 columns, the dates are restored by from_dataframe
+        frame.attrs["date_columns"] = date_columns
+        return frame
+
+    def _build_dataframe(self) -> "df":
+        from pandas import DataFrame as df
 
-    def dataframe(self) -> df:
         if self.data_points is not None:
             names = [dp.name for dp in self.data_points]
             param_names = [p.name for p in self.data_points[0].parameter_datas]
@@ -39,7 +286,12 @@ class Dataset(Storable):
             return df(data, columns=param_names, index=names)
         return df({})
 
-    def from_dataframe(self, dataframe: df) -> None:
+    def from_dataframe(self, dataframe: "df") -> None:
+        from pandas import MultiIndex
+
+        if isinstance(dataframe.columns, MultiIndex):
+            self._from_multiindex_dataframe(dataframe)
+            return
         dict_of_dicts = dataframe.to_dict(orient='index')
         for name in dict_of_dicts.keys():
             data = dict_of_dicts[name]
@@ -52,15 +304,649 @@ class Dataset(Storable):
                 DataPoint(name=name, parameter_datas=parameter_dats, total_score=total_score)
             )
 
-    def order_by_parameter_value(self, parameter_name: str, ascending: bool = True) -> df:
-        dataframe = self.dataframe()
-        dataframe.sort_values(by=[parameter_name][0], inplace=True, ascending=ascending)
-        return dataframe
+    def _from_multiindex_dataframe(self, dataframe: "df") -> None:
+        names = [n for n in dataframe.columns.get_level_values(0).unique() if n != "total_score"]
+        date_columns = dataframe.attrs.get("date_columns", [])
+        value_columns = [_python_values(dataframe[(name, "value")], name in date_columns) for name in names]
+        score_columns = [_none_for_nan(dataframe[(name, "score")].to_numpy(dtype=float)) for name in names]
+        total_scores = _none_for_nan(dataframe[("total_score", "score")].to_numpy(dtype=float))
+        for i, row_name in enumerate(dataframe.index.tolist()):
+            self.add_data_point(
+                DataPoint(
+                    name=row_name,
+                    parameter_datas=[
+                        ParameterData(name=n, value=v[i], score=s[i])
+                        for n, v, s in zip(names, value_columns, score_columns)
+                    ],
+                    total_score=total_scores[i],
+                )
+            )
+
+    def order_by_parameter_value(
+        self, parameter_name: str, ascending: bool = True, multiindex: bool = False
+    ) -> "df":
+        return self._order_by(parameter_name, "value", ascending, multiindex)
+
+    def order_by_parameter_score(
+        self, parameter_name: str, ascending: bool = True, multiindex: bool = False
+    ) -> "df":
+        return self._order_by(parameter_name, "score", ascending, multiindex)
+
+    def _order_by(self, parameter_name: str, kind: str, ascending: bool, multiindex: bool) -> "df":
+        # The order is computed on the numeric layout, with a native pandas sort
+        numeric = self._cached_dataframe(multiindex=True)
+        if numeric.empty:
+            return self.dataframe(multiindex)
+        if parameter_name == "total_score":
+            keys = [("total_score", "score")]
+        elif kind == "value":
+            # Equal values are ordered by their scores
+            keys = [(parameter_name, "value"), (parameter_name, "score")]
+        else:
+            keys = [(parameter_name, "score")]
+        order = numeric[keys].reset_index(drop=True).sort_values(by=keys, ascending=ascending, kind="stable").index
+        return self._cached_dataframe(multiindex).iloc[order.to_numpy()]
+
+
+class ColumnarDataset(Dataset):
+    """
+    A dataset stored column by column: a parameter name index, one typed array of values and one
+    array of scores per parameter, and an array of total scores. Missing scores are stored as NaN.
+    data_points is always None; data points are only materialized when they are asked for, by
+    iter_data_points or to_dataset. The json representation is the same as the one of Dataset.
+    """
+    _parameter_names: List[str] = PrivateAttr(default_factory=list)
+    _row_names: np.ndarray = PrivateAttr(default_factory=lambda: np.empty(0, dtype=object))
+    # Label columns read from storage stay dictionary encoded and are only decoded when their
+    # values are asked for, see column
+    _values: List[Union[np.ndarray, EncodedLabels]] = PrivateAttr(default_factory=list)
+    _scores: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _total_scores: np.ndarray = PrivateAttr(default_factory=lambda: np.empty(0))
+    # Data points added since the columns were last built
+    _pending: List[DataPoint] = PrivateAttr(default_factory=list)
+    # Rows appended by chunks since the columns were last built, see append_columns
+    _pending_chunks: List[_ColumnChunk] = PrivateAttr(default_factory=list)
+    # Dictionary encoded value columns by parameter name, see encoded_column
+    _encoded: Dict[str, EncodedLabels] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.data_points:
+            self._pending = list(self.data_points)
+        self.data_points = None
+
+    @model_serializer(mode="wrap")
+    def ser_model(self, handler) -> Dict[str, Any]:
+        d = handler(self)
+        if "data_points" in d:
+            d["data_points"] = [dp.model_dump() for dp in self.iter_data_points()] or None
+        return d
+
+    @classmethod
+    def from_dataset(cls, dataset: Dataset) -> "ColumnarDataset":
+        return cls(**dict(dataset))
+
+    @classmethod
+    def from_columns(
+        cls,
+        name: str,
+        columns: Dict[str, Sequence[Any]],
+        row_names: Optional[Sequence[Optional[str]]] = None,
+        description: Optional[str] = None,
+    ) -> "ColumnarDataset":
+        """Builds an unscored dataset from one sequence of values per parameter, without creating
+        data points. numpy arrays are used as they are.
+        """
+        n = len(next(iter(columns.values()))) if columns else 0
+        if any(len(values) != n for values in columns.values()):
+            raise ValueError(f"The columns of dataset {name} do not have the same length")
+        dataset = cls(name=name, description=description)
+        dataset._parameter_names = list(columns)
+        dataset._row_names = np.empty(n, dtype=object)
+        if row_names is not None:
+            dataset._row_names[:] = row_names
+        dataset._values = [
+            values if isinstance(values, np.ndarray) else _as_column(list(values)) for values in columns.values()
+        ]
+        dataset._scores = [np.full(n, np.nan) for _ in columns]
+        dataset._total_scores = np.full(n, np.nan)
+        return dataset
+
+    def to_dataset(self) -> Dataset:
+        return Dataset(**{**dict(self), "data_points": list(self.iter_data_points()) or None})
+
+    def _flush(self) -> None:
+        """Appends the pending data points and chunks to the columns, each column being
+        concatenated once with all of them.
+        """
+        self._chunk_pending_data_points()
+        if not self._pending_chunks:
+            return
+        chunks, self._pending_chunks = self._pending_chunks, []
+        is_new = not self._parameter_names
+        if is_new:
+            self._parameter_names = list(chunks[0].names)
+        if any(set(chunk.names) != set(self._parameter_names) for chunk in chunks):
+            raise ValueError(
+                f"Data points added to dataset {self.name} do not have the same parameters "
+                f"as the other data points"
+            )
+        old = 0 if is_new else 1
+        self._row_names = _concatenate([self._row_names][:old] + [chunk.row_names for chunk in chunks])
+        values, scores = [], []
+        for j, name in enumerate(self._parameter_names):
+            columns = [chunk.names.index(name) for chunk in chunks]
+            values.append(_concatenate(
+                [_as_values(self._values[j]) for _ in range(old)] + [c.values[k] for c, k in zip(chunks, columns)]
+            ))
+            scores.append(_concatenate(
+                [self._scores[j] for _ in range(old)] + [c.scores[k] for c, k in zip(chunks, columns)]
+            ))
+        self._values, self._scores = values, scores
+        self._total_scores = _concatenate([self._total_scores][:old] + [chunk.total_scores for chunk in chunks])
+
+    def _chunk_pending_data_points(self) -> None:
+        if not self._pending:
+            return
+        names, value_columns, score_columns = _transpose(self.name, self._pending, with_scores=True)
+        self._pending_chunks.append(_ColumnChunk(
+            names,
+            np.array([dp.name for dp in self._pending], dtype=object),
+            [_as_column(values) for values in value_columns],
+            [_as_scores(scores) for scores in score_columns],
+            _as_scores([dp.total_score for dp in self._pending]),
+        ))
+        self._pending = []
+
+    def append_columns(self, row_names: Sequence[Optional[str]], columns: Dict[str, Sequence[Any]]) -> None:
+        """Appends unscored rows given as one sequence of values per parameter, without creating
+        data points. The rows are buffered and concatenated to the columns when they are next used,
+        so appending many chunks copies each column once.
+        """
+        if any(len(values) != len(row_names) for values in columns.values()):
+            raise ValueError(f"The columns added to dataset {self.name} do not have the same length")
+        if not row_names:
+            return
+        # Data points added before are kept before the new rows
+        self._chunk_pending_data_points()
+        n = len(row_names)
+        row_name_array = np.empty(n, dtype=object)
+        row_name_array[:] = row_names
+        self._pending_chunks.append(_ColumnChunk(
+            list(columns),
+            row_name_array,
+            [_as_column(list(values)) for values in columns.values()],
+            [np.full(n, np.nan) for _ in columns],
+            np.full(n, np.nan),
+        ))
+        self._invalidate_scores()
+
+    def add_data_point(self, data_point: DataPoint) -> None:
+        # Appending to arrays one by one would copy them every time, so data points are buffered
+        self._pending.append(data_point)
+        self._invalidate_scores()
+
+    def _invalidate_scores(self) -> None:
+        super()._invalidate_scores()
+        self._encoded = {}
+
+    def delete_data_point(self, data_point_name: str) -> None:
+        self._flush()
+        keep = self._row_names != data_point_name
+        self._row_names = self._row_names[keep]
+        self._values = [_take_rows(values, keep) for values in self._values]
+        self._scores = [scores[keep] for scores in self._scores]
+        self._total_scores = self._total_scores[keep]
+        self._invalidate_scores()
+
+    def parameter_names(self) -> List[str]:
+        if not self._parameter_names and self._pending_chunks:
+            return list(self._pending_chunks[0].names)
+        if not self._parameter_names and self._pending:
+            return [p.name for p in self._pending[0].parameter_datas]
+        return list(self._parameter_names)
+
+    def columns(self, encoded: bool = False) -> Tuple[List[str], List[np.ndarray]]:
+        self._flush()
+        if not len(self._row_names):
+            return [], []
+        if encoded:
+            return list(self._parameter_names), list(self._values)
+        return list(self._parameter_names), [_as_values(values) for values in self._values]
+
+    def score_columns(self) -> Tuple[List[str], List[np.ndarray]]:
+        self._flush()
+        return list(self._parameter_names), list(self._scores)
+
+    def set_scores(self, names: List[str], scores: np.ndarray, total_scores: np.ndarray) -> None:
+        self._flush()
+        index = {name: j for j, name in enumerate(names)}
+        self._scores = [scores[:, index[name]].astype(float) for name in self._parameter_names]
+        self._total_scores = np.array(total_scores, dtype=float)
+        self._score_matrix = (list(names), scores)
+        self._invalidate_dataframe()
+
+    def set_total_scores(self, total_scores: np.ndarray) -> None:
+        self._flush()
+        self._total_scores = np.array(total_scores, dtype=float)
+        self._invalidate_dataframe()
+
+    def data_point_names(self) -> List[Optional[str]]:
+        self._flush()
+        return self._row_names.tolist()
+
+    def iter_data_points(self) -> Iterator[DataPoint]:
+        self._flush()
+        names = self._parameter_names
+        values = [_as_values(column).tolist() for column in self._values]
+        scores = [_none_for_nan(column) for column in self._scores]
+        total_scores = _none_for_nan(self._total_scores)
+        for i, row_name in enumerate(self._row_names.tolist()):
+            yield DataPoint(
+                name=row_name,
+                parameter_datas=[ParameterData(n, v[i], s[i]) for n, v, s in zip(names, values, scores)],
+                total_score=total_scores[i],
+            )
+
+    def data_points_at(self, indices: Sequence[int]) -> List[DataPoint]:
+        self._flush()
+        indices = np.asarray(indices, dtype=np.intp)
+        names = self._parameter_names
+        values = [_as_values(_take_rows(column, indices)).tolist() for column in self._values]
+        scores = [_none_for_nan(column[indices]) for column in self._scores]
+        total_scores = _none_for_nan(self._total_scores[indices])
+        return [
+            DataPoint(
+                name=row_name,
+                parameter_datas=[ParameterData(n, v[i], s[i]) for n, v, s in zip(names, values, scores)],
+                total_score=total_scores[i],
+            )
+            for i, row_name in enumerate(self._row_names[indices].tolist())
+        ]
+
+    def column(self, name: str, kind: str = "score") -> np.ndarray:
+        self._flush()
+        if name == "total_score":
+            return self._total_scores
+        if kind not in ("value", "score"):
+            raise ValueError(f"Unknown column kind {kind}, expected 'value' or 'score'")
+        j = self._parameter_names.index(name)
+        return _as_values(self._values[j]) if kind == "value" else self._scores[j]
+
+    def encoded_column(self, name: str, values: Optional[Sequence[Any]] = None) -> EncodedLabels:
+        # Encoded once until the dataset is modified, or read from the stored columns
+        self._flush()
+        values = self._values[self._parameter_names.index(name)]
+        if isinstance(values, EncodedLabels):
+            return values
+        if name not in self._encoded:
+            self._encoded[name] = encode_labels(values)
+        return self._encoded[name]
+
+    def store(self) -> None:
+        if self.stored_columns_path(self.name) is not None:
+            self.store_columns()
+        else:
+            self.store_json()
+
+    def store_columns(self) -> None:
+        """Stores the dataset as a directory of .npy files, one per column, and a json header.
+        Numbers, booleans and strings are stored as raw arrays, strings with many repeated values,
+        e.g. labels, as integer codes and categories, dates and datetimes as datetime64, other
+        values are pickled. The directory replaces the previous one as a whole, so that arrays
+        memory mapped from it stay valid. The json file of the dataset, if any, is removed as it
+        would be out of date.
+        """
+        self._flush()
+        folder = self.columns_path(self.name)
+        pathlib.Path(folder).parent.mkdir(parents=True, exist_ok=True)
+        new_folder = tempfile.mkdtemp(prefix=f".{self.name}.", dir=os.path.dirname(folder))
+        header = {
+            "version": COLUMNS_FORMAT_VERSION,
+            "name": self.name,
+            "description": self.description,
+            "score_fingerprints": self.score_fingerprints,
+            "value_hashes": self.value_hashes,
+            "rows": len(self._row_names),
+            "row_names": _store_array(new_folder, "row_names", self._row_names),
+            "parameters": [
+                {"name": name, "values": _store_array(new_folder, f"values_{j}", values)}
+                for j, (name, values) in enumerate(zip(self._parameter_names, self._values))
+            ],
+        }
+        for j, scores in enumerate(self._scores):
+            np.save(os.path.join(new_folder, f"scores_{j}.npy"), scores)
+        np.save(os.path.join(new_folder, "total_scores.npy"), self._total_scores)
+        with open(os.path.join(new_folder, "header.json"), "w") as f:
+            json.dump(header, f, indent=4)
+
+        # The previous directory is moved aside before the new one is moved in and only deleted
+        # then. If the swap is interrupted, load reads the directory moved aside, see
+        # stored_columns_path.
+        old_folder = folder + ".old"
+        if os.path.isdir(folder):
+            if os.path.isdir(old_folder):
+                shutil.rmtree(old_folder)
+            os.rename(folder, old_folder)
+        os.rename(new_folder, folder)
+        if os.path.isdir(old_folder):
+            shutil.rmtree(old_folder)
+        if os.path.isfile(self.get_path() + ".json"):
+            self.delete_json(self.name)
+
+    @classmethod
+    def load_columns(cls, name: str, mmap_mode: Optional[str] = "r") -> "ColumnarDataset":
+        """Loads a dataset stored by store_columns. With the default mmap_mode the numeric and string
+        columns are memory mapped, read only, and their pages are only read from disk when a column
+        is used. Dates, datetimes and pickled columns are always read in full.
+        """
+        folder = cls.stored_columns_path(name) or cls.columns_path(name)
+        with open(os.path.join(folder, "header.json")) as f:
+            header = json.load(f)
+        if header["version"] not in READABLE_COLUMNS_FORMAT_VERSIONS:
+            raise ValueError(
+                f"Dataset {name} has columns format version {header['version']}, "
+                f"expected one of {READABLE_COLUMNS_FORMAT_VERSIONS}"
+            )
+        dataset = cls(
+            name=header["name"],
+            description=header["description"],
+            score_fingerprints=header["score_fingerprints"],
+            value_hashes=header.get("value_hashes"),
+        )
+        parameters = header["parameters"]
+        dataset._parameter_names = [p["name"] for p in parameters]
+        dataset._row_names = _load_array(folder, "row_names", header["row_names"], mmap_mode)
+        for j, p in enumerate(parameters):
+            if p["values"] == "labels":
+                # Only the codes and categories are kept, the codes are scored as they are
+                dataset._values.append(_load_labels(folder, f"values_{j}", mmap_mode))
+            else:
+                dataset._values.append(_load_array(folder, f"values_{j}", p["values"], mmap_mode))
+        dataset._scores = [
+            np.load(os.path.join(folder, f"scores_{j}.npy"), mmap_mode=mmap_mode) for j in range(len(parameters))
+        ]
+        dataset._total_scores = np.load(os.path.join(folder, "total_scores.npy"), mmap_mode=mmap_mode)
+        return dataset
+
+    def _build_dataframe(self) -> "df":
+        from pandas import DataFrame as df
+
+        self._flush()
+        if not len(self._row_names):
+            return df({})
+        data = {
+            name: list(zip(values.tolist(), _none_for_nan(scores)))
+            for name, values, scores in zip(self._parameter_names, self.columns()[1], self._scores)
+        }
+        data["total_score"] = _none_for_nan(self._total_scores)
+        return df(data, index=self._row_names.tolist())
+
+
+class DatasetCatalogEntry(BaseModel):
+    """Metadata of a dataset, kept in the catalog of the models it belongs to."""
+    name: str
+    dataset_type: str = "Dataset"
+    description: Optional[str] = None
+    rows: Optional[int] = None
+    parameter_names: Optional[List[str]] = None
+    # Score fingerprints of the last evaluation, see Dataset.score_fingerprints
+    score_fingerprints: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def of(cls, dataset: Dataset) -> "DatasetCatalogEntry":
+        return cls(
+            name=dataset.name,
+            dataset_type=type(dataset).__name__,
+            description=dataset.description,
+            rows=len(dataset.data_point_names()),
+            parameter_names=dataset.parameter_names(),
+            score_fingerprints=dataset.score_fingerprints,
+        )
+
+
+class DatasetHandle(BaseModel):
+    """
+    A dataset that is only loaded from storage when it is first used. The attributes and methods
+    of the loaded dataset are available on the handle, entry holds the catalog metadata of the
+    dataset, which is available without loading it. Only the entry is pickled.
+    """
+    entry: DatasetCatalogEntry
+    _dataset: Optional[Dataset] = PrivateAttr(default=None)
+
+    @classmethod
+    def of(cls, dataset: Any) -> "DatasetHandle":
+        """Returns an unloaded handle of a dataset or of the dataset of a handle."""
+        if isinstance(dataset, DatasetHandle):
+            return cls(entry=dataset.entry)
+        return cls(entry=DatasetCatalogEntry(name=dataset.name, dataset_type=type(dataset).__name__))
+
+    @property
+    def name(self) -> str:
+        return self.entry.name
+
+    def is_loaded(self) -> bool:
+        return self._dataset is not None
+
+    def get(self) -> Dataset:
+        if self._dataset is None:
+            dataset_type = ColumnarDataset if self.entry.dataset_type == ColumnarDataset.__name__ else Dataset
+            self._dataset = dataset_type.load(self.entry.name)
+        return self._dataset
+
+    def set(self, dataset: Dataset) -> None:
+        self._dataset = dataset
+
+    def catalog_entry(self) -> DatasetCatalogEntry:
+        return DatasetCatalogEntry.of(self._dataset) if self._dataset is not None else self.entry
+
+    def __getattr__(self, item: str) -> Any:
+        # Only called for the attributes which are not found on the handle
+        if item.startswith("__") or item in type(self).__private_attributes__:
+            return super().__getattr__(item)
+        return getattr(self.get(), item)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "name":
+            # The handle loads the dataset by the name of its catalog entry
+            raise AttributeError("The name of a dataset cannot be changed through its handle")
+        if name in type(self).model_fields or name in type(self).__private_attributes__:
+            super().__setattr__(name, value)
+        else:
+            setattr(self.get(), name, value)
+
+    def __getstate__(self) -> Dict[Any, Any]:
+        state = super().__getstate__()
+        state['__pydantic_private__'] = {**state['__pydantic_private__'], '_dataset': None}
+        return state
+
+    def __repr__(self) -> str:
+        return (
+            f"DatasetHandle(name={self.entry.name!r}, rows={self.entry.rows}, "
+            f"description={self.entry.description!r}, loaded={self.is_loaded()})"
+        )
+
+
+def loaded_dataset(dataset: Any) -> Dataset:
+    """Returns the dataset of a handle, loading it if needed, or the dataset itself."""
+    return dataset.get() if isinstance(dataset, DatasetHandle) else dataset
+
+
+def _transpose(
+    dataset_name: str, data_points: Optional[List[DataPoint]], with_scores: bool = False
+) -> Tuple[List[str], List[List[Any]], Optional[List[List[Any]]]]:
+    """Splits data points into the parameter names, in the order of the first data point,
+    one list of values per parameter and, if asked for, one list of scores per parameter.
+    """
+    if not data_points:
+        return [], [], [] if with_scores else None
+    names = [p.name for p in data_points[0].parameter_datas]
+    index = {name: j for j, name in enumerate(names)}
+    value_columns = [[] for _ in names]
+    score_columns = [[] for _ in names] if with_scores else None
+    for dp in data_points:
+        parameter_datas = dp.parameter_datas
+        if [p.name for p in parameter_datas] != names:
+            if len(parameter_datas) != len(names) or {p.name for p in parameter_datas} != index.keys():
+                raise ValueError(
+                    f"Data point {dp.name} of dataset {dataset_name} does not have "
+                    f"the same parameters as the other data points"
+                )
+            parameter_datas = sorted(parameter_datas, key=lambda p: index[p.name])
+        for column, p in zip(value_columns, parameter_datas):
+            column.append(p.value)
+        if with_scores:
+            for column, p in zip(score_columns, parameter_datas):
+                column.append(p.score)
+    return names, value_columns, score_columns
+
+
+def _ranking_indices(keys: np.ndarray, stop: int, ascending: bool) -> np.ndarray:
+    """Returns the indices of the first stop keys in sorted order, using a partial selection.
+    Ties keep the order of the keys, NaN keys come last.
+    """
+    n = len(keys)
+    stop = max(0, min(stop, n))
+    if keys.dtype.kind not in "biuf":
+        # Values without a numeric representation (strings, dates), a heap is used instead
+        key = keys.__getitem__
+        if ascending:
+            return np.array(heapq.nsmallest(stop, range(n), key=key), dtype=np.intp)
+        return np.array(heapq.nlargest(stop, range(n), key=key), dtype=np.intp)
+
+    if keys.dtype.kind == "f":
+        keys = keys if ascending else -keys
+        keys = np.where(np.isnan(keys), np.inf, keys)
+    else:
+        keys = keys.astype(np.int64)
+        keys = keys if ascending else -keys
+    if stop == 0:
+        return np.empty(0, dtype=np.intp)
+    if stop < n:
+        # All keys strictly below the stop-th smallest key, and the first keys equal to it
+        threshold = np.partition(keys, stop - 1)[stop - 1]
+        below = np.flatnonzero(keys < threshold)
+        equal = np.flatnonzero(keys == threshold)[:stop - len(below)]
+        candidates = np.concatenate([below, equal])
+    else:
+        candidates = np.arange(n)
+    return candidates[np.lexsort((candidates, keys[candidates]))]
+
+
+def _as_column(values: List[Any]) -> np.ndarray:
+    """Stores values in a typed array: bool, int or float for numbers, object for everything else."""
+    if all(type(v) is bool for v in values):
+        return np.array(values, dtype=bool)
+    if all(type(v) in (int, float) for v in values):
+        try:
+            return np.array(values)
+        except OverflowError:
+            pass
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _typed_values(values: Sequence[Any]) -> np.ndarray:
+    """Stores values in a typed array, with dates and datetimes as datetime64."""
+    column = values if isinstance(values, np.ndarray) else _as_column(values)
+    if column.dtype == object and len(column) and all(isinstance(v, date) for v in column):
+        return to_epoch_microseconds(column).view("datetime64[us]")
+    return column
+
+
+def _is_date_column(values: Sequence[Any]) -> bool:
+    """Whether all values are dates, and not datetimes."""
+    return len(values) > 0 and all(isinstance(v, date) and not isinstance(v, datetime) for v in values)
+
+
+def _python_values(series: "Series", is_date: bool = False) -> List[Any]:
+    """Converts a column of a DataFrame back to python values, datetime64 values to dates if
+    is_date, else to datetimes.
+    """
+    if series.dtype.kind == "M":
+        return series.to_numpy().astype("datetime64[D]" if is_date else "datetime64[us]").astype(object).tolist()
+    return series.tolist()
+
+
+def _store_array(folder: str, file_name: str, values: np.ndarray) -> str:
+    """Saves a column as folder/file_name.npy and returns how it was encoded."""
+    if isinstance(values, EncodedLabels):
+        _store_labels(folder, file_name, values)
+        return "labels"
+    kind = "array"
+    if values.dtype == object or values.dtype.kind == "U":
+        items = values.tolist()
+        if all(type(v) is str for v in items):
+            encoded = encode_labels(items)
+            if len(encoded.categories) <= len(items) // 2:
+                _store_labels(folder, file_name, encoded)
+                return "labels"
+            kind, values = "str", np.array(items, dtype=str)
+        elif items and all(type(v) is date for v in items):
+            kind, values = "date", to_epoch_microseconds(items).view("datetime64[us]")
+        elif items and all(type(v) is datetime and v.tzinfo is None for v in items):
+            kind, values = "datetime", to_epoch_microseconds(items).view("datetime64[us]")
+        else:
+            kind = "object"
+    np.save(os.path.join(folder, file_name + ".npy"), values, allow_pickle=kind == "object")
+    return kind
+
+
+def _load_array(folder: str, file_name: str, kind: str, mmap_mode: Optional[str]) -> np.ndarray:
+    path = os.path.join(folder, file_name + ".npy")
+    if kind == "object":
+        return np.load(path, allow_pickle=True)
+    if kind == "labels":
+        return _decode_labels(_load_labels(folder, file_name, mmap_mode))
+    values = np.load(path, mmap_mode=mmap_mode)
+    if kind == "date":
+        return values.astype("datetime64[D]").astype(object)
+    if kind == "datetime":
+        return values.astype(object)
+    return values
+
+
+def _store_labels(folder: str, file_name: str, encoded: EncodedLabels) -> None:
+    np.save(os.path.join(folder, file_name + ".categories.npy"), np.array(encoded.categories, dtype=str))
+    np.save(os.path.join(folder, file_name + ".npy"), encoded.codes)
+
+
+def _load_labels(folder: str, file_name: str, mmap_mode: Optional[str]) -> EncodedLabels:
+    codes = np.load(os.path.join(folder, file_name + ".npy"), mmap_mode=mmap_mode)
+    categories = np.load(os.path.join(folder, file_name + ".categories.npy")).tolist()
+    return EncodedLabels(codes, categories)
+
+
+def _decode_labels(encoded: EncodedLabels) -> np.ndarray:
+    return np.array(encoded.categories, dtype=str)[encoded.codes]
+
+
+def _concatenate(columns: List[np.ndarray]) -> np.ndarray:
+    """Concatenates parts of a column, keeping mixed types as python objects."""
+    if len(columns) == 1:
+        return columns[0]
+    if any(column.dtype != columns[0].dtype for column in columns):
+        return _as_column([v for column in columns for v in column.tolist()])
+    return np.concatenate(columns)
+
+
+def _take_rows(values: Union[np.ndarray, EncodedLabels], rows: np.ndarray) -> Union[np.ndarray, EncodedLabels]:
+    if isinstance(values, EncodedLabels):
+        return EncodedLabels(values.codes[rows], values.categories)
+    return values[rows]
+
+
+def _as_values(values: Union[np.ndarray, EncodedLabels]) -> np.ndarray:
+    return _decode_labels(values) if isinstance(values, EncodedLabels) else values
+
+
+def _as_scores(scores: List[Optional[float]]) -> np.ndarray:
+    return np.array([np.nan if s is None else s for s in scores], dtype=float)
+
+
+def _none_for_nan(scores: np.ndarray) -> List[Optional[float]]:
+    return [None if s != s else s for s in scores.tolist()]
 
-    def order_by_parameter_score(self, parameter_name: str, ascending: bool = True) -> df:
-        dataframe = self.dataframe()
-        dataframe.sort_values(by=[parameter_name], inplace=True, ascending=ascending, key=lambda x: x[1])
-        return dataframe
 
 # We should also have a method to convert this to a pandas dataframe
 # We should also have a method to convert this to a numpy array
@@ -1,7 +1,11 @@
+import hashlib
 import textwrap
-from typing import Dict, Optional, Tuple
+from collections import namedtuple
+from typing import Any, Dict, Optional, Sequence, Tuple
 import datetime
 
+import numpy as np
+
 def wrap_text_to_80_chars(text: str, initial_indent=0, subsequent_indent=0) -> str:
     wrapper = textwrap.TextWrapper(width=80)
     wrapper.subsequent_indent = ' ' * subsequent_indent
@@ -21,6 +25,68 @@ def get_class_fields_and_their_description(cls) -> Optional[Dict[str, str]]:
     return field_description
 
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_MICROSECONDS_PER_DAY = 86_400_000_000
+
+
+def to_epoch_microseconds(values: Sequence[Any]) -> np.ndarray:
+    """Converts a sequence of dates and datetimes, which may be mixed, or a numpy.datetime64 array
+    to integer microseconds since the epoch. Dates are taken at midnight.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == "M":
+        return values.astype("datetime64[us]").view(np.int64)
+    # Plain arithmetic on the python objects is several times faster than numpy's conversion of them
+    return np.fromiter(
+        (
+            (v - (_EPOCH if v.tzinfo is None else _EPOCH_UTC)) // _MICROSECOND
+            if isinstance(v, datetime.datetime)
+            else (v.toordinal() - _EPOCH_ORDINAL) * _MICROSECONDS_PER_DAY
+            for v in values
+        ),
+        dtype=np.int64,
+        count=len(values),
+    )
+
+
+# Dictionary encoding of a column: the position of each value in categories, the distinct values
+EncodedLabels = namedtuple("EncodedLabels", ["codes", "categories"])
+
+
+def encode_labels(values: Sequence[Any]) -> EncodedLabels:
+    """Dictionary encodes a column of hashable values, e.g. the labels of an enum parameter.
+    Categories are numbered in the order they first appear.
+    """
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(v, len(index)) for v in values), dtype=np.int32, count=len(values)
+    )
+    return EncodedLabels(codes, list(index))
+
+
+def column_length(values: Sequence[Any]) -> int:
+    """Returns the number of values of a column, which may be dictionary encoded."""
+    return len(values.codes) if isinstance(values, EncodedLabels) else len(values)
+
+
+def column_hash(values: Sequence[Any]) -> str:
+    """Returns a hash of the content of a column, which may be dictionary encoded. Typed arrays are
+    hashed from their memory, other columns from the repr of their values.
+    """
+    h = hashlib.sha1()
+    if isinstance(values, EncodedLabels):
+        h.update(np.ascontiguousarray(values.codes).tobytes())
+        h.update(repr(list(values.categories)).encode())
+    elif isinstance(values, np.ndarray) and values.dtype != object:
+        h.update(str(values.dtype).encode())
+        h.update(np.ascontiguousarray(values).tobytes())
+    else:
+        h.update(repr(values.tolist() if isinstance(values, np.ndarray) else list(values)).encode())
+    return h.hexdigest()
+
+
 TIME_TYPE = datetime.date | datetime.datetime
 TIME_RANGE_TYPE = Tuple[TIME_TYPE, TIME_TYPE]
 FLOAT_RANGE_TYPE = Tuple[float, float]
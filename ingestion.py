@@ -0,0 +1,168 @@
+import csv
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from dataset import ColumnarDataset, DataPoint, Dataset, ParameterData
+from parameter import Parameter
+from validation import Rejection, validate_column
+
+FILE_FORMATS = ("csv", "jsonl")
+ROW = Dict[str, Any]
+
+
+class ImportReport(BaseModel):
+    rows: int = 0
+    imported: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+    # The first rejected value of each rejected row, rows are numbered from 0 in the order they are read
+    rejections: List[Rejection] = []
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.rows} rows read, {self.imported} imported, {self.rejected} rejected "
+            f"in {self.seconds:.2f}s ({self.rows_per_second:.0f} rows/s)"
+        )
+
+
+def read_csv_chunks(path: str, chunk_size: int = 10_000) -> Iterator[List[ROW]]:
+    """Reads a csv file with a header line, chunk_size rows at a time."""
+    with open(path, newline="") as f:
+        yield from _chunked(csv.DictReader(f), chunk_size)
+
+
+def read_jsonl_chunks(path: str, chunk_size: int = 10_000) -> Iterator[List[ROW]]:
+    """Reads a file of one json object per line, chunk_size rows at a time."""
+    with open(path) as f:
+        yield from _chunked((json.loads(line) for line in f if line.strip()), chunk_size)
+
+
+def read_chunks(path: str, file_format: Optional[str] = None, chunk_size: int = 10_000) -> Iterator[List[ROW]]:
+    """Reads a csv or jsonl file, chunk_size rows at a time. The format defaults to the file extension."""
+    file_format = (file_format or path.rsplit(".", 1)[-1]).lower()
+    if file_format == "csv":
+        return read_csv_chunks(path, chunk_size)
+    if file_format in ("jsonl", "ndjson"):
+        return read_jsonl_chunks(path, chunk_size)
+    raise ValueError(f"Unknown file format {file_format}, expected one of {FILE_FORMATS}")
+
+
+def import_chunks(
+    chunks: Iterable[List[ROW]],
+    dataset: Dataset,
+    parameters: List[Parameter],
+    name_column: str = "name",
+    column_map: Optional[Dict[str, str]] = None,
+    progress: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    """Appends the valid rows of each chunk to the dataset, as data points or, for a ColumnarDataset,
+    straight to its columns. Each parameter reads the
+    column of the same name, unless column_map maps the parameter name to another column.
+    Rows with a missing, unparsable or invalid value are rejected and listed in the report.
+    progress is called with the running report after each chunk.
+    """
+    column_map = column_map or {}
+    columns = [column_map.get(p.name, p.name) for p in parameters]
+    report = ImportReport()
+    start = time.perf_counter()
+    for chunk in chunks:
+        valid_rows, value_columns, rejections = parse_rows(chunk, parameters, columns)
+        report.rejections.extend(r._replace(row=r.row + report.rows) for r in rejections)
+        if isinstance(dataset, ColumnarDataset):
+            # Appended as columns, so that no data point is kept in memory
+            dataset.append_columns(
+                [chunk[i].get(name_column) for i in valid_rows],
+                {p.name: [values[i] for i in valid_rows] for p, values in zip(parameters, value_columns)},
+            )
+        else:
+            for i in valid_rows:
+                dataset.add_data_point(
+                    DataPoint(
+                        name=chunk[i].get(name_column),
+                        parameter_datas=[
+                            ParameterData(p.name, values[i], None) for p, values in zip(parameters, value_columns)
+                        ],
+                    )
+                )
+        report.rows += len(chunk)
+        report.imported += len(valid_rows)
+        report.rejected += len(chunk) - len(valid_rows)
+        report.seconds = time.perf_counter() - start
+        if progress is not None:
+            progress(report)
+    return report
+
+
+def import_file(
+    path: str,
+    dataset: Dataset,
+    parameters: List[Parameter],
+    file_format: Optional[str] = None,
+    chunk_size: int = 10_000,
+    name_column: str = "name",
+    column_map: Optional[Dict[str, str]] = None,
+    progress: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    return import_chunks(
+        read_chunks(path, file_format, chunk_size), dataset, parameters, name_column, column_map, progress
+    )
+
+
+def parse_rows(
+    rows: List[ROW], parameters: List[Parameter], columns: List[str]
+) -> Tuple[List[int], List[List[Any]], List[Rejection]]:
+    """Parses rows, e.g. a chunk read from a file, value by value and validates them column by column.
+    Returns the indices of the valid rows, one list of parsed values per parameter and the first
+    rejected value of each rejected row.
+    """
+    is_rejected = np.zeros(len(rows), dtype=bool)
+    rejections = []
+    value_columns = []
+    for parameter, column in zip(parameters, columns):
+        values = []
+        parsed_rows = []
+        for i, row in enumerate(rows):
+            value = None
+            raw = row.get(column)
+            if raw is None or raw == "":
+                reason = "is missing"
+            else:
+                try:
+                    value = parameter.parse_value(raw)
+                    reason = None
+                except (ValueError, TypeError):
+                    reason = "cannot be parsed"
+            if reason is None:
+                parsed_rows.append(i)
+            elif not is_rejected[i]:
+                is_rejected[i] = True
+                rejections.append(Rejection(i, parameter.name, reason))
+            values.append(value)
+        parsed = [values[i] for i in parsed_rows]
+        for r in validate_column(parameter.name, parameter.validate_values, parsed):
+            i = parsed_rows[r.row]
+            if not is_rejected[i]:
+                is_rejected[i] = True
+                rejections.append(r._replace(row=i))
+        value_columns.append(values)
+    rejections.sort(key=lambda r: r.row)
+    return np.flatnonzero(~is_rejected).tolist(), value_columns, rejections
+
+
+def _chunked(rows: Iterable[ROW], chunk_size: int) -> Iterator[List[ROW]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,97 +1,328 @@
-from typing import ClassVar, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import pathlib
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Sequence, Tuple, Union
 
-from dataset import Dataset, ParameterData
+from dataset import DataPoint, Dataset, DatasetCatalogEntry, DatasetHandle, ParameterData, loaded_dataset
+from normalization.normalization import RelativeNormalizer
 from parameter import Parameter
+from pydantic import PrivateAttr
+
 from storable import Storable
 import os
+import instrumentation
+import numpy as np
+import scoring
+from validation import ValidationReport
 
 
 class Model(Storable):
     parameters: List[Parameter]
     parameters_by_name: Optional[Dict[str, Parameter]]
-    datasets: Optional[List[Dataset]]
+    # Datasets of a loaded model are handles, which load the dataset from storage when it is first used
+    datasets: Optional[List[Union[DatasetHandle, Dataset]]]
     storage_folder: ClassVar[str] = "data/model/"
+    # Number of threads reading parameter and dataset files at the same time
+    load_jobs: ClassVar[int] = 8
+    _scoring_plan: Optional[scoring.ScoringPlan] = PrivateAttr(default=None)
 
     def __init__(self, **data):
-        # Update datasets from json
-        datasets = data.get("datasets")
-        if datasets:
-            for i, dataset in enumerate(datasets):
-                datasets[i] = Dataset(**Dataset.load_json(dataset.name))
-        data["datasets"] = datasets
-
-        Parameter.storage_folder = self.storage_folder + data.get("name") + "/parameters"
-
-        # If storage folder exists, load parameters from json
-        do_parameters_exist = False
-        if os.path.isdir(Parameter.storage_folder):
-            do_parameters_exist = True
-        parameters_by_name = dict()
-        for parameter in data.get("parameters"):
-            if do_parameters_exist:
-                parameter = Parameter.deserialize(parameter.name)
-            else:
-                parameter.store_json()
-            parameters_by_name[parameter.name] = parameter
-
-        data["parameters_by_name"] = parameters_by_name
-        super().__init__(**data)
-
-    def evaluate_datasets(self) -> None:
-        # Validate all data points for each dataset according to parameters
+        with instrumentation.timer("model.init"):
+            # Datasets are reloaded from storage on first use, their metadata is read from the catalog
+            datasets = data.get("datasets")
+            if datasets:
+                with instrumentation.timer("model.load_datasets"):
+                    catalog = self.load_catalog(data.get("name"))
+                    for i, dataset in enumerate(datasets):
+                        entry = DatasetHandle.of(dataset).entry
+                        datasets[i] = DatasetHandle(entry=catalog.get(entry.name, entry))
+            data["datasets"] = datasets
+
+            Parameter.storage_folder = self.storage_folder + data.get("name") + "/parameters"
+
+            # If storage folder exists, load parameters from json
+            do_parameters_exist = False
+            if os.path.isdir(Parameter.storage_folder):
+                do_parameters_exist = True
+            parameters = data.get("parameters")
+            with instrumentation.timer("model.load_parameters"):
+                if do_parameters_exist:
+                    parameters = load_concurrently(
+                        [
+                            (f"parameter {p.name}", lambda p=p: type(p).deserialize(p.name))
+                            for p in parameters
+                        ],
+                        self.load_jobs,
+                    )
+                else:
+                    for parameter in parameters:
+                        parameter.store_json()
+            parameters_by_name = {parameter.name: parameter for parameter in parameters}
+
+            data["parameters"] = parameters
+            data["parameters_by_name"] = parameters_by_name
+            super().__init__(**data)
+
+    def evaluate_datasets(
+        self, vectorized: bool = True, jobs: Optional[int] = 1, on_invalid: str = "raise"
+    ) -> Dict[str, ValidationReport]:
+        """Validates and scores the datasets, see scoring.evaluate_dataset for on_invalid.
+        Returns the validation report of each dataset by name.
+        """
         if not self.datasets:
-            return True
+            return {}
+        self._invalidate_rank_indexes()
+        self.load_datasets()
+        plan = self.scoring_plan()
+        if jobs is not None and jobs < 1:
+            raise ValueError(f"The number of jobs must be at least 1, or None for all cores, not {jobs}")
+        if not vectorized and (jobs != 1 or on_invalid != "raise"):
+            raise ValueError(
+                "Only the vectorized scoring can evaluate datasets in parallel or skip invalid values"
+            )
+        if jobs != 1:
+            return self._evaluate_datasets_in_parallel(plan, jobs, on_invalid)
 
+        reports = {}
         for dataset in self.datasets:
-            for datapoint in dataset.data_points:
-                parameter_datas = datapoint.parameter_datas
-                # 1. The length of all datapoint parameter values must be equal to the number of parameters
-                if len(parameter_datas) != len(self.parameters):
+            with instrumentation.timer("model.evaluate_dataset"):
+                if vectorized:
+                    reports[dataset.name] = scoring.evaluate_dataset(loaded_dataset(dataset), plan, on_invalid)
+                else:
+                    self._evaluate_data_points(loaded_dataset(dataset))
+                    reports[dataset.name] = ValidationReport(rows=len(dataset.data_point_names()))
+            with instrumentation.timer("model.store_dataset"):
+                dataset.store()
+        self.store_catalog()
+        return reports
+
+    def load_datasets(self) -> None:
+        """Loads the datasets which are not loaded yet, up to load_jobs of them at the same time."""
+        handles = [d for d in self.datasets or [] if isinstance(d, DatasetHandle) and not d.is_loaded()]
+        with instrumentation.timer("model.load_datasets"):
+            loaded = load_concurrently([(f"dataset {h.name}", h.get) for h in handles], self.load_jobs)
+        for handle, dataset in zip(handles, loaded):
+            handle.set(dataset)
+
+    def _evaluate_datasets_in_parallel(
+        self, plan: scoring.ScoringPlan, jobs: Optional[int], on_invalid: str
+    ) -> Dict[str, ValidationReport]:
+        """Evaluates the datasets in up to jobs worker processes, all cores if jobs is None.
+        Each worker receives the scoring plan and one dataset, and returns the evaluated copy, which
+        replaces the dataset in the model. Results are taken in order and stored in a background
+        thread while the next ones are awaited, so the first ValueError raised is the same as in a
+        serial evaluation and the datasets before it are stored.
+        """
+        with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count(), len(self.datasets))) as processes:
+            futures = [
+                processes.submit(scoring.evaluate_dataset_copy, loaded_dataset(dataset), plan, on_invalid)
+                for dataset in self.datasets
+            ]
+            reports = {}
+            with ThreadPoolExecutor(max_workers=1) as writer:
+                stores = []
+                try:
+                    for i, future in enumerate(futures):
+                        dataset, reports[self.datasets[i].name] = future.result()
+                        if isinstance(self.datasets[i], DatasetHandle):
+                            self.datasets[i].set(dataset)
+                        else:
+                            self.datasets[i] = dataset
+                        stores.append(writer.submit(self.datasets[i].store))
+                finally:
+                    for future in futures:
+                        future.cancel()
+                for store in stores:
+                    store.result()
+        self.store_catalog()
+        return reports
+
+    def _evaluate_data_points(self, dataset: Dataset) -> None:
+        # Reference implementation of the scoring, one data point and one value at a time. The
+        # data points are read with iter_data_points and the scores written back with set_scores,
+        # which every kind of dataset supports.
+        dataset._invalidate_scores()
+        names = dataset.parameter_names()
+        columns = {name: j for j, name in enumerate(names)}
+        data_points = list(dataset.iter_data_points())
+        scores = np.empty((len(data_points), len(names)))
+        total_scores = np.empty(len(data_points))
+        weight_sums = sum([p.weight for p in self.parameters])
+        for row, datapoint in enumerate(data_points):
+            parameter_datas = datapoint.parameter_datas
+            # 1. The length of all datapoint parameter values must be equal to the number of parameters
+            if len(parameter_datas) != len(self.parameters):
+                raise ValueError(
+                    f"Number of datapoints in {dataset.name} does not match number of parameters"
+                    )
+
+            # 2. The name of each datapoint.point must be equal to the name of the parameter
+            names_of_datapoint_parameters = [p.name for p in parameter_datas]
+            for name in names_of_datapoint_parameters:
+                if name not in self.parameters_by_name:
+                    raise ValueError(
+                        f"Parameter {name} of dataset {dataset.name} not found in model"
+                        )
+                if name not in columns:
                     raise ValueError(
-                        f"Number of datapoints in {dataset.name} does not match number of parameters"
+                        f"Data points of dataset {dataset.name} do not have the same parameters"
                         )
 
-                # 2. The name of each datapoint.point must be equal to the name of the parameter
-                names_of_datapoint_parameters = [p.name for p in parameter_datas]
-                for name in names_of_datapoint_parameters:
-                    if name not in self.parameters_by_name:
-                        raise ValueError(
-                            f"Parameter {name} of dataset {dataset.name} not found in model"
-                            )
-
-                # 3. The values must be validated by the parameter
-                for parameter_value in parameter_datas:
-                    parameter = self.parameters_by_name[parameter_value.name]
-                    if not parameter.is_value_valid(parameter_value.value):
-                        raise ValueError(
-                            f"Value {parameter_value.value} is not valid for parameter"
-                            f" {parameter_value.name} of dataset {dataset.name}"
-                            )
-                    score = parameter.evaluate_score(parameter_value.value)
-                    parameter_value = ParameterData(parameter_value.name, parameter_value.value, score)
-
-                weight_sums = sum([p.weight for p in self.parameters])
-                datapoint.total_score = sum(
-                    [p.score * self.parameters_by_name[p.name].weight for p in parameter_datas]
-                    ) / weight_sums
-            dataset.store_json()
+            # 3. The values must be validated by the parameter
+            row_scores = []
+            for parameter_value in parameter_datas:
+                parameter = self.parameters_by_name[parameter_value.name]
+                if not parameter.is_value_valid(parameter_value.value):
+                    raise ValueError(
+                        f"Value {parameter_value.value} is not valid for parameter"
+                        f" {parameter_value.name} of dataset {dataset.name}"
+                        )
+                score = parameter.evaluate_score(parameter_value.value)
+                scores[row, columns[parameter_value.name]] = score
+                row_scores.append(score * parameter.weight)
+            total_scores[row] = sum(row_scores) / weight_sums
+        dataset.set_scores(names, scores, total_scores)
+
+    def scoring_plan(self) -> scoring.ScoringPlan:
+        """Returns the parameters compiled for scoring. The plan is compiled again after the
+        parameters were added, deleted or changed.
+        """
+        if self._scoring_plan is None or not self._scoring_plan.is_current(self.parameters):
+            with instrumentation.timer("model.compile_scoring_plan"):
+                self._scoring_plan = scoring.ScoringPlan.compile(self.parameters)
+        return self._scoring_plan
+
+    def _invalidate_scoring_plan(self) -> None:
+        self._scoring_plan = None
+
+    def _invalidate_rank_indexes(self) -> None:
+        # Relative normalizers keep the rank index of the last column they scored against, which
+        # is only checked by identity and length, so it is dropped whenever datasets are modified
+        for parameter in self.parameters:
+            if isinstance(parameter.normalizer, RelativeNormalizer):
+                parameter.normalizer.invalidate_rank_index()
 
     def delete_parameter(self, parameter_name: str) -> None:
         self.parameters = [p for p in self.parameters if p.name != parameter_name]
+        self.parameters_by_name.pop(parameter_name, None)
+        self._invalidate_scoring_plan()
 
     def change_parameter_weight(self, parameter_name: str, new_weight: float) -> None:
         parameter = self.parameters_by_name[parameter_name]
         parameter.weight = new_weight
+        self._invalidate_scoring_plan()
+        self.update_total_scores()
+
+    def update_total_scores(self) -> None:
+        # Only the weighted sum is recomputed, for the loaded datasets whose scores are up to date.
+        # Datasets which are not loaded get their total scores when they are next evaluated.
+        plan = self.scoring_plan()
+        for dataset in self.datasets or []:
+            if not isinstance(dataset, DatasetHandle) or dataset.is_loaded():
+                scoring.update_total_scores(loaded_dataset(dataset), plan)
 
     def add_parameter(self, parameter: Parameter) -> None:
         self.parameters.append(parameter)
+        self.parameters_by_name[parameter.name] = parameter
+        self._invalidate_scoring_plan()
 
     def add_dataset(self, dataset: Dataset) -> None:
+        handle = DatasetHandle.of(dataset)
+        handle.set(loaded_dataset(dataset))
         if self.datasets:
-            self.datasets.append(dataset)
+            self.datasets.append(handle)
         else:
-            self.datasets = [dataset]
+            self.datasets = [handle]
+
+    def update_dataset(self, dataset: Dataset) -> bool:
+        """Replaces the dataset of the same name, e.g. after it was modified and stored outside of
+        the model, and stores the catalog. Returns whether the model has the dataset.
+        """
+        for i, d in enumerate(self.datasets or []):
+            if d.name == dataset.name:
+                if isinstance(d, DatasetHandle):
+                    d.set(dataset)
+                else:
+                    self.datasets[i] = dataset
+                self.store_catalog()
+                return True
+        return False
+
+    def catalog(self) -> List[DatasetCatalogEntry]:
+        """Returns the metadata of the datasets, without loading the ones which are not loaded."""
+        return [
+            d.catalog_entry() if isinstance(d, DatasetHandle) else DatasetCatalogEntry.of(d)
+            for d in self.datasets or []
+        ]
+
+    @classmethod
+    def catalog_path(cls, name: str) -> str:
+        return f"{cls.storage_folder}/{name}/catalog.json"
+
+    @classmethod
+    def load_catalog(cls, name: str) -> Dict[str, DatasetCatalogEntry]:
+        """Returns the catalog entries stored for the model by dataset name, none if there is no catalog."""
+        path = cls.catalog_path(name)
+        if not os.path.isfile(path):
+            return {}
+        with instrumentation.timer("model.load_catalog"), open(path, "r") as f:
+            entries = json.load(f)
+        return {e["name"]: DatasetCatalogEntry(**e) for e in entries}
+
+    def store_catalog(self) -> None:
+        path = self.catalog_path(self.name)
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with instrumentation.timer("model.store_catalog"), open(path, "w+") as f:
+            json.dump([e.model_dump() for e in self.catalog()], f, indent=4)
+
+    def __getstate__(self) -> Dict[Any, Any]:
+        # The scoring plan is compiled again when it is needed
+        state = super().__getstate__()
+        state['__pydantic_private__'] = {**state['__pydantic_private__'], '_scoring_plan': None}
+        return state
+
+    def store_binary(self) -> None:
+        # Datasets are stored on their own, only the handles are pickled with the model
+        super().store_binary()
+        self.store_catalog()
 
     def delete_dataset(self, dataset_name: str) -> None:
         if self.datasets:
             self.datasets = [d for d in self.datasets if d.name != dataset_name]
+
+    def get_dataset(self, dataset_name: str) -> Dataset:
+        for dataset in self.datasets or []:
+            if dataset.name == dataset_name:
+                return loaded_dataset(dataset)
+        raise ValueError(f"Dataset {dataset_name} not found in model {self.name}")
+
+    def add_data_points(self, dataset_name: str, data_points: List[DataPoint]) -> scoring.ScoreUpdate:
+        """Adds data points to a dataset of the model and scores them incrementally,
+        see scoring.add_data_points.
+        """
+        self._invalidate_rank_indexes()
+        return scoring.add_data_points(self.get_dataset(dataset_name), self.scoring_plan(), data_points)
+
+    def delete_data_points(self, dataset_name: str, data_point_names: List[str]) -> scoring.ScoreUpdate:
+        """Deletes data points from a dataset of the model and updates the scores incrementally,
+        see scoring.delete_data_points.
+        """
+        self._invalidate_rank_indexes()
+        return scoring.delete_data_points(self.get_dataset(dataset_name), self.scoring_plan(), data_point_names)
+
+
+def load_concurrently(loaders: Sequence[Tuple[str, Callable[[], Any]]], jobs: int) -> List[Any]:
+    """Calls the loaders, e.g. reading files, in up to jobs threads and returns their results in the
+    order of the loaders. Every loader is called even if some fail, a single ValueError then lists
+    the description and error of each failed loader.
+    """
+    if not loaders:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(loaders)))) as threads:
+        futures = [threads.submit(loader) for _, loader in loaders]
+
+    errors = [(description, f.exception()) for (description, _), f in zip(loaders, futures) if f.exception()]
+    if errors:
+        message = "\n".join(f"  {description}: {type(e).__name__}: {e}" for description, e in errors)
+        raise ValueError(f"Could not load {len(errors)} of {len(loaders)} files:\n{message}") from errors[0][1]
+    return [f.result() for f in futures]
@@ -1,13 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import ClassVar, Dict, List, Optional, Tuple, Any
+from typing import ClassVar, Dict, List, Optional, Sequence, Tuple, Any
 
-import matplotlib.pyplot as plt
 import numpy as np
-from pydantic import BaseModel, Field, model_serializer
+from pydantic import BaseModel, Field, PrivateAttr, model_serializer
 
 import sys
 sys.path.append(".")
-from helpers import TIME_TYPE, TIME_RANGE_TYPE, FLOAT_RANGE_TYPE
+from helpers import TIME_TYPE, TIME_RANGE_TYPE, FLOAT_RANGE_TYPE, to_epoch_microseconds
 
 
 def clip_to(value: Any, clip_range: Optional[Tuple[Any, Any]] = None) -> Any:
@@ -22,6 +21,87 @@ def clip_to(value: Any, clip_range: Optional[Tuple[Any, Any]] = None) -> Any:
         return value
 
 
+class RankIndex:
+    """
+    A column of values sorted once, so that the rank of any value in the column is found with a
+    binary search. Duplicate values share the rank of their first occurrence in sorted order.
+    """
+
+    def __init__(self, values: Sequence[Any]):
+        self.sorted_values = np.sort(np.asarray(values))
+
+    def __len__(self) -> int:
+        return len(self.sorted_values)
+
+    def ranks(self, x: Sequence[Any]) -> np.ndarray:
+        """Returns the rank of each value of x, or -1 for values that are not in the column."""
+        x = np.asarray(x)
+        n = len(self.sorted_values)
+        if n == 0:
+            return np.full(x.shape, -1)
+        ranks = np.searchsorted(self.sorted_values, x, side="left")
+        found = self.sorted_values[np.minimum(ranks, n - 1)] == x
+        return np.where(found, ranks, -1)
+
+    def scores(self, x: Sequence[Any]) -> np.ndarray:
+        """Returns the relative score (0-100) of each value of x, 0 for values that are not in the column."""
+        return self.rank_scores(self.ranks(x), len(self.sorted_values))
+
+    @staticmethod
+    def column_ranks(values: Sequence[Any]) -> np.ndarray:
+        """Returns the rank of every value of a column within the column itself, using a single sort."""
+        values = np.asarray(values)
+        n = len(values)
+        order = np.argsort(values, kind="stable")
+        sorted_values = values[order]
+        is_first = np.ones(n, dtype=bool)
+        is_first[1:] = sorted_values[1:] != sorted_values[:-1]
+        ranks = np.empty(n, dtype=np.intp)
+        ranks[order] = np.maximum.accumulate(np.where(is_first, np.arange(n), 0))
+        return ranks
+
+    @classmethod
+    def column_scores(cls, values: Sequence[Any]) -> np.ndarray:
+        """Returns the relative score (0-100) of every value of a column within the column itself."""
+        return cls.rank_scores(cls.column_ranks(values), len(values))
+
+    @staticmethod
+    def rank_scores(ranks: np.ndarray, n: int) -> np.ndarray:
+        """Converts ranks in a column of n values to relative scores, -1 ranks score 0."""
+        if n == 1:
+            return np.where(ranks == 0, 100.0, 0.0)
+        return np.where(ranks >= 0, ranks / max(n - 1, 1) * 100, 0.0)
+
+
+class RelativeNormalizer:
+    """
+    Mixin for normalizers that score a value relative to a column of values. The rank index of the
+    last column is kept, so that repeated calls with the same column object sort it only once. The
+    cache is keyed on the identity and length of the column: a column modified in place without
+    changing its length is ranked again only after invalidate_rank_index. Whole columns are scored
+    with batch, the scalar call is meant for single lookups.
+    """
+
+    def rank_index(self, values: Sequence[Any]) -> RankIndex:
+        if self._rank_index is None or self._rank_index[0] is not values \
+                or self._rank_index[1] != len(values):
+            self._rank_index = (values, len(values), RankIndex(self.rank_values(values)))
+        return self._rank_index[2]
+
+    def invalidate_rank_index(self) -> None:
+        self._rank_index = None
+
+    def rank_values(self, values: Sequence[Any]) -> np.ndarray:
+        """Converts values to the array on which the ranks are computed."""
+        return np.asarray(values)
+
+    def __getstate__(self) -> Dict[Any, Any]:
+        # The rank index is a cache, it is not stored with the normalizer
+        state = super().__getstate__()
+        state['__pydantic_private__'] = {**state['__pydantic_private__'], '_rank_index': None}
+        return state
+
+
 class Normalizer(ABC, BaseModel):
     """
     A class that represents a normalizer. A normalizer is a function that takes a value and returns a normalized value,
@@ -34,6 +114,13 @@ class Normalizer(ABC, BaseModel):
     def __call__(self, *args, **kwargs) -> float:
         pass
 
+    def batch(self, x: Sequence[Any], *args, **kwargs) -> np.ndarray:
+        """Normalizes all values of x at once. Returns an array of floats.
+        Subclasses override this with a vectorized implementation, the default calls the normalizer
+        on each value.
+        """
+        return np.fromiter((self(i, *args, **kwargs) for i in x), dtype=float, count=len(x))
+
     def plot_example(
         self, clip_range: Optional[Tuple[Any, Any]] = None, horizontal: str = "Value"
     ):
@@ -76,11 +163,15 @@ class Identity(NumericalNormalizerFamily):
     def __call__(self, x: float) -> float:
         return x
 
+    def batch(self, x: Sequence[float]) -> np.ndarray:
+        return np.array(x, dtype=float)
+
     def plot_example(
         self,
         clip_range: Optional[FLOAT_RANGE_TYPE] = None,
         horizontal: str = "Value",
     ):
+        import matplotlib.pyplot as plt
 
         if clip_range is not None:
             n_steps = 100
@@ -88,7 +179,7 @@ class Identity(NumericalNormalizerFamily):
         else:
             x = np.linspace(-100, 100, 100)
 
-        y = [self.__call__(i) for i in x]
+        y = self.batch(x)
         plt.scatter(x, y)
         plt.title("Identity normalizer function example")
         plt.xlabel(f"{horizontal}")
@@ -97,29 +188,32 @@ class Identity(NumericalNormalizerFamily):
         plt.show()
 
 
-class RelativeAscending(NumericalNormalizerFamily):
+class RelativeAscending(RelativeNormalizer, NumericalNormalizerFamily):
     description: ClassVar[str] = (
         "Relative ascending function. Returns the value relative to the minimum "
         "and maximum values. 0-100"
     )
 
+    _rank_index: Optional[Tuple[Any, int, RankIndex]] = PrivateAttr(default=None)
+
     def __call__(self, x: int, values: List[int]) -> float:
-        sorted_values = sorted(values)
         try:
-            index_of_x = sorted_values.index(x)
-            if len(values) == 1:
-                return 100
-            elif len(values) == 0:
-                return 0
-            return (index_of_x) / (len(values) - 1) * 100
+            return float(self.rank_index(values).scores([x])[0])
         except Exception as e:
             return 0
 
+    def batch(self, x: Sequence[int], values: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Scores all values of x relative to values, or relative to x itself if values is None."""
+        if values is None:
+            return RankIndex.column_scores(x)
+        return self.rank_index(values).scores(x)
+
     def plot_example(
         self,
         clip_range: Optional[FLOAT_RANGE_TYPE] = None,
         horizontal: str = "Value",
     ):
+        import matplotlib.pyplot as plt
 
         if clip_range is not None:
             n_steps = 100
@@ -127,7 +221,7 @@ class RelativeAscending(NumericalNormalizerFamily):
         else:
             x = np.linspace(-100, 100, 100)
 
-        y = [self.__call__(i, x) for i in x]
+        y = self.batch(x, x)
         plt.scatter(x, y)
         plt.title("Relative ascending function example")
         plt.xlabel(f"{horizontal}")
@@ -154,11 +248,15 @@ class Step(NumericalNormalizerFamily):
         else:
             return 100
 
+    def batch(self, x: Sequence[int]) -> np.ndarray:
+        return np.where(np.asarray(x, dtype=float) < self.threshold, 0.0, 100.0)
+
     def plot_example(
         self,
         clip_range: Optional[FLOAT_RANGE_TYPE] = None,
         horizontal: str = "Value",
     ):
+        import matplotlib.pyplot as plt
 
         if clip_range is not None:
             n_steps = 100
@@ -166,7 +264,7 @@ class Step(NumericalNormalizerFamily):
         else:
             x = np.linspace(-100, 100, 100)
 
-        y = [self.__call__(i) for i in x]
+        y = self.batch(x)
         plt.scatter(x, y)
         plt.title(f"Step function(threshold={self.threshold}) example")
         plt.xlabel(f"{horizontal}")
@@ -186,13 +284,18 @@ class Boolean(Normalizer):
         else:
             return 100
 
+    def batch(self, x: Sequence[int]) -> np.ndarray:
+        return np.where(np.asarray(x) == 0, 0.0, 100.0)
+
     def plot_example(
         self, clip_range: Optional[Tuple[int, int]] = None, horizontal: str = "Value"
     ):
+        import matplotlib.pyplot as plt
+
         if clip_range is None:
             return False
         x = [0, 1]
-        y = [self.__call__(i) for i in x]
+        y = self.batch(x)
         plt.scatter(x, y)
         plt.title("Boolean normalizer function example")
         plt.xlabel(f"{horizontal}")
@@ -227,15 +330,29 @@ class StepLinearPositive(NumericalNormalizerFamily):
         else:
             return 100
 
+    def batch(self, x: Sequence[int]) -> np.ndarray:
+        x = np.asarray(x, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            linear = (
+                100
+                * (x - self.threshold_low)
+                / (self.threshold_high - self.threshold_low)
+            )
+        linear[x >= self.threshold_high] = 100
+        linear[x < self.threshold_low] = 0
+        return linear
+
     def plot_example(
         self, clip_range: Optional[Tuple[int, int]] = None, horizontal: str = "Value"
     ):
+        import matplotlib.pyplot as plt
+
         diff = self.threshold_high - self.threshold_low
         left_bound = clip_to(self.threshold_low - diff, clip_range)
         right_bound = clip_to(self.threshold_high + diff, clip_range)
 
         x = np.arange(left_bound, right_bound)
-        y = [self.__call__(i) for i in x]
+        y = self.batch(x)
         plt.plot(x, y)
         plt.title(
             f"Step linear positive normalization function with range {(self.threshold_low, self.threshold_high)}"
@@ -267,15 +384,29 @@ class StepLinearNegative(NumericalNormalizerFamily):
                 / (self.threshold_low - self.threshold_high)
             )
 
+    def batch(self, x: Sequence[int]) -> np.ndarray:
+        x = np.asarray(x, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            linear = (
+                100
+                * (x - self.threshold_high)
+                / (self.threshold_low - self.threshold_high)
+            )
+        linear[x < self.threshold_low] = 100
+        linear[x >= self.threshold_high] = 0
+        return linear
+
     def plot_example(
         self, clip_range: Optional[Tuple[int, int]] = None, horizontal: str = "Value"
     ):
+        import matplotlib.pyplot as plt
+
         diff = self.threshold_high - self.threshold_low
         x = np.arange(
             clip_to(self.threshold_low - diff, clip_range),
             clip_to(self.threshold_high + diff, clip_range),
         )
-        y = [self.__call__(i) for i in x]
+        y = self.batch(x)
         plt.plot(x, y)
         plt.title(
             f"Step linear negative normalization function with range {(self.threshold_low, self.threshold_high)}"
@@ -295,11 +426,16 @@ class Uniform(NumericalNormalizerFamily, TimeNormalizerFamily, BooleanNormalizer
     def __call__(self, x: int) -> float:
         return self.uniform_value
 
+    def batch(self, x: Sequence[int]) -> np.ndarray:
+        return np.full(len(x), self.uniform_value, dtype=float)
+
     def plot_example(
         self, clip_range: Optional[Tuple[int, int]] = None, horizontal: str = "Value"
     ):
+        import matplotlib.pyplot as plt
+
         x = np.arange(clip_range[0], clip_range[1])
-        y = [self.__call__(i) for i in x]
+        y = self.batch(x)
         plt.plot(x, y)
         plt.title("Uniform normalization function with value 20")
         plt.xlabel(f"{horizontal}")
@@ -323,14 +459,26 @@ class StepAbsoluteTimeNormalizer(TimeNormalizerFamily):
             return 100
         return (x - self.start_date).total_seconds() / (self.end_date - self.start_date).total_seconds() * 100
 
+    def batch(self, x: Sequence[TIME_TYPE]) -> np.ndarray:
+        """Normalizes dates, datetimes or numpy.datetime64 values, which may be mixed."""
+        x = to_epoch_microseconds(x)
+        start, end = to_epoch_microseconds([self.start_date, self.end_date])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = (x - start) / 1e6 / ((end - start) / 1e6) * 100
+        scores[x > end] = 100
+        scores[x < start] = 0
+        return scores
+
     def plot_example(
         self, clip_range: Optional[TIME_RANGE_TYPE] = None, horizontal: str = "Value"
     ):
+        import matplotlib.pyplot as plt
+
         # random dates in the start_time, end_time range
         diff = (self.end_date - self.start_date)
         range_ = np.arange(-diff, 2*diff, diff / 100).astype(type(self.start_date))
         x = [self.start_date + r for r in range_]
-        y = [self.__call__(i) for i in x]
+        y = self.batch(x)
         plt.scatter(x, y)
         plt.title("Step absolute time normalizer function example")
         plt.xlabel(f"{horizontal}")
@@ -339,7 +487,7 @@ class StepAbsoluteTimeNormalizer(TimeNormalizerFamily):
         plt.show()
 
 
-class RelativeTimeNormalizer(TimeNormalizerFamily):
+class RelativeTimeNormalizer(RelativeNormalizer, TimeNormalizerFamily):
     description: ClassVar[str] = (
         "Normalizes the given time value relative to the times of the given array. "
         "For example, if the given array is ['2021-01-01', '2021-01-02', '2021-01-02'] "
@@ -348,26 +496,44 @@ class RelativeTimeNormalizer(TimeNormalizerFamily):
         "If the given time is '2021-01-03', the normalized value will be 100."
     )
 
+    _rank_index: Optional[Tuple[Any, int, RankIndex]] = PrivateAttr(default=None)
+
     def __call__(self, x: TIME_TYPE, time_array: List[TIME_TYPE]) -> float:
-        sorted_values = sorted(time_array)
         try:
             if len(time_array) == 1:
                 return 100
             elif len(time_array) == 0:
                 return 0
 
-            index_of_x = sorted_values.index(x)
-            return (index_of_x) / (len(time_array) - 1) * 100
+            return float(self.rank_index(time_array).scores(to_epoch_microseconds([x]))[0])
         except Exception as e:
             return 0
 
+    def batch(
+        self, x: Sequence[TIME_TYPE], time_array: Optional[Sequence[TIME_TYPE]] = None
+    ) -> np.ndarray:
+        """Scores all time values of x relative to time_array, or relative to x itself if
+        time_array is None. Accepts dates, datetimes or numpy.datetime64 values, which may be mixed.
+        """
+        if time_array is not None and len(time_array) == 1:
+            return np.full(len(x), 100.0)
+        x = to_epoch_microseconds(x)
+        if time_array is None:
+            return RankIndex.column_scores(x)
+        return self.rank_index(time_array).scores(x)
+
+    def rank_values(self, values: Sequence[TIME_TYPE]) -> np.ndarray:
+        return to_epoch_microseconds(values)
+
     def plot_example(
         self, clip_range: Optional[TIME_RANGE_TYPE] = None, horizontal: str = "Value"
     ):
+        import matplotlib.pyplot as plt
+
         diff = (clip_range[1] - clip_range[0])
         range_ = np.arange(-diff, 2*diff, diff / 100).astype(type(clip_range[0]))
         x = [clip_range[0] + r for r in range_]
-        y = [self.__call__(i, x) for i in x]
+        y = self.batch(x, x)
 
         plt.scatter(x, y)
         plt.title("Relative time normalizer function example")
@@ -1,4 +1,8 @@
+import datetime
 import unittest
+from unittest import mock
+
+import numpy as np
 
 import normalization.normalization as normalization
 
@@ -31,3 +35,90 @@ class TestNormalization(unittest.TestCase):
         self.assertEqual(r(100, all_values), 100)
 
         self.assertEqual(r(50, all_values), 0)
+
+    def test_batch_matches_scalar(self):
+        values = [-50, 0, 0.5, 10, 25, 49.9, 50, 75, 100, 1000]
+        normalizers = [
+            normalization.Identity(),
+            normalization.Step(threshold=25),
+            normalization.Boolean(),
+            normalization.StepLinearPositive(threshold_low=10, threshold_high=50),
+            normalization.StepLinearNegative(threshold_low=10, threshold_high=50),
+            normalization.StepLinearPositive(threshold_low=50, threshold_high=50),
+            normalization.Uniform(uniform_value=20),
+        ]
+        for n in normalizers:
+            expected = [float(n(v)) for v in values]
+            self.assertEqual(n.batch(values).tolist(), expected)
+            self.assertEqual(n.batch(values).dtype, float)
+
+    def test_batch_fallback(self):
+        r = normalization.RelativeAscending()
+        all_values = [0, 30, 10, 5, 100]
+        self.assertEqual(r.batch(all_values, all_values).tolist(), [0, 75, 50, 25, 100])
+
+    def test_relative_ascending_batch(self):
+        r = normalization.RelativeAscending()
+        all_values = [0, 30, 10, 5, 100, 10]
+        expected = [r(v, all_values) for v in all_values]
+        self.assertEqual(r.batch(all_values).tolist(), expected)
+        # Duplicates share the rank of their first occurrence
+        self.assertEqual(expected[2], expected[5])
+        self.assertEqual(r.batch([10, 50], all_values).tolist(), [40, 0])
+        self.assertEqual(r.batch([7], [7]).tolist(), [100])
+        self.assertEqual(r.batch([], []).tolist(), [])
+
+    def test_relative_ascending_reuses_rank_index(self):
+        r = normalization.RelativeAscending()
+        all_values = [0, 30, 10]
+        r(0, all_values)
+        rank_index = r.rank_index(all_values)
+        self.assertEqual(r(30, all_values), 100)
+        self.assertIs(r.rank_index(all_values), rank_index)
+        self.assertIsNot(r.rank_index(list(all_values)), rank_index)
+        # The column is not converted again by the next scalar calls
+        r.rank_index(all_values)
+        with mock.patch.object(normalization.RelativeAscending, "rank_values", side_effect=AssertionError):
+            self.assertEqual([r(v, all_values) for v in all_values], [0, 100, 50])
+        # A column which grows is ranked again, one modified in place once invalidated
+        all_values.append(40)
+        self.assertAlmostEqual(r(30, all_values), 200 / 3)
+        all_values[1] = -5
+        r.invalidate_rank_index()
+        self.assertEqual(r(-5, all_values), 0)
+
+    def test_step_absolute_time_batch(self):
+        n = normalization.StepAbsoluteTimeNormalizer(
+            start_date=datetime.datetime(2020, 1, 1), end_date=datetime.datetime(2021, 3, 1, 12)
+        )
+        times = [
+            datetime.datetime(2019, 5, 1),
+            datetime.datetime(2020, 1, 1),
+            datetime.datetime(2020, 6, 7, 8, 9, 10, 11),
+            datetime.datetime(2021, 3, 1, 12),
+            datetime.datetime(2022, 1, 1),
+        ]
+        expected = [float(n(t)) for t in times]
+        self.assertEqual(n.batch(times).tolist(), expected)
+        self.assertEqual(n.batch(np.array(times, dtype="datetime64[us]")).tolist(), expected)
+        # Dates are taken at midnight
+        self.assertEqual(
+            n.batch([datetime.date(2020, 6, 1), datetime.datetime(2020, 6, 1)]).tolist(),
+            [n(datetime.datetime(2020, 6, 1))] * 2,
+        )
+
+    def test_relative_time_batch(self):
+        n = normalization.RelativeTimeNormalizer()
+        times = [
+            datetime.datetime(2021, 1, 2),
+            datetime.datetime(2021, 1, 1),
+            datetime.datetime(2021, 1, 3),
+            datetime.datetime(2021, 1, 2),
+        ]
+        expected = [n(t, times) for t in times]
+        self.assertEqual(n.batch(times).tolist(), expected)
+        self.assertEqual(n.batch(np.array(times, dtype="datetime64[us]")).tolist(), expected)
+        self.assertEqual(
+            n.batch([datetime.date(2021, 1, 3), datetime.date(2021, 1, 4)], times).tolist(), [100, 0]
+        )
+        self.assertEqual(n.batch(times[:1], times[:1]).tolist(), [100])
@@ -1,10 +1,19 @@
-from typing import Any, ClassVar, List, Optional, Tuple, Any, Dict
+from typing import Any, ClassVar, List, Optional, Sequence, Tuple, Any, Dict
+import hashlib
+import json
 
+import numpy as np
 from pydantic import BaseModel, Field, field_serializer, model_serializer
+import instrumentation
 import normalization.normalization as normalization
 from storable import Storable
 from datetime import date, datetime
-from helpers import TIME_RANGE_TYPE, TIME_TYPE, FLOAT_RANGE_TYPE
+from helpers import (
+    TIME_RANGE_TYPE, TIME_TYPE, FLOAT_RANGE_TYPE, EncodedLabels, encode_labels, to_epoch_microseconds
+)
+
+# A boolean mask of the values which fail a check, and the reason they fail it
+VALUE_CHECK = Tuple[np.ndarray, str]
 
 
 f"TEXT represents parameters that accept free-form text input. \n"
@@ -37,6 +46,8 @@ class Parameter(Storable):
     normalizer: normalization.Normalizer = normalization.Identity()
     storage_folder: ClassVar[str] = "data/parameter/"
     description: ClassVar[str] = "Parameter description"
+    # Whether evaluate_scores and validate_values take dictionary encoded columns, see helpers.EncodedLabels
+    takes_encoded_values: ClassVar[bool] = False
     normalizer_family: Any = normalization.Normalizer
 
     @field_serializer('normalizer_family')
@@ -46,17 +57,52 @@ class Parameter(Storable):
     @classmethod
     def deserialize(self, name: str):
         d = self.load_json(name)
-        d['normalizer_family'] = eval(f"normalization.{d['normalizer_family']}")
-        normalizer_class = "normalization." + d['normalizer']['type']
-        d['normalizer'] = eval(normalizer_class)(**d['normalizer'])
-        return self(**d)
+        with instrumentation.timer("parameter.deserialize"):
+            d['normalizer_family'] = eval(f"normalization.{d['normalizer_family']}")
+            normalizer_class = "normalization." + d['normalizer']['type']
+            d['normalizer'] = eval(normalizer_class)(**d['normalizer'])
+            return self(**d)
 
     def evaluate_score(self, value: Any) -> float:
         return self.normalizer(value)
 
+    def evaluate_scores(self, values: Sequence[Any]) -> np.ndarray:
+        return self.normalizer.batch(values)
+
     def is_value_valid(self, value: Any) -> bool:
         return True
 
+    def check_value(self, value: Any) -> bool:
+        """Returns whether a value is valid without printing, so that validate_values can be called
+        from any thread, e.g. by the scoring server. It calls is_value_valid unless overridden, which
+        parameters whose is_value_valid prints must do, or override validate_values.
+        """
+        try:
+            return bool(self.is_value_valid(value))
+        except (ValueError, TypeError):
+            return False
+
+    def validate_values(self, values: Sequence[Any]) -> List[VALUE_CHECK]:
+        """Checks a whole column of values at once, without printing.
+        Returns the failed values of each check, see validation.validate_columns.
+        """
+        valid = np.fromiter((self.check_value(v) for v in values), dtype=bool, count=len(values))
+        return [(~valid, "is not valid")]
+
+    def parse_value(self, raw: Any) -> Any:
+        """Converts a raw value read from a file (e.g. a csv string) to a value of the parameter.
+        Raises ValueError if it cannot be converted.
+        """
+        return raw
+
+    def score_fingerprint(self) -> str:
+        """Returns a hash of everything that determines the scores of the parameter's values,
+        i.e. the whole parameter definition except its weight.
+        """
+        definition = self.model_dump(exclude={"weight"})
+        definition["class"] = self.get_class_name()
+        return hashlib.sha1(json.dumps(definition, sort_keys=True, default=str).encode()).hexdigest()
+
     @classmethod
     def get_subclasses_as_list(cls) -> List[str]:
         return [subclass.__name__ for subclass in cls.__subclasses__()]
@@ -88,7 +134,22 @@ class NumericalParameter(Parameter):
                 )
         super().__setattr__(__name, __value)
 
+    def parse_value(self, raw: Any) -> Any:
+        if isinstance(raw, str):
+            try:
+                return int(raw)
+            except ValueError:
+                raw = float(raw)
+        if isinstance(raw, bool) or not isinstance(raw, (int, float)):
+            raise ValueError(f"Value {raw} is not a number.")
+        if not np.isfinite(raw):
+            raise ValueError(f"Value {raw} is not a finite number.")
+        return raw
+
     def is_value_valid(self, value: Any) -> bool:
+        if isinstance(value, (float, np.floating)) and not np.isfinite(value):
+            print(f"Value must be a finite number.")
+            return False
         if self.value_range is not None:
             if value < self.value_range[0]:
                 print(
@@ -104,6 +165,24 @@ class NumericalParameter(Parameter):
                 return False
         return True
 
+    def validate_values(self, values: Sequence[Any]) -> List[VALUE_CHECK]:
+        array = values if isinstance(values, np.ndarray) else np.asarray(values)
+        if array.dtype.kind in "biuf":
+            numbers = array.astype(float)
+            checks = [(~np.isfinite(numbers), "is not a finite number")]
+        else:
+            is_number = np.fromiter(
+                (isinstance(v, (int, float, np.number)) for v in values), dtype=bool, count=len(values)
+            )
+            numbers = np.fromiter(
+                (v if n else np.nan for v, n in zip(values, is_number)), dtype=float, count=len(values)
+            )
+            checks = [(~is_number, "is not a number"), (is_number & ~np.isfinite(numbers), "is not a finite number")]
+        if self.value_range is not None:
+            checks.append((numbers < self.value_range[0], f"is below the minimum {self.value_range[0]}"))
+            checks.append((numbers > self.value_range[1], f"is above the maximum {self.value_range[1]}"))
+        return checks
+
 
 class BooleanParameter(Parameter):
     description: ClassVar[str] = (
@@ -122,6 +201,23 @@ class BooleanParameter(Parameter):
             raise ValueError(f"Value must be a boolean.")
         return True
 
+    def validate_values(self, values: Sequence[Any]) -> List[VALUE_CHECK]:
+        if isinstance(values, np.ndarray) and values.dtype == bool:
+            return []
+        is_boolean = np.fromiter(
+            (isinstance(v, (bool, np.bool_)) for v in values), dtype=bool, count=len(values)
+        )
+        return [(~is_boolean, "is not a boolean")]
+
+    def parse_value(self, raw: Any) -> Any:
+        if isinstance(raw, str):
+            if raw.strip().lower() in ("true", "1", "yes"):
+                return True
+            if raw.strip().lower() in ("false", "0", "no"):
+                return False
+            raise ValueError(f"Value {raw} is not a boolean.")
+        return raw
+
 
 class EnumParameter(Parameter):
     description: ClassVar[str] = (
@@ -131,6 +227,7 @@ class EnumParameter(Parameter):
     )
     # We need to add a dict that maps the enum names to their values
     value: Optional[str] = None
+    takes_encoded_values: ClassVar[bool] = True
     labels: dict = Field(
         description=(
             "Dictionary of labels and their corresponding values. "
@@ -139,8 +236,37 @@ class EnumParameter(Parameter):
     )
 
     def add_new(self, label: str, value: int) -> None:
+        # Only the rows holding the new label change score when the dataset is evaluated again
         self.labels[label] = value
 
+    def is_value_valid(self, value: Any) -> bool:
+        return value in self.labels
+
+    def score_table(self, categories: Sequence[Any]) -> np.ndarray:
+        """Returns the score of each category of an encoded column, NaN for unknown labels."""
+        labels = self.labels
+        return np.array([labels.get(c, np.nan) for c in categories], dtype=float)
+
+    def validate_values(self, values: Sequence[Any]) -> List[VALUE_CHECK]:
+        encoded = values if isinstance(values, EncodedLabels) else encode_labels(values)
+        labels = self.labels
+        is_unknown = np.array([c not in labels for c in encoded.categories], dtype=bool)
+        return [(is_unknown[encoded.codes], "is not one of the labels")]
+
+    def evaluate_score(self, value: Any) -> float:
+        # The labels map directly to scores
+        return self.labels[value]
+
+    def evaluate_scores(self, values: Sequence[Any]) -> np.ndarray:
+        # A lookup of the code of each value in the score table of the categories
+        encoded = values if isinstance(values, EncodedLabels) else encode_labels(values)
+        return self.score_table(encoded.categories).take(encoded.codes)
+
+    def parse_value(self, raw: Any) -> Any:
+        if raw is None:
+            raise ValueError("Value is missing.")
+        return str(raw)
+
 
 class TimeParameter(Parameter):
     description: ClassVar[str] = (
@@ -163,6 +289,14 @@ class TimeParameter(Parameter):
                 )
         super().__setattr__(__name, __value)
 
+    def parse_value(self, raw: Any) -> Any:
+        if isinstance(raw, str):
+            # ISO format, a date if there is no time part
+            if len(raw) == 10:
+                return date.fromisoformat(raw)
+            return datetime.fromisoformat(raw)
+        return raw
+
     def is_value_valid(self, value: TIME_TYPE) -> bool:
         if not isinstance(value, TIME_TYPE):
             print(f"Value must be a {TIME_TYPE} object.")
@@ -179,3 +313,20 @@ class TimeParameter(Parameter):
                 )
                 return False
         return True
+
+    def validate_values(self, values: Sequence[Any]) -> List[VALUE_CHECK]:
+        if isinstance(values, np.ndarray) and values.dtype.kind == "M":
+            is_time = ~np.isnat(values)
+        else:
+            is_time = np.fromiter((isinstance(v, TIME_TYPE) for v in values), dtype=bool, count=len(values))
+        checks = [(~is_time, f"is not a {TIME_TYPE} object")]
+        if self.value_range is not None:
+            # Dates are compared as datetimes at midnight
+            times = np.zeros(len(values), dtype=np.int64)
+            times[is_time] = to_epoch_microseconds(
+                values[is_time] if isinstance(values, np.ndarray) else [v for v, t in zip(values, is_time) if t]
+            )
+            start, end = to_epoch_microseconds(list(self.value_range))
+            checks.append((is_time & (times < start), f"is before the start time {self.value_range[0]}"))
+            checks.append((is_time & (times > end), f"is after the end time {self.value_range[1]}"))
+        return checks
@@ -0,0 +1,126 @@
+"""
+Pareto frontier (skyline) of the data points of a dataset over the scores of some parameters,
+before any weighting. A data point dominates another if none of its scores is lower and at least
+one is higher, the frontier is made of the data points which are not dominated. Missing scores are
+lower than any score.
+
+The frontier is computed with the sort-filter-skyline algorithm: the data points are sorted by a
+key that grows with every score, so that a data point can only be dominated by data points before
+it, and compared in blocks with the frontier found so far only. The cost is about
+n * frontier size comparisons instead of n * n, in chunks whose memory stays under max_chunk_bytes.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+# Upper bound of the memory used by the comparisons of one block of data points
+MAX_CHUNK_BYTES = 16 * 2**20
+# Number of data points compared with the frontier at a time
+BLOCK_SIZE = 1024
+
+
+def pareto_layers(scores: np.ndarray, layers: int = 1, max_chunk_bytes: int = MAX_CHUNK_BYTES) -> np.ndarray:
+    """Returns the Pareto layer of each row of a (data points, parameters) score matrix, higher scores
+    being better. Layer 0 is the frontier, layer 1 the frontier of the other rows and so on. Rows
+    beyond the first layers have layer -1.
+    """
+    if layers < 1:
+        raise ValueError("At least one Pareto layer is needed")
+    scores = np.asarray(scores, dtype=float)
+    if scores.ndim != 2:
+        raise ValueError("Scores must be a (data points, parameters) matrix")
+    result = np.full(scores.shape[0], -1, dtype=np.intp)
+    if not scores.shape[0]:
+        return result
+
+    # Equal rows are in the same layer and never dominate each other, so only distinct rows are
+    # compared. Their scores are replaced by their dense rank in each column, NaN last.
+    codes = np.empty(scores.shape, dtype=np.int32)
+    for j in range(scores.shape[1]):
+        column = np.where(np.isnan(scores[:, j]), -np.inf, scores[:, j])
+        codes[:, j] = np.unique(column, return_inverse=True)[1].reshape(-1)
+    distinct, row_points = _distinct_rows(codes)
+
+    # A dominating row has a larger sum of ranks, so it comes first in this order
+    order = np.argsort(-distinct.sum(axis=1, dtype=np.int64), kind="stable")
+    distinct = distinct[order]
+    point_layers = np.full(len(distinct), -1, dtype=np.intp)
+    remaining = np.arange(len(distinct))
+    for layer in range(layers):
+        if not len(remaining):
+            break
+        frontier = remaining[_sort_filter_skyline(distinct[remaining], max_chunk_bytes)]
+        point_layers[frontier] = layer
+        remaining = remaining[point_layers[remaining] < 0]
+    result[:] = point_layers[np.argsort(order)][row_points]
+    return result
+
+
+def pareto_frontier(scores: np.ndarray, max_chunk_bytes: int = MAX_CHUNK_BYTES) -> np.ndarray:
+    """Returns the sorted indices of the rows of a score matrix which are not dominated by another row."""
+    return np.flatnonzero(pareto_layers(scores, 1, max_chunk_bytes) == 0)
+
+
+def _distinct_rows(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the distinct rows of a matrix of dense ranks and the position of each row in them."""
+    if not codes.shape[1]:
+        return codes[:1], np.zeros(len(codes), dtype=np.intp)
+    sizes = codes.max(axis=0).astype(np.int64) + 1
+    if np.sum(np.log2(sizes)) < 62:
+        # The ranks of a row fit in one integer, which is much faster to sort than rows
+        keys = np.zeros(len(codes), dtype=np.int64)
+        for j in range(codes.shape[1]):
+            keys = keys * sizes[j] + codes[:, j]
+        _, first, row_points = np.unique(keys, return_index=True, return_inverse=True)
+        return codes[first], row_points.reshape(-1)
+    order = np.lexsort(codes.T[::-1])
+    codes = codes[order]
+    is_first = np.ones(len(codes), dtype=bool)
+    is_first[1:] = (codes[1:] != codes[:-1]).any(axis=1)
+    row_points = np.empty(len(codes), dtype=np.intp)
+    row_points[order] = np.cumsum(is_first) - 1
+    return codes[is_first], row_points
+
+
+def _sort_filter_skyline(points: np.ndarray, max_chunk_bytes: int) -> np.ndarray:
+    """Returns the positions of the non dominated points, which are distinct and ordered so that a
+    point can only be dominated by the points before it. The first BLOCK_SIZE points are filtered
+    with each other, which leaves frontier points only, then every later point dominated by one of
+    them is dropped, and so on with the points left.
+    """
+    frontier: List[np.ndarray] = []
+    remaining = np.arange(len(points))
+    while len(remaining):
+        block, remaining = remaining[:BLOCK_SIZE], remaining[BLOCK_SIZE:]
+        kept = block[~_is_dominated(points[block], points[block], max_chunk_bytes, same=True)]
+        frontier.append(kept)
+        remaining = remaining[~_is_dominated(points[remaining], points[kept], max_chunk_bytes)]
+    return np.concatenate(frontier) if frontier else np.empty(0, dtype=np.intp)
+
+
+def _is_dominated(points: np.ndarray, others: np.ndarray, max_chunk_bytes: int, same: bool = False) -> np.ndarray:
+    """Returns whether each point is dominated by one of the others, which are the points themselves
+    if same. Points are distinct, so a point is dominated by any other point with no lower value.
+    The others are compared in growing chunks, the strongest first, each with the points which are
+    not dominated by the previous chunks.
+    """
+    is_dominated = np.zeros(len(points), dtype=bool)
+    active = np.arange(len(points))
+    start = 0
+    chunk_size = 1
+    while start < len(others) and len(active):
+        # The comparisons of a chunk take one byte per other point and point
+        chunk_size = max(1, min(2 * chunk_size, max_chunk_bytes // len(active)))
+        chunk = others[start:start + chunk_size]
+        is_above = np.ones((len(chunk), len(active)), dtype=bool)
+        for j in range(points.shape[1]):
+            is_above &= chunk[:, j, None] >= points[active, j][None, :]
+        if same:
+            # A point does not dominate itself
+            is_self = (active >= start) & (active < start + len(chunk))
+            is_above[active[is_self] - start, np.flatnonzero(is_self)] = False
+        dominated = is_above.any(axis=0)
+        is_dominated[active[dominated]] = True
+        active = active[~dominated]
+        start += len(chunk)
+    return is_dominated
@@ -0,0 +1,507 @@
+from collections import namedtuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict
+
+import instrumentation
+from helpers import EncodedLabels, column_hash, column_length
+from normalization.normalization import RankIndex, RelativeNormalizer
+from parameter import VALUE_CHECK, Parameter
+from validation import ValidationReport, validate_columns
+
+# What evaluate_dataset does with the rows which have invalid values
+ON_INVALID = ("raise", "skip")
+
+# A relative column kept sorted for incremental scoring: the score fingerprint it was built for,
+# the sorted rank values, the rank value of each row and the rank of each row
+OrderStatistics = namedtuple("OrderStatistics", ["fingerprint", "sorted_values", "row_values", "ranks"])
+
+
+def score_matrix(
+    kernels: Sequence[Callable[[Sequence[Any]], np.ndarray]], value_columns: Sequence[Sequence[Any]]
+) -> np.ndarray:
+    """Normalizes each value column with its kernel, e.g. Parameter.evaluate_scores, one whole
+    column at a time. Returns a (data points, parameters) matrix of scores.
+    """
+    n_rows = column_length(value_columns[0]) if value_columns else 0
+    scores = np.empty((n_rows, len(kernels)), dtype=float)
+    for j, (kernel, values) in enumerate(zip(kernels, value_columns)):
+        scores[:, j] = kernel(values)
+    return scores
+
+
+def weighted_totals(scores: np.ndarray, weights: Sequence[float], weight_sum: float) -> np.ndarray:
+    """Computes the weighted total score of every row of the score matrix.
+    The columns are accumulated in order, which keeps the totals bit-for-bit equal to summing
+    the weighted scores of each data point on its own.
+    """
+    if weight_sum == 0:
+        raise ValueError("The sum of the parameter weights cannot be zero.")
+    totals = np.zeros(scores.shape[0])
+    for j, weight in enumerate(weights):
+        totals += scores[:, j] * weight
+    return totals / weight_sum
+
+
+class ScoringPlan(BaseModel):
+    """
+    The parameters of a model compiled for scoring datasets: their order, the position of each
+    parameter name, the bound scoring and validation methods, the score fingerprints and the
+    weights. A plan is immutable, models compile a new one when their parameters change,
+    see Model.scoring_plan.
+    """
+    model_config = ConfigDict(frozen=True, arbitrary_types_allowed=True)
+
+    names: Tuple[str, ...]
+    positions: Dict[str, int]
+    parameters: Tuple[Parameter, ...]
+    kernels: Tuple[Callable[[Sequence[Any]], np.ndarray], ...]
+    validators: Tuple[Callable[[Sequence[Any]], List[VALUE_CHECK]], ...]
+    # Whether the kernel and validator take the dictionary encoded column, see Parameter.takes_encoded_values
+    encoded: Tuple[bool, ...]
+    # Whether the scores depend on the whole column, see normalization.RelativeNormalizer
+    relative: Tuple[bool, ...]
+    fingerprints: Tuple[str, ...]
+    weights: np.ndarray
+    weight_sum: float
+
+    @classmethod
+    def compile(cls, parameters: Sequence[Parameter]) -> "ScoringPlan":
+        weights = np.array([p.weight for p in parameters], dtype=float)
+        weights.flags.writeable = False
+        return cls(
+            names=tuple(p.name for p in parameters),
+            positions={p.name: j for j, p in enumerate(parameters)},
+            parameters=tuple(parameters),
+            kernels=tuple(p.evaluate_scores for p in parameters),
+            validators=tuple(p.validate_values for p in parameters),
+            encoded=tuple(p.takes_encoded_values for p in parameters),
+            relative=tuple(isinstance(p.normalizer, RelativeNormalizer) for p in parameters),
+            fingerprints=tuple(p.score_fingerprint() for p in parameters),
+            weights=weights,
+            # Summed in order like the reference scoring, for bit-for-bit equal totals
+            weight_sum=sum([p.weight for p in parameters]),
+        )
+
+    @property
+    def normalized_weights(self) -> np.ndarray:
+        return self.weights / self.weight_sum
+
+    def is_current(self, parameters: Sequence[Parameter]) -> bool:
+        """Returns whether the plan still matches the parameters, e.g. after one of them was
+        changed in place instead of through the model.
+        """
+        return (
+            len(parameters) == len(self.parameters)
+            and all(p is q for p, q in zip(parameters, self.parameters))
+            and all(p.weight == w for p, w in zip(parameters, self.weights))
+            and all(p.score_fingerprint() == f for p, f in zip(parameters, self.fingerprints))
+        )
+
+    def column_positions(self, dataset, names: List[str]) -> List[int]:
+        """Checks that the parameters of the dataset are those of the plan
+        and returns the position in the plan of each column.
+        """
+        # 1. The number of parameters of the dataset must be equal to the number of parameters
+        if len(names) != len(self.names):
+            raise ValueError(
+                f"Number of datapoints in {dataset.name} does not match number of parameters"
+                )
+
+        # 2. The name of each parameter of the dataset must be the name of a model parameter
+        for name in names:
+            if name not in self.positions:
+                raise ValueError(
+                    f"Parameter {name} of dataset {dataset.name} not found in model"
+                    )
+        return [self.positions[name] for name in names]
+
+
+def evaluate_dataset(dataset, plan: ScoringPlan, on_invalid: str = "raise") -> ValidationReport:
+    """Validates and scores all data points of the dataset, writing the parameter scores
+    and total scores back to the dataset. Every value is validated, as values may have been edited
+    in place, but only the columns whose stored scores are out of date are normalized again: those
+    whose parameter definition or values changed since they were scored.
+    With on_invalid="raise", a ValueError is raised for the first invalid value. With "skip",
+    the rows with invalid values get NaN scores and the other rows are scored, relative
+    normalizers only taking the valid rows into account. Returns the validation report.
+    """
+    if on_invalid not in ON_INVALID:
+        raise ValueError(f"Unknown on_invalid {on_invalid}, expected one of {ON_INVALID}")
+    names = dataset.parameter_names()
+    if not names:
+        return ValidationReport()
+    positions = plan.column_positions(dataset, names)
+    fingerprints = [plan.fingerprints[k] for k in positions]
+    stored_fingerprints = dataset.score_fingerprints or {}
+
+    with instrumentation.timer("scoring.columns"):
+        names, inputs = _score_inputs(dataset, plan, positions)
+    with instrumentation.timer("scoring.hash"):
+        hashes = [column_hash(values) for values in inputs]
+    stored_hashes = dataset.value_hashes or {}
+    # 3. The values must be validated by the parameter
+    with instrumentation.timer("scoring.validate"):
+        report = validate_columns(names, [plan.validators[k] for k in positions], inputs)
+    if report.rejections and on_invalid == "raise":
+        rejection = report.rejections[0]
+        data_point = dataset.data_points_at([rejection.row])[0]
+        value = next(p.value for p in data_point.parameter_datas if p.name == rejection.parameter)
+        raise ValueError(
+            f"Value {value} is not valid for parameter"
+            f" {rejection.parameter} of dataset {dataset.name}"
+            )
+    if report.rejections:
+        # The rows scored by relative normalizers may have changed, so every column is scored again
+        stale = list(range(len(names)))
+    else:
+        stale = [
+            j for j, (name, fingerprint, value_hash) in enumerate(zip(names, fingerprints, hashes))
+            if stored_fingerprints.get(name) != fingerprint or stored_hashes.get(name) != value_hash
+        ]
+        if any(stored_hashes.get(name) != value_hash for name, value_hash in zip(names, hashes)):
+            # The stored scores may not even have the rows of the values
+            dataset._score_matrix = None
+
+    if stale:
+        with instrumentation.timer("scoring.normalize"):
+            if report.rejections:
+                valid_rows = np.flatnonzero(report.valid_mask())
+                scores = np.full((report.rows, len(names)), np.nan)
+                for j in stale:
+                    scores[valid_rows, j] = plan.kernels[positions[j]](_take(inputs[j], valid_rows))
+            elif len(stale) == len(names):
+                scores = score_matrix([plan.kernels[k] for k in positions], inputs)
+            else:
+                scores = dataset.score_matrix(names).copy()
+                for j in stale:
+                    scores[:, j] = plan.kernels[positions[j]](inputs[j])
+        instrumentation.count("scoring.values_normalized", len(stale) * len(scores))
+    else:
+        scores = dataset.score_matrix(names)
+
+    with instrumentation.timer("scoring.totals"):
+        totals = weighted_totals(scores, plan.weights[positions], plan.weight_sum)
+    if stale:
+        dataset.set_scores(names, scores, totals)
+    else:
+        dataset.set_total_scores(totals)
+    # Scores of rejected rows are not kept, so that they are validated again by the next evaluation
+    dataset.score_fingerprints = None if report.rejections else dict(zip(names, fingerprints))
+    dataset.value_hashes = None if report.rejections else dict(zip(names, hashes))
+    return report
+
+
+def evaluate_dataset_copy(dataset, plan: ScoringPlan, on_invalid: str = "raise"):
+    """Evaluates a copy of a dataset, sent with the scoring plan to a worker process,
+    and returns it with its scores and the validation report.
+    """
+    report = evaluate_dataset(dataset, plan, on_invalid)
+    return dataset, report
+
+
+def update_total_scores(dataset, plan: ScoringPlan) -> bool:
+    """Recomputes only the total scores of the dataset from its stored parameter scores, e.g. after
+    a weight change. Returns False, leaving the dataset untouched, if the stored scores are out of date.
+    """
+    names = dataset.parameter_names()
+    stored_fingerprints = dataset.score_fingerprints
+    if not names or not stored_fingerprints or len(names) != len(plan.names):
+        return False
+    if any(name not in plan.positions for name in names):
+        return False
+    positions = [plan.positions[name] for name in names]
+    if any(stored_fingerprints.get(name) != plan.fingerprints[k] for name, k in zip(names, positions)):
+        return False
+
+    totals = weighted_totals(dataset.score_matrix(names), plan.weights[positions], plan.weight_sum)
+    dataset.set_total_scores(totals)
+    return True
+
+
+class ScoreUpdate(BaseModel):
+    """Rows of a dataset whose scores were changed by adding or deleting data points."""
+    # Whether only the changes were scored, or the whole dataset was evaluated again
+    incremental: bool
+    # Positions of the added rows, after the update
+    added_rows: List[int] = []
+    # Positions of the deleted rows, before the update
+    deleted_rows: List[int] = []
+    # Positions, after the update, of the other rows whose total score or a parameter score changed
+    changed_rows: List[int] = []
+    # Number of changed scores of each parameter, in the other rows
+    changed_scores: Dict[str, int] = {}
+
+
+def add_data_points(dataset, plan: ScoringPlan, data_points: Sequence[Any]) -> ScoreUpdate:
+    """Adds data points to an evaluated dataset and scores them. Only the new rows are scored by
+    absolute normalizers. The ranks of the other rows in relative columns are updated from the
+    sorted column with binary searches, and only their scores are computed again. Raises a
+    ValueError if a new value is invalid, leaving the dataset untouched. If the dataset is not up to
+    date, the data points are added and the whole dataset is evaluated.
+    """
+    if not data_points:
+        return ScoreUpdate(incremental=True)
+    names = dataset.parameter_names()
+    old = _stored_scores(dataset, names)
+    n = len(old[1])
+    added_rows = list(range(n, n + len(data_points)))
+    if not n or not _is_up_to_date(dataset, plan, names):
+        for data_point in data_points:
+            dataset.add_data_point(data_point)
+        evaluate_dataset(dataset, plan)
+        return _score_update(
+            names, False, old, slice(None), _stored_scores(dataset, names), added_rows=added_rows
+        )
+
+    positions = plan.column_positions(dataset, names)
+    new_columns = _value_columns(dataset, names, data_points)
+    report = validate_columns(names, [plan.validators[k] for k in positions], new_columns)
+    if report.rejections:
+        rejection = report.rejections[0]
+        value = new_columns[names.index(rejection.parameter)][rejection.row]
+        raise ValueError(
+            f"Value {value} is not valid for parameter {rejection.parameter} of dataset {dataset.name}"
+        )
+
+    statistics = _order_statistics(dataset, plan, names, positions)
+    scores = np.empty((n + len(data_points), len(names)))
+    scores[:n] = old[0]
+    for j, k in enumerate(positions):
+        if plan.relative[k]:
+            st = statistics[names[j]]
+            new_values = plan.parameters[k].normalizer.rank_values(new_columns[j])
+            sorted_new = np.sort(new_values)
+            sorted_values = np.insert(st.sorted_values, np.searchsorted(st.sorted_values, sorted_new), sorted_new)
+            # Each row moves up by the number of new values below it
+            ranks = np.concatenate([
+                st.ranks + np.searchsorted(sorted_new, st.row_values, side="left"),
+                np.searchsorted(sorted_values, new_values, side="left"),
+            ])
+            statistics[names[j]] = OrderStatistics(
+                st.fingerprint, sorted_values, np.concatenate([st.row_values, new_values]), ranks
+            )
+            scores[:, j] = RankIndex.rank_scores(ranks, len(ranks))
+        else:
+            scores[n:, j] = plan.kernels[k](new_columns[j])
+    instrumentation.count("scoring.values_normalized", len(data_points) * len(names))
+
+    fingerprints = dataset.score_fingerprints
+    for data_point in data_points:
+        dataset.add_data_point(data_point)
+    return _store_update(
+        dataset, plan, names, positions, scores, old, slice(None), fingerprints, statistics,
+        added_rows=added_rows,
+    )
+
+
+def delete_data_points(dataset, plan: ScoringPlan, data_point_names: Sequence[str]) -> ScoreUpdate:
+    """Deletes the data points of the given names from an evaluated dataset. The scores of the
+    absolute normalizers are kept, the ranks in relative columns are updated like in
+    add_data_points. If the dataset is not up to date, the whole dataset is evaluated.
+    """
+    row_names = np.array(dataset.data_point_names(), dtype=object)
+    is_deleted = np.isin(row_names, np.array(list(data_point_names), dtype=object))
+    deleted_rows = np.flatnonzero(is_deleted).tolist()
+    kept_rows = np.flatnonzero(~is_deleted)
+    names = dataset.parameter_names()
+    if not deleted_rows:
+        return ScoreUpdate(incremental=True)
+    up_to_date = _is_up_to_date(dataset, plan, names)
+    old = _stored_scores(dataset, names)
+    fingerprints = dataset.score_fingerprints
+    positions = plan.column_positions(dataset, names) if up_to_date else []
+    statistics = _order_statistics(dataset, plan, names, positions) if up_to_date else {}
+    for name in dict.fromkeys(row_names[deleted_rows].tolist()):
+        dataset.delete_data_point(name)
+    if not len(kept_rows):
+        return ScoreUpdate(incremental=True, deleted_rows=deleted_rows)
+    if not up_to_date:
+        evaluate_dataset(dataset, plan)
+        return _score_update(
+            names, False, old, kept_rows, _stored_scores(dataset, names), deleted_rows=deleted_rows
+        )
+
+    scores = old[0][kept_rows]
+    for j, k in enumerate(positions):
+        if plan.relative[k]:
+            st = statistics[names[j]]
+            deleted_values = np.sort(st.row_values[deleted_rows])
+            row_values = st.row_values[kept_rows]
+            # Each row moves down by the number of deleted values below it
+            ranks = st.ranks[kept_rows] - np.searchsorted(deleted_values, row_values, side="left")
+            # One occurrence of the sorted values is removed for each deleted value
+            first = np.searchsorted(st.sorted_values, deleted_values, side="left")
+            repeat = np.arange(len(deleted_values)) - np.searchsorted(deleted_values, deleted_values, side="left")
+            sorted_values = np.delete(st.sorted_values, first + repeat)
+            statistics[names[j]] = OrderStatistics(st.fingerprint, sorted_values, row_values, ranks)
+            scores[:, j] = RankIndex.rank_scores(ranks, len(ranks))
+    return _store_update(
+        dataset, plan, names, positions, scores, old, kept_rows, fingerprints, statistics,
+        deleted_rows=deleted_rows,
+    )
+
+
+def score_alternatives(
+    plan: ScoringPlan, value_columns: Sequence[Sequence[Any]], dataset=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Scores alternatives which are not in a dataset, given one column of valid values per
+    parameter of the plan, in the plan order. Returns their (alternatives, parameters) score matrix
+    and total scores. With an up to date dataset, relative scores are those the alternatives would
+    get if they were added to it, see add_data_points, and the order statistics of the dataset are
+    kept for the next calls. Otherwise the alternatives are only ranked among themselves.
+    """
+    scores = score_matrix(plan.kernels, value_columns)
+    names = dataset.parameter_names() if dataset is not None else []
+    if any(plan.relative) and names and _is_up_to_date(dataset, plan, names):
+        positions = plan.column_positions(dataset, names)
+        statistics = _order_statistics(dataset, plan, names, positions)
+        dataset._order_statistics = statistics
+        for k, name in enumerate(plan.names):
+            if not plan.relative[k]:
+                continue
+            st = statistics[name]
+            values = plan.parameters[k].normalizer.rank_values(value_columns[k])
+            ranks = np.searchsorted(st.sorted_values, values, side="left") + np.searchsorted(
+                np.sort(values), values, side="left"
+            )
+            scores[:, k] = RankIndex.rank_scores(ranks, len(st.row_values) + len(values))
+    return scores, weighted_totals(scores, plan.weights, plan.weight_sum)
+
+
+def _score_inputs(dataset, plan: ScoringPlan, positions: List[int]) -> Tuple[List[str], List[Sequence[Any]]]:
+    """Returns the parameter names and the value columns of the dataset as the kernels of the plan
+    take them. Labels are scored by their codes, which datasets may keep encoded.
+    """
+    names, value_columns = dataset.columns(encoded=True)
+    inputs = [
+        dataset.encoded_column(names[j], values) if plan.encoded[positions[j]]
+        else dataset.column(names[j], "value") if isinstance(values, EncodedLabels) else values
+        for j, values in enumerate(value_columns)
+    ]
+    return names, inputs
+
+
+def _is_up_to_date(dataset, plan: ScoringPlan, names: List[str]) -> bool:
+    stored_fingerprints = dataset.score_fingerprints
+    return bool(names) and bool(stored_fingerprints) and len(names) == len(plan.names) and all(
+        name in plan.positions and stored_fingerprints.get(name) == plan.fingerprints[plan.positions[name]]
+        for name in names
+    )
+
+
+def _value_columns(dataset, names: List[str], data_points: Sequence[Any]) -> List[List[Any]]:
+    columns = [[] for _ in names]
+    index = {name: j for j, name in enumerate(names)}
+    for data_point in data_points:
+        if sorted(p.name for p in data_point.parameter_datas) != sorted(names):
+            raise ValueError(
+                f"Data points added to dataset {dataset.name} do not have the same parameters "
+                f"as the other data points"
+            )
+        for p in data_point.parameter_datas:
+            columns[index[p.name]].append(p.value)
+    return columns
+
+
+def _stored_scores(dataset, names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # Not copied, scoring replaces the stored arrays instead of writing into them
+    if not names:
+        return np.empty((0, 0)), np.empty(0)
+    return dataset.score_matrix(names), dataset.column("total_score")
+
+
+def _order_statistics(
+    dataset, plan: ScoringPlan, names: List[str], positions: List[int]
+) -> Dict[str, OrderStatistics]:
+    """Returns the order statistics of the relative columns, sorting the columns whose
+    statistics are not kept by the dataset.
+    """
+    statistics = dict(dataset._order_statistics)
+    value_columns = None
+    for j, k in enumerate(positions):
+        if not plan.relative[k]:
+            continue
+        st = statistics.get(names[j])
+        if st is None or st.fingerprint != plan.fingerprints[k]:
+            if value_columns is None:
+                _, value_columns = dataset.columns()
+            row_values = plan.parameters[k].normalizer.rank_values(value_columns[j])
+            statistics[names[j]] = OrderStatistics(
+                plan.fingerprints[k], np.sort(row_values), row_values, RankIndex.column_ranks(row_values)
+            )
+    return statistics
+
+
+def _store_update(
+    dataset,
+    plan: ScoringPlan,
+    names: List[str],
+    positions: List[int],
+    scores: np.ndarray,
+    old: Tuple[np.ndarray, np.ndarray],
+    old_rows: Union[np.ndarray, slice],
+    fingerprints: Dict[str, str],
+    statistics: Dict[str, OrderStatistics],
+    added_rows: Optional[List[int]] = None,
+    deleted_rows: Optional[List[int]] = None,
+) -> ScoreUpdate:
+    """Writes the scores and total scores to the dataset. All total scores are computed again, as
+    the weights may have changed since the dataset was evaluated.
+    """
+    totals = weighted_totals(scores, plan.weights[positions], plan.weight_sum)
+    dataset.set_scores(names, scores, totals)
+    dataset.score_fingerprints = fingerprints
+    dataset.value_hashes = {
+        name: column_hash(values) for name, values in zip(*_score_inputs(dataset, plan, positions))
+    }
+    dataset._order_statistics = statistics
+    # Only the relative scores of the old rows can have changed
+    relative = [j for j, k in enumerate(positions) if plan.relative[k]]
+    return _score_update(
+        names, True, old, old_rows, (scores, totals), relative, added_rows, deleted_rows
+    )
+
+
+def _score_update(
+    names: List[str],
+    incremental: bool,
+    old: Tuple[np.ndarray, np.ndarray],
+    old_rows: Union[np.ndarray, slice],
+    new: Tuple[np.ndarray, np.ndarray],
+    compared: Optional[List[int]] = None,
+    added_rows: Optional[List[int]] = None,
+    deleted_rows: Optional[List[int]] = None,
+) -> ScoreUpdate:
+    """Compares the new scores of the rows which were in the dataset before the update, which come
+    first, with their old scores. Only the score columns in compared are compared, all by default.
+    """
+    compared = list(range(len(names))) if compared is None else compared
+    old_totals = old[1][old_rows]
+    n_old = len(old_totals)
+    totals = new[1][:n_old]
+    is_changed = ~((totals == old_totals) | (np.isnan(totals) & np.isnan(old_totals)))
+    changed_scores = {}
+    for j in compared:
+        old_scores = old[0][old_rows, j]
+        scores = new[0][:n_old, j]
+        is_changed_score = ~((scores == old_scores) | (np.isnan(scores) & np.isnan(old_scores)))
+        if is_changed_score.any():
+            changed_scores[names[j]] = int(is_changed_score.sum())
+            is_changed |= is_changed_score
+    return ScoreUpdate(
+        incremental=incremental,
+        added_rows=added_rows or [],
+        deleted_rows=deleted_rows or [],
+        changed_rows=np.flatnonzero(is_changed).tolist(),
+        changed_scores=changed_scores,
+    )
+
+
+def _take(values: Sequence[Any], rows: np.ndarray) -> Sequence[Any]:
+    if isinstance(values, EncodedLabels):
+        return EncodedLabels(values.codes[rows], values.categories)
+    if isinstance(values, np.ndarray):
+        return values[rows]
+    return [values[i] for i in rows]
@@ -0,0 +1,183 @@
+from collections import namedtuple
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict
+
+import scoring
+from dataset import Dataset
+from model import Model
+
+if TYPE_CHECKING:
+    from pandas import DataFrame as df
+
+# Weight of a parameter at which the best data point changes, when only that weight is changed.
+# None if no weight in that direction, down to zero or up to infinity, changes the best data point.
+RankFlip = namedtuple(
+    "RankFlip", ["parameter", "weight", "lower_weight", "lower_best", "upper_weight", "upper_best"]
+)
+
+# Upper bound of the memory used by the totals and ranks of one chunk of weight samples
+MAX_CHUNK_BYTES = 64 * 2**20
+
+
+class SensitivityReport(BaseModel):
+    """
+    Distribution of the rank of each data point of a dataset, when the weights of the parameters
+    are sampled around their values. Rank 0 is the best. Arrays are indexed like the data points.
+    rank_histogram counts, for each data point, the samples in each of n_bins equal rank intervals.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    names: List[Optional[str]]
+    n_samples: int
+    spread: float
+    ranks: np.ndarray
+    mean_ranks: np.ndarray
+    std_ranks: np.ndarray
+    min_ranks: np.ndarray
+    max_ranks: np.ndarray
+    p_best: np.ndarray
+    rank_histogram: np.ndarray
+    rank_flips: List[RankFlip]
+
+    def dataframe(self) -> "df":
+        """Returns the rank statistics of the data points, in the order of their current rank."""
+        from pandas import DataFrame as df
+
+        frame = df(
+            {
+                "rank": self.ranks,
+                "mean_rank": self.mean_ranks,
+                "std_rank": self.std_ranks,
+                "min_rank": self.min_ranks,
+                "max_rank": self.max_ranks,
+                "p_best": self.p_best,
+            },
+            index=self.names,
+        )
+        return frame.iloc[np.argsort(self.ranks)]
+
+
+def sample_weights(
+    weights: np.ndarray, n_samples: int, spread: float = 0.2, rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """Returns n_samples weight vectors, each weight scaled by an independent uniform factor
+    in [1 - spread, 1 + spread].
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return weights * rng.uniform(1 - spread, 1 + spread, size=(n_samples, len(weights)))
+
+
+def ranks_of(totals: np.ndarray) -> np.ndarray:
+    """Returns the rank of each data point in each row of a (samples, data points) matrix of totals.
+    The highest total has rank 0, ties are ranked in the order of the data points.
+    """
+    # Sorting contiguous rows is about twice as fast as sorting the columns of the transposed matrix
+    order = np.argsort(-totals, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(totals.shape[1])[None, :], axis=1)
+    return ranks
+
+
+def analyze_weights(
+    model: Model,
+    dataset: Dataset,
+    n_samples: int = 1000,
+    spread: float = 0.2,
+    seed: Optional[int] = None,
+    n_bins: int = 100,
+    max_chunk_bytes: int = MAX_CHUNK_BYTES,
+) -> SensitivityReport:
+    """Samples n_samples weight vectors around the weights of the model and ranks the data points
+    of the dataset for each of them. The dataset is evaluated first, which reuses its scores if they
+    are up to date. The samples are ranked in chunks, so that the memory used stays under
+    max_chunk_bytes whatever the number of samples.
+    """
+    if n_samples < 1:
+        raise ValueError("At least one weight sample is needed")
+    plan = model.scoring_plan()
+    scoring.evaluate_dataset(dataset, plan)
+    names = dataset.parameter_names()
+    if not names:
+        raise ValueError(f"Dataset {dataset.name} has no data points")
+    scores = dataset.score_matrix(names)
+    weights = plan.weights[[plan.positions[name] for name in names]]
+    n = scores.shape[0]
+    n_bins = min(n_bins, n)
+
+    rank_sums = np.zeros(n)
+    rank_square_sums = np.zeros(n)
+    min_ranks = np.full(n, n - 1)
+    max_ranks = np.zeros(n, dtype=np.intp)
+    best_counts = np.zeros(n, dtype=np.int64)
+    rank_histogram = np.zeros(n * n_bins, dtype=np.int64)
+    bin_offsets = np.arange(n) * n_bins
+
+    rng = np.random.default_rng(seed)
+    # The totals, their order, the ranks and the histogram bins of a chunk are 8 bytes per cell each
+    chunk_size = max(1, max_chunk_bytes // (32 * n))
+    for start in range(0, n_samples, chunk_size):
+        samples = sample_weights(weights, min(chunk_size, n_samples - start), spread, rng)
+        totals = (samples / samples.sum(axis=1, keepdims=True)) @ scores.T
+        ranks = ranks_of(totals)
+        rank_sums += ranks.sum(axis=0)
+        rank_square_sums += (ranks.astype(float) ** 2).sum(axis=0)
+        np.minimum(min_ranks, ranks.min(axis=0), out=min_ranks)
+        np.maximum(max_ranks, ranks.max(axis=0), out=max_ranks)
+        best_counts += np.bincount(np.argmin(ranks, axis=1), minlength=n)
+        rank_histogram += np.bincount((bin_offsets + ranks * n_bins // n).ravel(), minlength=n * n_bins)
+
+    mean_ranks = rank_sums / n_samples
+    totals = scoring.weighted_totals(scores, weights, weights.sum())
+    return SensitivityReport(
+        names=dataset.data_point_names(),
+        n_samples=n_samples,
+        spread=spread,
+        ranks=ranks_of(totals[None, :])[0],
+        mean_ranks=mean_ranks,
+        std_ranks=np.sqrt(np.maximum(rank_square_sums / n_samples - mean_ranks**2, 0)),
+        min_ranks=min_ranks,
+        max_ranks=max_ranks,
+        p_best=best_counts / n_samples,
+        rank_histogram=rank_histogram.reshape(n, n_bins),
+        rank_flips=rank_flips(dataset, scores, names, weights),
+    )
+
+
+def rank_flips(dataset: Dataset, scores: np.ndarray, names: List[str], weights: np.ndarray) -> List[RankFlip]:
+    """Computes, for each parameter, the closest weights below and above its current weight at which
+    another data point becomes the best one, the other weights staying the same.
+    Changing a weight by d changes the weighted sum of data point i by d * scores[i, j], and the sum
+    of the weights equally for all data points, so the best data point b is overtaken by i when
+    d * (scores[i, j] - scores[b, j]) exceeds the difference of their weighted sums.
+    """
+    weighted_sums = scores @ weights
+    best = int(np.argmax(weighted_sums))
+    data_point_names = dataset.data_point_names()
+    flips = []
+    for j, name in enumerate(names):
+        slopes = scores[:, j] - scores[best, j]
+        gaps = weighted_sums[best] - weighted_sums
+        with np.errstate(divide="ignore", invalid="ignore"):
+            deltas = gaps / slopes
+        # Only data points whose weighted sum grows relative to the best one in that direction
+        upper = np.where(slopes > 0, deltas, np.inf)
+        lower = np.where((slopes < 0) & (weights[j] + deltas >= 0), deltas, -np.inf)
+        upper[best] = np.inf
+        lower[best] = -np.inf
+        i_upper = int(np.argmin(upper))
+        i_lower = int(np.argmax(lower))
+        has_upper = np.isfinite(upper[i_upper])
+        has_lower = np.isfinite(lower[i_lower])
+        flips.append(
+            RankFlip(
+                parameter=name,
+                weight=float(weights[j]),
+                lower_weight=float(weights[j] + lower[i_lower]) if has_lower else None,
+                lower_best=data_point_names[i_lower] if has_lower else None,
+                upper_weight=float(weights[j] + upper[i_upper]) if has_upper else None,
+                upper_best=data_point_names[i_upper] if has_upper else None,
+            )
+        )
+    return flips
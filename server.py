@@ -0,0 +1,378 @@
+"""
+Local scoring server. Models are loaded once, with their scoring plans and their datasets evaluated
+in memory, and score alternatives which are not in a dataset. A model is loaded again when one of
+its files, or the files of its datasets, changed.
+
+    ./cli.py serve [--port 8765] [--model <name> ...]
+
+Endpoints, all answering json:
+
+    GET  /models                                      loaded models
+    GET  /models/<model>                              parameters and datasets of a model
+    POST /models/<model>/score                        scores of alternatives
+    POST /models/<model>/rank                         alternatives ordered by total score, ranked in a dataset
+    GET  /models/<model>/datasets/<dataset>/top?k=10  best data points of a dataset, by= a parameter score
+    GET  /stats                                       request latency percentiles and loaded models
+
+The body of score and rank is {"alternatives": [{"name": ..., "<parameter>": <value>, ...}],
+"dataset": <dataset>}. Values are parsed like imported rows, see ingestion.parse_rows. With a
+dataset, relative scores are those the alternatives would get if they were added to it, see
+scoring.score_alternatives. The dataset is optional for score and required for rank.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+
+import ingestion
+import scoring
+from dataset import DataPoint, Dataset, loaded_dataset
+from model import Model
+from validation import ValidationReport
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Number of most recent requests of each endpoint whose latency is kept
+LATENCY_WINDOW = 10_000
+LATENCY_PERCENTILES = (50, 90, 99)
+
+# Model.__init__ sets the class wide parameter storage folder, so models are loaded one at a time
+_load_lock = threading.Lock()
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class LoadedModel:
+    """A model with its scoring plan and its datasets loaded and evaluated, which are only read
+    once loaded. A changed model is loaded again as a new LoadedModel.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.signature = file_signature(name)
+        self.loaded_at = time.time()
+        with _load_lock:
+            self.model = Model.load_binary(name)
+        self.model.load_datasets()
+        self.plan = self.model.scoring_plan()
+        self.datasets: Dict[str, Dataset] = {}
+        # Invalid data points are not scored, instead of failing to load the model
+        self.reports: Dict[str, ValidationReport] = {}
+        for handle in self.model.datasets or []:
+            d = loaded_dataset(handle)
+            self.reports[d.name] = scoring.evaluate_dataset(d, self.plan, on_invalid="skip")
+            self.datasets[d.name] = d
+        self._sorted_totals: Dict[str, np.ndarray] = {}
+
+    def dataset(self, name: str) -> Dataset:
+        if name not in self.datasets:
+            raise HttpError(404, f"Dataset {name} not found in model {self.name}")
+        return self.datasets[name]
+
+    def sorted_totals(self, dataset_name: str) -> np.ndarray:
+        """Returns the total scores of a dataset which are not missing, sorted in ascending order."""
+        if dataset_name not in self._sorted_totals:
+            totals = self.dataset(dataset_name).column("total_score")
+            self._sorted_totals[dataset_name] = np.sort(totals[~np.isnan(totals)])
+        return self._sorted_totals[dataset_name]
+
+    def score(self, alternatives: List[Dict[str, Any]], dataset_name: Optional[str]) -> List[Dict[str, Any]]:
+        """Scores alternatives, raising an HttpError 400 listing the invalid values, if any."""
+        d = self.dataset(dataset_name) if dataset_name is not None else None
+        if not isinstance(alternatives, list) or not all(isinstance(a, dict) for a in alternatives):
+            raise HttpError(400, "alternatives must be a list of objects")
+        parameters = list(self.plan.parameters)
+        _, value_columns, rejections = ingestion.parse_rows(alternatives, parameters, list(self.plan.names))
+        if rejections:
+            raise HttpError(400, "\n".join(
+                f"Alternative {r.row}: {r.parameter} {r.reason}" for r in rejections
+            ))
+        scores, totals = scoring.score_alternatives(self.plan, value_columns, d)
+        return [
+            {
+                "name": alternative.get("name"),
+                "total_score": _score(total),
+                "scores": {name: _score(s) for name, s in zip(self.plan.names, row)},
+            }
+            for alternative, row, total in zip(alternatives, scores.tolist(), totals.tolist())
+        ]
+
+    def rank(self, alternatives: List[Dict[str, Any]], dataset_name: str) -> List[Dict[str, Any]]:
+        """Scores alternatives and orders them by total score. The rank of an alternative is the
+        number of data points of the dataset with a higher total score.
+        """
+        scored = self.score(alternatives, dataset_name)
+        sorted_totals = self.sorted_totals(dataset_name)
+        totals = np.array([s["total_score"] for s in scored], dtype=float)
+        ranks = len(sorted_totals) - np.searchsorted(sorted_totals, totals, side="right")
+        for s, rank in zip(scored, ranks.tolist()):
+            s["rank"] = rank
+        return sorted(scored, key=lambda s: s["rank"])
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "loaded_at": self.loaded_at,
+            "parameters": [{"name": p.name, "weight": p.weight} for p in self.plan.parameters],
+            "datasets": [
+                {"name": name, "rows": self.reports[name].rows, "rejected_rows": len(self.reports[name].rejected_rows())}
+                for name in self.datasets
+            ],
+        }
+
+
+class ModelCache:
+    """Loaded models by name. A model is checked for changes on use, at most once every
+    check_interval seconds, and loaded again if its files changed.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self.reloads: Dict[str, int] = {}
+        self._models: Dict[str, LoadedModel] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> LoadedModel:
+        now = time.monotonic()
+        loaded = self._models.get(name)
+        if loaded is not None and now - self._checked_at[name] < self.check_interval:
+            return loaded
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        # Requests for other models are not blocked while this one is loaded
+        with lock:
+            loaded = self._models.get(name)
+            if loaded is None or (
+                now - self._checked_at[name] >= self.check_interval and file_signature(name) != loaded.signature
+            ):
+                if not os.path.isfile(_model_path(name)):
+                    raise HttpError(404, f"Model {name} not found")
+                reloaded = loaded is not None
+                loaded = LoadedModel(name)
+                if reloaded:
+                    self.reloads[name] = self.reloads.get(name, 0) + 1
+            self._checked_at[name] = time.monotonic()
+            self._models[name] = loaded
+            return loaded
+
+    def names(self) -> List[str]:
+        return list(self._models)
+
+
+class LatencyRecorder:
+    """The latencies of the last LATENCY_WINDOW requests of each endpoint."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+            self._counts[endpoint] = self._counts.get(endpoint, 0) + 1
+            self._errors[endpoint] = self._errors.get(endpoint, 0) + error
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            latencies = {endpoint: np.array(l) for endpoint, l in self._latencies.items()}
+            counts = dict(self._counts)
+            errors = dict(self._errors)
+        stats = {}
+        for endpoint, seconds in latencies.items():
+            milliseconds = np.percentile(seconds * 1000, LATENCY_PERCENTILES)
+            stats[endpoint] = {
+                "requests": counts[endpoint],
+                "errors": errors[endpoint],
+                **{f"p{p}_ms": float(ms) for p, ms in zip(LATENCY_PERCENTILES, milliseconds)},
+                "max_ms": float(seconds.max() * 1000),
+            }
+        return stats
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, check_interval: float = 1.0, verbose: bool = False
+    ):
+        super().__init__((host, port), _Handler)
+        self.models = ModelCache(check_interval)
+        self.latencies = LatencyRecorder()
+        self.verbose = verbose
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uptime_seconds": time.time() - self.latencies.started_at,
+            "endpoints": self.latencies.stats(),
+            "models": {name: {"reloads": self.models.reloads.get(name, 0)} for name in self.models.names()},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: ScoringServer
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def _handle(self, method: str) -> None:
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        endpoint = _endpoint(method, parts)
+        try:
+            if endpoint is None:
+                raise HttpError(404, f"No endpoint {method} {url.path}")
+            status, body = 200, self._dispatch(endpoint, parts, parse_qs(url.query))
+        except HttpError as e:
+            status, body = e.status, {"error": str(e)}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        # Recorded before responding, so that the request is in the stats as soon as it is answered
+        self.server.latencies.record(endpoint or "unknown", time.perf_counter() - start, status != 200)
+        self._respond(status, body)
+
+    def _dispatch(self, endpoint: str, parts: List[str], query: Dict[str, List[str]]) -> Any:
+        if endpoint == "stats":
+            return self.server.stats()
+        if endpoint == "models":
+            return {"models": self.server.models.names()}
+        loaded = self.server.models.get(parts[1])
+        if endpoint == "model":
+            return loaded.describe()
+        if endpoint == "top":
+            k = int(query.get("k", ["10"])[0])
+            by = query.get("by", ["total_score"])[0]
+            d = loaded.dataset(parts[3])
+            if by != "total_score" and by not in d.parameter_names():
+                raise HttpError(400, f"Parameter {by} not found in dataset {d.name}")
+            return {"data_points": [_data_point(dp) for dp in d.top_k(k, by)]}
+        request = self._json_body()
+        alternatives = request.get("alternatives", [])
+        dataset_name = request.get("dataset")
+        if endpoint == "score":
+            return {"alternatives": loaded.score(alternatives, dataset_name)}
+        if dataset_name is None:
+            raise HttpError(400, "Ranking alternatives needs a dataset")
+        return {"alternatives": loaded.rank(alternatives, dataset_name)}
+
+    def _json_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise HttpError(400, f"Invalid json body: {e}")
+        if not isinstance(body, dict):
+            raise HttpError(400, "The json body must be an object")
+        return body
+
+    def _respond(self, status: int, body: Any) -> None:
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def file_signature(model_name: str) -> Tuple[Tuple[str, int, int], ...]:
+    """Returns the path, modification time and size of the files of a model, its parameters and
+    catalog included, and of the files of its datasets.
+    """
+    paths = _files(f"{Model.storage_folder}/{model_name}")
+    for name in Model.load_catalog(model_name):
+        paths.append(f"{Dataset.storage_folder}/{name}.json")
+        paths.extend(_files(Dataset.columns_path(name)))
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    model_names: Optional[List[str]] = None,
+    check_interval: float = 1.0,
+    verbose: bool = False,
+) -> None:
+    """Loads the models and serves requests until interrupted."""
+    server = ScoringServer(host, port, check_interval, verbose)
+    for name in model_names or []:
+        server.models.get(name)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _endpoint(method: str, parts: List[str]) -> Optional[str]:
+    if method == "GET" and parts == ["stats"]:
+        return "stats"
+    if parts[:1] != ["models"]:
+        return None
+    if method == "GET" and len(parts) == 1:
+        return "models"
+    if method == "GET" and len(parts) == 2:
+        return "model"
+    if method == "POST" and len(parts) == 3 and parts[2] in ("score", "rank"):
+        return parts[2]
+    if method == "GET" and len(parts) == 5 and parts[2] == "datasets" and parts[4] == "top":
+        return "top"
+    return None
+
+
+def _model_path(name: str) -> str:
+    return f"{Model.storage_folder}/{name}/{name}.bin"
+
+
+def _files(path: str) -> List[str]:
+    files = []
+    for folder, _, names in os.walk(path):
+        files.extend(os.path.join(folder, name) for name in names)
+    return sorted(files)
+
+
+def _score(score: Optional[float]) -> Optional[float]:
+    # Missing scores are null in json
+    return None if score is None or math.isnan(score) else score
+
+
+def _data_point(data_point: DataPoint) -> Dict[str, Any]:
+    return {
+        "name": data_point.name,
+        "total_score": _score(data_point.total_score),
+        "values": {p.name: p.value for p in data_point.parameter_datas},
+        "scores": {p.name: _score(p.score) for p in data_point.parameter_datas},
+    }
@@ -1,11 +1,14 @@
+import datetime
 import json
 import os
 import pathlib
 import pickle
-from typing import ClassVar
+from typing import Any, ClassVar, Dict
 from pydantic import BaseModel
 import shutil
 
+import instrumentation
+
 
 class Storable(BaseModel):
     name: str
@@ -17,28 +20,33 @@ class Storable(BaseModel):
     def store_binary(self) -> None:
         folder_location = self.get_path() + "/" + self.name
         pathlib.Path(folder_location).parent.mkdir(parents=True, exist_ok=True)
-        with open(folder_location + ".bin", 'wb+') as f:
+        with instrumentation.timer("storable.store_binary"), open(folder_location + ".bin", 'wb+') as f:
             pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        instrumentation.count("storable.files_written")
 
     def store_json(self) -> None:
         pathlib.Path(self.get_path()).parent.mkdir(parents=True, exist_ok=True)
-        with open(self.get_path() + ".json", 'w+') as f:
+        with instrumentation.timer("storable.store_json"), open(self.get_path() + ".json", 'w+') as f:
             data = self.model_dump()
-            json.dump(data, f, indent=4)
+            json.dump(data, f, indent=4, default=_json_default)
+        instrumentation.count("storable.files_written")
 
     @classmethod
     def load_binary(cls, name: str):
         # Used only by models
         with open(f"{cls.storage_folder}/{name}/{name}.bin", 'rb') as f:
-            m = pickle.load(f)
+            with instrumentation.timer("storable.unpickle"):
+                m = pickle.load(f)
+            instrumentation.count("storable.files_read")
             m.__init__(**m.__dict__)
             return m
 
     @classmethod
     def load_json(cls, name: str):
-        with open(f"{cls.storage_folder}/{name}.json", 'r') as f:
-            d = json.load(f)
-            return d
+        with instrumentation.timer("storable.load_json"), open(f"{cls.storage_folder}/{name}.json", 'r') as f:
+            d = json.load(f, object_hook=_json_object_hook)
+        instrumentation.count("storable.files_read")
+        return d
 
     @classmethod
     def delete_binary(cls, name: str) -> None:
@@ -48,3 +56,22 @@ class Storable(BaseModel):
     @classmethod
     def delete_json(cls, name: str) -> None:
         os.remove(f"{cls.storage_folder}//{name}.json")
+
+
+def _json_default(value: Any) -> Any:
+    # Dates and datetimes, e.g. time values of datasets, are stored in ISO format and tagged with
+    # their type, so that they are loaded back as dates and not as strings, see _json_object_hook
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def _json_object_hook(d: Dict[str, Any]) -> Any:
+    if len(d) == 1:
+        if "__datetime__" in d:
+            return datetime.datetime.fromisoformat(d["__datetime__"])
+        if "__date__" in d:
+            return datetime.date.fromisoformat(d["__date__"])
+    return d
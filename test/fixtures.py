@@ -0,0 +1,84 @@
+"""Parameters, datasets and storage shared by the tests."""
+import random
+import shutil
+import tempfile
+import unittest
+from typing import List, Optional
+
+import dataset
+import normalization.normalization as normalization
+import parameter
+from model import Model
+
+
+def create_test_parameters():
+    return [
+        parameter.NumericalParameter(
+            name="price",
+            unit="EUR",
+            weight=2.5,
+            value_range=(0, 5000),
+            normalizer=normalization.StepLinearNegative(threshold_low=500, threshold_high=3000),
+        ),
+        parameter.NumericalParameter(
+            name="year",
+            unit="year",
+            weight=0.7,
+            normalizer=normalization.StepLinearPositive(threshold_low=1990, threshold_high=2020),
+        ),
+        parameter.NumericalParameter(
+            name="rating",
+            unit="stars",
+            weight=1.3,
+            normalizer=normalization.Step(threshold=3),
+        ),
+        parameter.BooleanParameter(name="in_stock", unit="", weight=0.1),
+    ]
+
+
+def create_test_dataset(n_data_points: int, seed: int = 0) -> dataset.Dataset:
+    rng = random.Random(seed)
+    data_points = []
+    for i in range(n_data_points):
+        data_points.append(
+            dataset.DataPoint(
+                name=f"guitar {i}",
+                parameter_datas=[
+                    dataset.ParameterData(name="price", value=rng.uniform(0, 5000), score=0),
+                    dataset.ParameterData(name="year", value=rng.randint(1970, 2023), score=0),
+                    dataset.ParameterData(name="rating", value=rng.randint(0, 5), score=0),
+                    dataset.ParameterData(name="in_stock", value=rng.random() < 0.5, score=0),
+                ],
+                total_score=0,
+            )
+        )
+    return dataset.Dataset(name="Guitars", description="Guitars", data_points=data_points)
+
+
+class StorageTestCase(unittest.TestCase):
+    """Stores the models and datasets of each test in a temporary folder."""
+
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.model_storage_folder = Model.storage_folder
+        self.dataset_storage_folder = dataset.Dataset.storage_folder
+        Model.storage_folder = self.storage + "/model/"
+        dataset.Dataset.storage_folder = self.storage + "/dataset/"
+
+    def tearDown(self):
+        Model.storage_folder = self.model_storage_folder
+        dataset.Dataset.storage_folder = self.dataset_storage_folder
+        shutil.rmtree(self.storage)
+
+    def create_model(
+        self,
+        n_data_points: int = 200,
+        ds: Optional[dataset.Dataset] = None,
+        parameters: Optional[List[parameter.Parameter]] = None,
+    ) -> Model:
+        """Returns a model named Guitars of the test parameters and one stored test dataset."""
+        ds = create_test_dataset(n_data_points) if ds is None else ds
+        ds.store_json()
+        return Model(
+            name="Guitars", parameters=create_test_parameters() if parameters is None else parameters, datasets=[ds]
+        )
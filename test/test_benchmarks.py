@@ -0,0 +1,23 @@
+import json
+import unittest
+
+from benchmarks import suite, synthetic
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_synthetic_dataset(self):
+        ds = synthetic.synthetic_dataset(100, seed=1)
+        self.assertEqual(len(ds.data_point_names()), 100)
+        self.assertEqual(ds.parameter_names(), [p.name for p in synthetic.synthetic_parameters()])
+        self.assertEqual(synthetic.synthetic_row_dataset(100, seed=1).data_points, list(ds.iter_data_points()))
+
+    def test_suite(self):
+        results = suite.Suite(repeat=1).run([200])
+        benchmarks = {r["benchmark"] for r in results}
+        self.assertIn("evaluate_dataset columnar", benchmarks)
+        self.assertIn("load json rows", benchmarks)
+        self.assertTrue(all(r["rows"] == 200 and r["seconds"] >= 0 for r in results))
+        json.dumps(results)
+
+        results = suite.Suite(repeat=1, only="top_k").run([200])
+        self.assertEqual([r["benchmark"] for r in results], ["top_k 10"])
@@ -1,9 +1,16 @@
 import copy
+import datetime
+import json
 import os
 import shutil
+import tempfile
 import unittest
 
 import dataset
+import helpers
+import normalization.normalization as normalization
+import parameter
+import scoring
 
 
 class TestDataset(unittest.TestCase):
@@ -100,7 +107,320 @@ class TestDataset(unittest.TestCase):
         ds2.from_dataframe(df)
         self.assertTrue(all(ds.dataframe() == ds2.dataframe()))
 
+    def test_dataframe_cache(self):
+        ds = self.create_test_dataset()
+        df = ds.dataframe()
+        self.assertEqual(ds.dataframe_cache_info(), (0, 1, True))
+        ds.dataframe()
+        df.loc["Gibson Les Paul", "total_score"] = 100
+        self.assertNotEqual(ds.dataframe().loc["Gibson Les Paul", "total_score"], 100)
+        self.assertEqual(ds.dataframe_cache_info(), (2, 1, True))
+
+        ds.delete_data_point("Gibson Les Paul")
+        self.assertEqual(ds.dataframe_cache_info(), (2, 1, False))
+        self.assertEqual(ds.dataframe().shape, (1, 5))
+        self.assertEqual(ds.dataframe_cache_info(), (2, 2, True))
+
+    def test_multiindex_dataframe(self):
+        ds = self.create_test_dataset()
+        ds.add_data_point(
+            dataset.DataPoint(
+                name="Ibanez mtm 1",
+                parameter_datas=[
+                    dataset.ParameterData(name="price", value=450, score=80),
+                    dataset.ParameterData(name="year", value=2009, score=20),
+                    dataset.ParameterData(name="color", value="Black", score=0),
+                    dataset.ParameterData(name="condition", value="As new", score=100),
+                ],
+                total_score=15,
+            )
+        )
+        df = ds.dataframe(multiindex=True)
+        self.assertEqual(df.shape, (3, 9))
+        self.assertEqual(list(df.columns[:2]), [("price", "value"), ("price", "score")])
+        self.assertEqual(df[("price", "value")].dtype, int)
+        self.assertEqual(df[("condition", "score")].dtype, float)
+        self.assertEqual(df.xs("score", axis=1, level=1).max().to_dict()["condition"], 100)
+
+        ds2 = dataset.Dataset(name="TestDataset2", description="TestDataset2 description")
+        ds2.from_dataframe(df)
+        self.assertEqual(ds2.data_points, ds.data_points)
+
+        ordered = ds.order_by_parameter_score("condition", ascending=False)
+        self.assertEqual(list(ordered.index), ["Ibanez mtm 1", "Gibson Les Paul", "Fender telecaster"])
+        self.assertEqual(list(ordered.columns), list(ds.dataframe().columns))
+        ordered = ds.order_by_parameter_value("price", multiindex=True)
+        self.assertEqual(list(ordered.index), ["Ibanez mtm 1", "Gibson Les Paul", "Fender telecaster"])
+        # Equal values are ordered by their scores
+        ordered = ds.order_by_parameter_value("condition", ascending=False)
+        self.assertEqual(list(ordered.index), ["Ibanez mtm 1", "Gibson Les Paul", "Fender telecaster"])
+
+    def test_multiindex_dataframe_dates(self):
+        ds = dataset.ColumnarDataset(name="Dates")
+        days = [datetime.date(2021, 1, 2), datetime.date(2021, 1, 1)]
+        times = [datetime.datetime(2021, 1, 1, 12), datetime.datetime(2021, 1, 1)]
+        for i, (day, time) in enumerate(zip(days, times)):
+            ds.add_data_point(
+                dataset.DataPoint(
+                    name=str(i),
+                    parameter_datas=[
+                        dataset.ParameterData(name="day", value=day, score=None),
+                        dataset.ParameterData(name="time", value=time, score=None),
+                    ],
+                )
+            )
+        df = ds.dataframe(multiindex=True)
+        self.assertEqual(df[("day", "value")].dtype.kind, "M")
+        ds2 = dataset.Dataset(name="Dates2")
+        ds2.from_dataframe(df)
+        self.assertEqual([dp.parameter_datas[0].value for dp in ds2.data_points], days)
+        self.assertIs(type(ds2.data_points[0].parameter_datas[0].value), datetime.date)
+        self.assertEqual([dp.parameter_datas[1].value for dp in ds2.data_points], times)
+        self.assertEqual(list(ds.order_by_parameter_value("day").index), ["1", "0"])
+
+    def test_top_k_and_page(self):
+        ds = self.create_test_dataset()
+        for i, dp in enumerate(ds.data_points):
+            dp.total_score = 10 * i
+        ds.add_data_point(
+            dataset.DataPoint(
+                name="Ibanez mtm 1",
+                parameter_datas=[
+                    dataset.ParameterData(name="price", value=450, score=80),
+                    dataset.ParameterData(name="year", value=2009, score=20),
+                    dataset.ParameterData(name="color", value="Black", score=0),
+                    dataset.ParameterData(name="condition", value="As new", score=100),
+                ],
+                total_score=15,
+            )
+        )
+        for d in (ds, dataset.ColumnarDataset.from_dataset(ds)):
+            self.assertEqual(
+                [dp.name for dp in d.top_k(2)], ["Ibanez mtm 1", "Fender telecaster"]
+            )
+            self.assertEqual(
+                [dp.name for dp in d.top_k(1, by="price", kind="value", ascending=True)],
+                ["Ibanez mtm 1"],
+            )
+            self.assertEqual(
+                [dp.name for dp in d.top_k(2, by="color", kind="value")],
+                ["Gibson Les Paul", "Fender telecaster"],
+            )
+            self.assertEqual(
+                [dp.name for dp in d.page(1, 5, by="condition")],
+                ["Gibson Les Paul", "Fender telecaster"],
+            )
+            self.assertEqual(d.top_k(3)[0], ds.data_points[2])
+
     # after all tests
     @classmethod
     def tearDownClass(cls):
         shutil.rmtree("./test/dataset/")
+
+
+class TestColumnarDataset(unittest.TestCase):
+    def create_test_dataset(self):
+        return TestDataset.create_test_dataset(self)
+
+    def test_columnar_dataset(self):
+        ds = self.create_test_dataset()
+        cds = dataset.ColumnarDataset.from_dataset(ds)
+        self.assertIsNone(cds.data_points)
+        self.assertEqual(cds.data_point_names(), ["Gibson Les Paul", "Fender telecaster"])
+
+        names, columns = cds.columns()
+        self.assertEqual(names, ["price", "year", "color", "condition"])
+        self.assertEqual(columns[0].dtype, int)
+        self.assertEqual(columns[2].dtype, object)
+        self.assertTrue(all(cds.dataframe() == ds.dataframe()))
+
+        dp = copy.deepcopy(ds.data_points[0])
+        dp.name = "Gibson Les Paul 2"
+        cds.add_data_point(dp)
+        self.assertEqual(len(cds.dataframe()), 3)
+        cds.delete_data_point("Gibson Les Paul")
+        self.assertEqual(cds.data_point_names(), ["Fender telecaster", "Gibson Les Paul 2"])
+        self.assertEqual(cds.to_dataset().data_points[1], dp)
+
+    def test_columnar_dataset_json(self):
+        ds = self.create_test_dataset()
+        cds = dataset.ColumnarDataset.from_dataset(ds)
+        storage_folder = dataset.Dataset.storage_folder
+        dataset.Dataset.storage_folder = tempfile.mkdtemp()
+        try:
+            cds.store_json()
+            loaded = dataset.Dataset(**dataset.Dataset.load_json("TestDataset"))
+            self.assertEqual(loaded.data_points, list(cds.iter_data_points()))
+            loaded = dataset.ColumnarDataset(**dataset.Dataset.load_json("TestDataset"))
+            self.assertTrue(all(loaded.dataframe() == ds.dataframe()))
+        finally:
+            shutil.rmtree(dataset.Dataset.storage_folder)
+            dataset.Dataset.storage_folder = storage_folder
+
+    def test_dataset_json_dates(self):
+        parameters = [
+            parameter.TimeParameter(
+                name="built", unit="", weight=1.0,
+                normalizer=normalization.StepAbsoluteTimeNormalizer(
+                    start_date=datetime.date(2000, 1, 1), end_date=datetime.date(2020, 1, 1)
+                ),
+            ),
+            parameter.TimeParameter(name="listed", unit="", weight=1.0, normalizer=normalization.RelativeTimeNormalizer()),
+        ]
+        ds = dataset.Dataset(name="Dates", data_points=[
+            dataset.DataPoint(
+                name=str(i),
+                parameter_datas=[
+                    dataset.ParameterData(name="built", value=datetime.date(2005 + i, 1, 1), score=0),
+                    dataset.ParameterData(name="listed", value=datetime.datetime(2021, 1, 1, i), score=0),
+                ],
+            )
+            for i in range(3)
+        ])
+        storage_folder = dataset.Dataset.storage_folder
+        dataset.Dataset.storage_folder = tempfile.mkdtemp()
+        try:
+            ds.store_json()
+            loaded = dataset.Dataset(**dataset.Dataset.load_json("Dates"))
+            self.assertEqual(loaded.data_points, ds.data_points)
+            self.assertIs(type(loaded.data_points[0].parameter_datas[0].value), datetime.date)
+            plan = scoring.ScoringPlan.compile(parameters)
+            scoring.evaluate_dataset(ds, plan)
+            scoring.evaluate_dataset(loaded, plan)
+            self.assertEqual(loaded.data_points, ds.data_points)
+        finally:
+            shutil.rmtree(dataset.Dataset.storage_folder)
+            dataset.Dataset.storage_folder = storage_folder
+
+    def test_columnar_dataset_columns_storage(self):
+        ds = self.create_test_dataset()
+        ds.add_data_point(
+            dataset.DataPoint(
+                name=None,
+                parameter_datas=[
+                    dataset.ParameterData(name="price", value=700, score=0.5),
+                    dataset.ParameterData(name="year", value=1999, score=None),
+                    dataset.ParameterData(name="color", value="Sunburst", score=1),
+                    dataset.ParameterData(name="condition", value=("Used", 3), score=0),
+                ],
+                total_score=0.25,
+            )
+        )
+        ds.score_fingerprints = {"price": "abc"}
+        cds = dataset.ColumnarDataset.from_dataset(ds)
+        storage_folder = dataset.Dataset.storage_folder
+        dataset.Dataset.storage_folder = tempfile.mkdtemp()
+        try:
+            cds.store_columns()
+            loaded = dataset.Dataset.load("TestDataset")
+            self.assertIsInstance(loaded, dataset.ColumnarDataset)
+            self.assertEqual(loaded.description, ds.description)
+            self.assertEqual(loaded.score_fingerprints, {"price": "abc"})
+            self.assertEqual(list(loaded.iter_data_points()), ds.data_points)
+            self.assertEqual(loaded.column("price", "value").dtype, int)
+            self.assertEqual(loaded.column("price", "value").mode, "r")
+
+            # The memory mapped columns are replaced, not written to
+            loaded.delete_data_point("Gibson Les Paul")
+            loaded.store()
+            self.assertEqual(list(dataset.Dataset.load("TestDataset").iter_data_points()), ds.data_points[1:])
+
+            # Once the columns are stored, a plain dataset is stored in them too
+            ds.store()
+            self.assertEqual(list(dataset.Dataset.load("TestDataset").iter_data_points()), ds.data_points)
+            self.assertEqual(os.listdir(dataset.Dataset.storage_folder), ["TestDataset.columns"])
+
+            # A swap interrupted after the old columns were moved aside
+            folder = dataset.Dataset.columns_path("TestDataset")
+            os.rename(folder, folder + ".old")
+            self.assertEqual(list(dataset.Dataset.load("TestDataset").iter_data_points()), ds.data_points)
+            ds.store()
+            self.assertEqual(os.listdir(dataset.Dataset.storage_folder), ["TestDataset.columns"])
+
+            # Converting a json dataset to columns removes its json file
+            ds.name = "Converted"
+            ds.store_json()
+            dataset.ColumnarDataset.from_dataset(ds).store_columns()
+            self.assertFalse(os.path.exists(ds.get_path() + ".json"))
+            self.assertEqual(list(dataset.Dataset.load("Converted").iter_data_points()), ds.data_points)
+        finally:
+            shutil.rmtree(dataset.Dataset.storage_folder)
+            dataset.Dataset.storage_folder = storage_folder
+
+    def test_columnar_dataset_columns_storage_dates(self):
+        ds = dataset.ColumnarDataset(name="Dates")
+        for i, day in enumerate([datetime.date(2020, 1, 31), datetime.date(1960, 5, 1)]):
+            ds.add_data_point(
+                dataset.DataPoint(
+                    name=f"{i}",
+                    parameter_datas=[
+                        dataset.ParameterData(name="day", value=day, score=None),
+                        dataset.ParameterData(
+                            name="time", value=datetime.datetime(2021, 3, i + 1, 12, 30, 15, 7), score=None
+                        ),
+                    ],
+                )
+            )
+        storage_folder = dataset.Dataset.storage_folder
+        dataset.Dataset.storage_folder = tempfile.mkdtemp()
+        try:
+            ds.store_columns()
+            loaded = dataset.ColumnarDataset.load_columns("Dates", mmap_mode=None)
+            self.assertEqual(list(loaded.iter_data_points()), list(ds.iter_data_points()))
+        finally:
+            shutil.rmtree(dataset.Dataset.storage_folder)
+            dataset.Dataset.storage_folder = storage_folder
+
+    def test_columnar_dataset_append_columns(self):
+        ds = dataset.ColumnarDataset(name="Chunks")
+        ds.append_columns(["a", "b"], {"price": [1, 2], "color": ["red", "blue"]})
+        ds.add_data_point(
+            dataset.DataPoint(
+                name="c",
+                parameter_datas=[
+                    dataset.ParameterData(name="color", value="red", score=50),
+                    dataset.ParameterData(name="price", value=3, score=None),
+                ],
+            )
+        )
+        ds.append_columns(["d"], {"color": ["green"], "price": [4.5]})
+        self.assertEqual(ds.parameter_names(), ["price", "color"])
+        self.assertEqual(ds.data_point_names(), ["a", "b", "c", "d"])
+        self.assertEqual(ds.column("price", "value").tolist(), [1, 2, 3, 4.5])
+        self.assertEqual(ds.column("color", "value").tolist(), ["red", "blue", "red", "green"])
+        self.assertEqual(ds.column("color").tolist()[2], 50)
+        with self.assertRaises(ValueError):
+            ds.append_columns(["e"], {"price": [5]})
+            ds.columns()
+
+    def test_columnar_dataset_columns_storage_labels(self):
+        colors = ["red", "blue", "red", "red", "green", "blue"]
+        ds = dataset.ColumnarDataset.from_columns(
+            "Labels", {"color": colors, "price": list(range(6))}, row_names=list("abcdef")
+        )
+        storage_folder = dataset.Dataset.storage_folder
+        dataset.Dataset.storage_folder = tempfile.mkdtemp()
+        try:
+            ds.store_columns()
+            with open(os.path.join(ds.columns_path("Labels"), "header.json")) as f:
+                self.assertEqual(json.load(f)["parameters"][0]["values"], "labels")
+            loaded = dataset.ColumnarDataset.load_columns("Labels")
+            self.assertEqual(loaded.column("color", "value").tolist(), colors)
+            encoded = loaded.encoded_column("color")
+            self.assertEqual(encoded.categories, ["red", "blue", "green"])
+            self.assertEqual(encoded.codes.tolist(), [0, 1, 0, 0, 2, 1])
+            # Only the memory mapped codes and the categories are kept
+            self.assertIs(loaded.columns(encoded=True)[1][0], encoded)
+            self.assertEqual(encoded.codes.mode, "r")
+            self.assertEqual(loaded.data_points_at([4])[0].parameter_datas[0].value, "green")
+
+            loaded.delete_data_point("e")
+            self.assertIsInstance(loaded.columns(encoded=True)[1][0], helpers.EncodedLabels)
+            loaded.store_columns()
+            self.assertEqual(
+                dataset.ColumnarDataset.load_columns("Labels").column("color", "value").tolist(),
+                ["red", "blue", "red", "red", "blue"],
+            )
+        finally:
+            shutil.rmtree(dataset.Dataset.storage_folder)
+            dataset.Dataset.storage_folder = storage_folder
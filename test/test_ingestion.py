@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import dataset
+import ingestion
+import normalization.normalization as normalization
+import parameter
+
+
+def create_test_parameters():
+    return [
+        parameter.NumericalParameter(
+            name="price",
+            unit="EUR",
+            value_range=(0, 5000),
+            normalizer=normalization.StepLinearNegative(threshold_low=500, threshold_high=3000),
+        ),
+        parameter.BooleanParameter(name="in_stock", unit=""),
+    ]
+
+
+class TestIngestion(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, file_name: str, content: str) -> str:
+        path = os.path.join(self.folder, file_name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self.write(
+            "guitars.csv",
+            "name,cost,in_stock\n"
+            "Fender,1200,true\n"
+            "Gibson,2500.5,no\n"
+            "Broken,-5,yes\n"
+            "Missing,,yes\n"
+            "Strange,abc,1\n"
+            "Ibanez,800,maybe\n"
+            "Yamaha,300,0\n",
+        )
+        ds = dataset.Dataset(name="Guitars")
+        reports = []
+        report = ingestion.import_file(
+            path, ds, create_test_parameters(), chunk_size=3,
+            column_map={"price": "cost"}, progress=lambda r: reports.append(r.rows),
+        )
+        self.assertEqual((report.rows, report.imported, report.rejected), (7, 3, 4))
+        self.assertEqual(reports, [3, 6, 7])
+        self.assertEqual(
+            [(r.row, r.parameter, r.reason) for r in report.rejections],
+            [
+                (2, "price", "is below the minimum 0.0"),
+                (3, "price", "is missing"),
+                (4, "price", "cannot be parsed"),
+                (5, "in_stock", "cannot be parsed"),
+            ],
+        )
+        self.assertEqual(ds.data_point_names(), ["Fender", "Gibson", "Yamaha"])
+        self.assertEqual(ds.column("price", "value").tolist(), [1200, 2500.5, 300])
+        self.assertEqual(ds.column("in_stock", "value").tolist(), [True, False, False])
+
+    def test_import_jsonl_into_columnar_dataset(self):
+        rows = [
+            {"name": "Fender", "price": 1200, "in_stock": True},
+            {"name": "Gibson", "price": 9000, "in_stock": False},
+            {"name": "Yamaha", "price": 300, "in_stock": False},
+        ]
+        path = self.write("guitars.jsonl", "\n".join(json.dumps(r) for r in rows) + "\n\n")
+        ds = dataset.ColumnarDataset(name="Guitars")
+        pending = []
+        report = ingestion.import_file(
+            path, ds, create_test_parameters(), chunk_size=2,
+            progress=lambda r: pending.append((len(ds._pending), len(ds._pending_chunks))),
+        )
+        self.assertEqual((report.imported, report.rejected), (2, 1))
+        # The chunks are kept as columns and concatenated once
+        self.assertEqual(pending, [(0, 1), (0, 2)])
+        self.assertEqual(ds.data_point_names(), ["Fender", "Yamaha"])
+        self.assertEqual(ds.column("price", "value").tolist(), [1200, 300])
+
+    def test_non_finite_numbers_are_rejected(self):
+        path = self.write("guitars.csv", "name,price,in_stock\nFender,nan,1\nGibson,inf,1\nYamaha,300,0\n")
+        ds = dataset.Dataset(name="Guitars")
+        report = ingestion.import_file(path, ds, create_test_parameters())
+        self.assertEqual(
+            [(r.row, r.reason) for r in report.rejections], [(0, "cannot be parsed"), (1, "cannot be parsed")]
+        )
+        self.assertEqual(ds.data_point_names(), ["Yamaha"])
+
+        price = create_test_parameters()[0]
+        self.assertFalse(price.is_value_valid(float("nan")))
+        checks = price.validate_values([float("nan"), 300, float("-inf")])
+        self.assertEqual(np.any([invalid for invalid, _ in checks], axis=0).tolist(), [True, False, True])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            ingestion.read_chunks("guitars.xlsx")
@@ -0,0 +1,53 @@
+import shutil
+import tempfile
+import unittest
+
+import dataset
+import instrumentation
+from model import Model
+from fixtures import create_test_dataset, create_test_parameters
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.model_storage_folder = Model.storage_folder
+        self.dataset_storage_folder = dataset.Dataset.storage_folder
+        Model.storage_folder = self.storage + "/model/"
+        dataset.Dataset.storage_folder = self.storage + "/dataset/"
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+        Model.storage_folder = self.model_storage_folder
+        dataset.Dataset.storage_folder = self.dataset_storage_folder
+        shutil.rmtree(self.storage)
+
+    def create_model(self) -> Model:
+        ds = create_test_dataset(100)
+        ds.store_json()
+        return Model(name="Guitars", parameters=create_test_parameters(), datasets=[ds])
+
+    def test_disabled(self):
+        self.assertIs(instrumentation.timer("a"), instrumentation.timer("b"))
+        self.create_model().evaluate_datasets()
+        self.assertEqual(instrumentation.stage_times(), [])
+        self.assertEqual(instrumentation.counters(), {})
+
+    def test_stages(self):
+        instrumentation.enable()
+        model = self.create_model()
+        model.evaluate_datasets()
+        model.store_binary()
+        Model.load_binary(model.name)
+
+        calls = {s.stage: s.calls for s in instrumentation.stage_times()}
+        self.assertEqual(calls["model.init"], 2)
+        self.assertEqual(calls["parameter.deserialize"], 4)
+        self.assertEqual(calls["scoring.validate"], 1)
+        self.assertEqual(calls["scoring.normalize"], 1)
+        self.assertEqual(calls["model.store_dataset"], 1)
+        self.assertEqual(calls["storable.unpickle"], 1)
+        self.assertEqual(instrumentation.counters()["scoring.values_normalized"], 400)
+        self.assertTrue(all(s.seconds >= 0 for s in instrumentation.stage_times()))
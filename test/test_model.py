@@ -0,0 +1,295 @@
+import random
+from unittest import mock
+
+import numpy as np
+
+import dataset
+import normalization.normalization as normalization
+import parameter
+import scoring
+from fixtures import StorageTestCase, create_test_dataset, create_test_parameters
+from model import Model
+
+
+class TestModel(StorageTestCase):
+    def test_evaluate_datasets_matches_per_point(self):
+        model = self.create_model()
+        model.evaluate_datasets(vectorized=False)
+        expected = [
+            ([p.score for p in dp.parameter_datas], dp.total_score)
+            for dp in model.datasets[0].data_points
+        ]
+
+        model.evaluate_datasets()
+        actual = [
+            ([p.score for p in dp.parameter_datas], dp.total_score)
+            for dp in model.datasets[0].data_points
+        ]
+        self.assertEqual(actual, expected)
+
+    def test_evaluate_columnar_dataset(self):
+        model = self.create_model()
+        model.evaluate_datasets()
+        expected = model.datasets[0].dataframe()
+        columnar = dataset.ColumnarDataset.from_dataset(create_test_dataset(200))
+        model.datasets = [columnar]
+        model.evaluate_datasets()
+        self.assertEqual(columnar.dataframe().to_dict(), expected.to_dict())
+
+        # The reference scoring reads and writes the columns too
+        columnar = dataset.ColumnarDataset.from_dataset(create_test_dataset(200))
+        model.datasets = [columnar]
+        model.evaluate_datasets(vectorized=False)
+        self.assertEqual(columnar.dataframe().to_dict(), expected.to_dict())
+
+    def test_change_parameter_weight_updates_total_scores(self):
+        model = self.create_model()
+        model.evaluate_datasets()
+        model.change_parameter_weight("year", 3.0)
+        updated = [dp.total_score for dp in model.datasets[0].data_points]
+
+        model.evaluate_datasets(vectorized=False)
+        self.assertEqual(updated, [dp.total_score for dp in model.datasets[0].data_points])
+
+    def test_evaluate_datasets_reuses_scores(self):
+        model = self.create_model()
+        model.evaluate_datasets()
+        ds = model.datasets[0]
+        self.assertEqual(
+            ds.score_fingerprints,
+            {p.name: p.score_fingerprint() for p in model.parameters},
+        )
+
+        model.change_parameter_weight("price", 0.5)
+        with mock.patch.object(parameter.Parameter, "evaluate_scores") as evaluate_scores:
+            model.evaluate_datasets()
+            evaluate_scores.assert_not_called()
+
+        # Only the column of the changed parameter is normalized again
+        model.parameters_by_name["rating"].normalizer = normalization.Step(threshold=4)
+        with mock.patch.object(
+            parameter.Parameter, "evaluate_scores", autospec=True,
+            side_effect=lambda p, values: p.normalizer.batch(values),
+        ) as evaluate_scores:
+            model.evaluate_datasets()
+            self.assertEqual([c.args[0].name for c in evaluate_scores.call_args_list], ["rating"])
+        updated = [dp.total_score for dp in ds.data_points]
+        model.evaluate_datasets(vectorized=False)
+        self.assertEqual(updated, [dp.total_score for dp in ds.data_points])
+
+        ds.add_data_point(create_test_dataset(1, seed=1).data_points[0])
+        self.assertIsNone(ds.score_fingerprints)
+
+    def test_evaluate_datasets_invalid_value(self):
+        model = self.create_model()
+        data_point = model.datasets[0].data_points[3]
+        data_point.parameter_datas[0] = dataset.ParameterData(name="price", value=-1, score=0)
+        with self.assertRaises(ValueError):
+            model.evaluate_datasets()
+
+    def test_evaluate_datasets_validates_edited_values(self):
+        model = self.create_model()
+        model.evaluate_datasets()
+        # Values edited in place after an evaluation are validated again
+        data_point = model.datasets[0].data_points[0]
+        data_point.parameter_datas[0] = dataset.ParameterData(name="price", value=-999, score=0)
+        with self.assertRaises(ValueError):
+            model.evaluate_datasets()
+        report = model.evaluate_datasets(on_invalid="skip")["Guitars"]
+        self.assertEqual(report.rejected_rows().tolist(), [0])
+        self.assertTrue(np.isnan(model.datasets[0].data_points[0].total_score))
+
+    def test_evaluate_datasets_rescores_edited_values(self):
+        model = self.create_model()
+        model.evaluate_datasets()
+        ds = model.datasets[0]
+        # A valid value edited in place and a row added to the stored json are scored
+        ds.data_points[0].parameter_datas[0] = dataset.ParameterData(name="price", value=100, score=0)
+        ds.data_points.append(create_test_dataset(201).data_points[200])
+        model.evaluate_datasets()
+        self.assertEqual(ds.data_points[0].parameter_datas[0].score, 100)
+        self.assertEqual(len(ds.score_matrix(ds.parameter_names())), 201)
+
+        expected = create_test_dataset(201)
+        expected.data_points[0].parameter_datas[0] = dataset.ParameterData(name="price", value=100, score=0)
+        scoring.evaluate_dataset(expected, model.scoring_plan())
+        self.assertEqual(ds.data_points, expected.data_points)
+
+        ds.store_json()
+        stored = dataset.Dataset.load_json("Guitars")
+        stored["data_points"][5]["parameter_datas"][1][1] = 2023
+        stored["data_points"].append({**stored["data_points"][0], "name": "new guitar", "total_score": None})
+        loaded = dataset.Dataset(**stored)
+        scoring.evaluate_dataset(loaded, model.scoring_plan())
+        self.assertEqual(loaded.data_points[5].parameter_datas[1].score, 100)
+        self.assertEqual(loaded.data_points[-1].total_score, loaded.data_points[0].total_score)
+
+    def test_evaluate_datasets_unknown_parameter(self):
+        model = self.create_model()
+        for dp in model.datasets[0].data_points:
+            dp.parameter_datas[1] = dataset.ParameterData(name="color", value="red", score=0)
+        with self.assertRaises(ValueError):
+            model.evaluate_datasets()
+
+    def create_model_with_datasets(self) -> Model:
+        model = self.create_model()
+        for seed in range(1, 4):
+            ds = create_test_dataset(50, seed)
+            ds.name = f"Guitars {seed}"
+            ds.store_json()
+            model.add_dataset(ds)
+        return model
+
+    def test_evaluate_datasets_in_parallel(self):
+        model = self.create_model_with_datasets()
+        model.evaluate_datasets()
+        expected = [d.dataframe() for d in model.datasets]
+
+        model = self.create_model_with_datasets()
+        model.evaluate_datasets(jobs=2)
+        for d, frame in zip(model.datasets, expected):
+            self.assertEqual(d.dataframe().to_dict(), frame.to_dict())
+            self.assertEqual(dataset.Dataset.load(d.name).dataframe().to_dict(), frame.to_dict())
+
+    def test_evaluate_datasets_invalid_jobs(self):
+        model = self.create_model_with_datasets()
+        with self.assertRaises(ValueError):
+            model.evaluate_datasets(jobs=-2)
+
+    def test_evaluate_datasets_in_parallel_invalid_value(self):
+        model = self.create_model()
+        ds = create_test_dataset(50, 1)
+        ds.name = "Broken guitars"
+        ds.data_points[3].parameter_datas[0] = dataset.ParameterData(name="price", value=-1, score=0)
+        ds.store_json()
+        model.add_dataset(ds)
+        with self.assertRaises(ValueError) as serial:
+            model.evaluate_datasets()
+        with self.assertRaises(ValueError) as parallel:
+            model.evaluate_datasets(jobs=2)
+        self.assertEqual(str(parallel.exception), str(serial.exception))
+
+    def test_datasets_are_loaded_lazily(self):
+        model = self.create_model()
+        model.evaluate_datasets()
+        model.store_binary()
+
+        with mock.patch.object(dataset.Dataset, "load_json", side_effect=AssertionError("dataset loaded")):
+            loaded = Model.load_binary(model.name)
+            self.assertFalse(loaded.datasets[0].is_loaded())
+            entry = loaded.catalog()[0]
+        self.assertEqual(entry.name, "Guitars")
+        self.assertEqual(entry.rows, 200)
+        self.assertEqual(entry.score_fingerprints, model.datasets[0].score_fingerprints)
+
+        self.assertEqual(loaded.datasets[0].data_point_names(), model.datasets[0].data_point_names())
+        self.assertTrue(loaded.datasets[0].is_loaded())
+
+    def test_update_dataset_refreshes_the_catalog(self):
+        model = self.create_model()
+        model.store_binary()
+        columnar = dataset.ColumnarDataset.from_dataset(create_test_dataset(50))
+        columnar.store_columns()
+        self.assertTrue(model.update_dataset(columnar))
+        self.assertFalse(model.update_dataset(dataset.Dataset(name="Unknown")))
+
+        entry = Model.load_catalog(model.name)["Guitars"]
+        self.assertEqual((entry.dataset_type, entry.rows), ("ColumnarDataset", 50))
+        with self.assertRaises(AttributeError):
+            model.datasets[0].name = "Renamed"
+        self.assertEqual(model.datasets[0].entry.name, "Guitars")
+
+    def test_parameters_are_loaded_in_order(self):
+        model = self.create_model()
+        with mock.patch.object(Model, "load_jobs", 3):
+            loaded = Model(name=model.name, parameters=create_test_parameters(), datasets=model.datasets)
+        self.assertEqual([p.name for p in loaded.parameters], [p.name for p in model.parameters])
+        self.assertEqual(list(loaded.parameters_by_name), [p.name for p in model.parameters])
+
+    def test_load_errors_are_aggregated(self):
+        model = self.create_model()
+        for name in ("price", "rating"):
+            with open(f"{parameter.Parameter.storage_folder}/{name}.json", "w") as f:
+                f.write("{")
+        with self.assertRaises(ValueError) as error:
+            Model(name=model.name, parameters=create_test_parameters(), datasets=model.datasets)
+        self.assertIn("Could not load 2 of 4 files", str(error.exception))
+        self.assertIn("parameter price", str(error.exception))
+        self.assertIn("parameter rating", str(error.exception))
+
+    def test_scoring_plan(self):
+        model = self.create_model()
+        plan = model.scoring_plan()
+        self.assertIs(model.scoring_plan(), plan)
+        self.assertEqual(plan.names, ("price", "year", "rating", "in_stock"))
+        self.assertAlmostEqual(plan.normalized_weights.sum(), 1.0)
+
+        model.change_parameter_weight("year", 3.0)
+        plan = model.scoring_plan()
+        self.assertEqual(plan.weights[plan.positions["year"]], 3.0)
+
+        # Parameters changed in place are noticed too
+        model.parameters_by_name["rating"].normalizer = normalization.Step(threshold=4)
+        self.assertIsNot(model.scoring_plan(), plan)
+
+        model.delete_parameter("in_stock")
+        self.assertNotIn("in_stock", model.parameters_by_name)
+        self.assertEqual(model.scoring_plan().names, ("price", "year", "rating"))
+        model.add_parameter(parameter.BooleanParameter(name="used", unit="", weight=0.2))
+        self.assertIn("used", model.parameters_by_name)
+        self.assertEqual(model.scoring_plan().names, ("price", "year", "rating", "used"))
+
+    def test_enum_parameter_new_label(self):
+        parameters = create_test_parameters()[:1] + [
+            parameter.EnumParameter(name="color", unit="", weight=1.0, labels={"red": 100, "blue": 50})
+        ]
+        colors = ["red", "blue", "green", "red", "green"]
+        ds = dataset.ColumnarDataset.from_columns(
+            "Colors", {"price": [100, 200, 300, 400, 500], "color": colors}
+        )
+        plan = scoring.ScoringPlan.compile(parameters)
+        report = scoring.evaluate_dataset(ds, plan, on_invalid="skip")
+        self.assertEqual(report.rejected_rows().tolist(), [2, 4])
+        self.assertEqual(parameters[1].evaluate_scores(colors[:2]).tolist(), [100, 50])
+        before = ds.column("total_score").copy()
+
+        parameters[1].add_new("green", 75)
+        report = scoring.evaluate_dataset(ds, scoring.ScoringPlan.compile(parameters))
+        self.assertEqual(report.rejections, [])
+        self.assertEqual(ds.column("color").tolist(), [100, 50, 75, 100, 75])
+        after = ds.column("total_score")
+        self.assertEqual(np.flatnonzero(~np.isclose(after, before, equal_nan=False)).tolist(), [2, 4])
+
+    def test_incremental_scoring(self):
+        parameters = create_test_parameters() + [
+            parameter.NumericalParameter(
+                name="reviews", unit="", weight=0.9, normalizer=normalization.RelativeAscending()
+            )
+        ]
+
+        def create_dataset(n_data_points: int, seed: int) -> dataset.Dataset:
+            ds = create_test_dataset(n_data_points, seed)
+            rng = random.Random(seed)
+            for dp in ds.data_points:
+                dp.parameter_datas.append(dataset.ParameterData(name="reviews", value=rng.randint(0, 50), score=0))
+            return ds
+
+        for ds in (create_dataset(100, 0), dataset.ColumnarDataset.from_dataset(create_dataset(100, 0))):
+            model = Model(name="Guitars", parameters=parameters)
+            model.add_dataset(ds)
+            model.evaluate_datasets()
+
+            update = model.add_data_points("Guitars", create_dataset(130, 1).data_points[100:])
+            self.assertTrue(update.incremental)
+            self.assertEqual(update.added_rows, list(range(100, 130)))
+            self.assertEqual(set(update.changed_scores), {"reviews"})
+            update = model.delete_data_points("Guitars", ["guitar 3", "guitar 120"])
+            self.assertTrue(update.incremental)
+            self.assertEqual(update.deleted_rows, [3, 120])
+
+            ds = model.get_dataset("Guitars")
+            scores, totals = ds.score_matrix(ds.parameter_names()), ds.column("total_score")
+            ds._invalidate_scores()
+            scoring.evaluate_dataset(ds, model.scoring_plan())
+            np.testing.assert_array_equal(ds.score_matrix(ds.parameter_names()), scores)
+            np.testing.assert_array_equal(ds.column("total_score"), totals)
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import dataset
+import pareto
+import scoring
+from fixtures import create_test_dataset, create_test_parameters
+
+
+def dominated_rows(scores: np.ndarray) -> np.ndarray:
+    """Pairwise check of the rows dominated by another row."""
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    return np.array([
+        ((scores >= row).all(axis=1) & (scores > row).any(axis=1)).any() for row in scores
+    ], dtype=bool)
+
+
+class TestPareto(unittest.TestCase):
+    def test_pareto_frontier(self):
+        scores = np.array([[1, 5], [5, 1], [3, 3], [2, 2], [3, 3], [np.nan, 6], [0, 0]], dtype=float)
+        self.assertEqual(pareto.pareto_frontier(scores).tolist(), [0, 1, 2, 4, 5])
+        self.assertEqual(pareto.pareto_layers(scores, 3).tolist(), [0, 0, 0, 1, 0, 0, 2])
+        self.assertEqual(pareto.pareto_layers(scores, 1).tolist(), [0, 0, 0, -1, 0, 0, -1])
+        self.assertEqual(pareto.pareto_frontier(np.empty((0, 3))).tolist(), [])
+        with self.assertRaises(ValueError):
+            pareto.pareto_layers(scores, 0)
+
+    def test_pareto_frontier_matches_pairwise_check(self):
+        rng = np.random.default_rng(0)
+        for n_columns, discrete in ((2, True), (4, True), (8, False)):
+            scores = rng.random((500, n_columns))
+            if discrete:
+                scores = np.round(scores * 4) * 25
+            scores[rng.random(scores.shape) < 0.01] = np.nan
+            expected = np.flatnonzero(~dominated_rows(scores)).tolist()
+            for block_size in (1, 7, 1024):
+                with mock.patch.object(pareto, "BLOCK_SIZE", block_size):
+                    self.assertEqual(pareto.pareto_frontier(scores, max_chunk_bytes=100).tolist(), expected)
+                    self.assertEqual(pareto.pareto_frontier(scores).tolist(), expected)
+
+    def test_dataset_pareto_layers(self):
+        ds = create_test_dataset(300)
+        scoring.evaluate_dataset(ds, scoring.ScoringPlan.compile(create_test_parameters()))
+        names = ["price", "year"]
+        layers = ds.pareto_layers(names, 2)
+        self.assertEqual(layers[0], ds.pareto_frontier(names))
+        remaining = [dp for dp in ds.data_points if dp not in layers[0]]
+        scores = np.array([[p.score for p in dp.parameter_datas[:2]] for dp in remaining])
+        self.assertEqual(layers[1], [remaining[i] for i in np.flatnonzero(~dominated_rows(scores))])
+
+        columnar = dataset.ColumnarDataset.from_dataset(ds)
+        self.assertEqual(
+            [dp.name for dp in columnar.pareto_frontier(names)], [dp.name for dp in layers[0]]
+        )
+        with self.assertRaises(ValueError):
+            ds.pareto_frontier(["color"])
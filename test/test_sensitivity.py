@@ -0,0 +1,53 @@
+import numpy as np
+
+import dataset
+import parameter
+import sensitivity
+from fixtures import StorageTestCase
+
+
+class TestSensitivity(StorageTestCase):
+    def test_analyze_weights(self):
+        model = self.create_model(300)
+        ds = model.datasets[0]
+        report = sensitivity.analyze_weights(model, ds, n_samples=200, seed=3, n_bins=10)
+        chunked = sensitivity.analyze_weights(model, ds, n_samples=200, seed=3, n_bins=10, max_chunk_bytes=1)
+        np.testing.assert_array_equal(report.rank_histogram, chunked.rank_histogram)
+        np.testing.assert_array_equal(report.mean_ranks, chunked.mean_ranks)
+
+        self.assertEqual(report.rank_histogram.shape, (300, 10))
+        self.assertTrue(np.all(report.rank_histogram.sum(axis=1) == 200))
+        self.assertAlmostEqual(report.p_best.sum(), 1)
+        self.assertTrue(np.all(report.min_ranks <= report.mean_ranks))
+        self.assertTrue(np.all(report.mean_ranks <= report.max_ranks))
+
+        best = ds.top_k(1)[0].name
+        self.assertEqual(report.dataframe().index[0], best)
+
+        # Without spread every sample ranks the data points as the model does
+        report = sensitivity.analyze_weights(model, ds, n_samples=5, spread=0)
+        np.testing.assert_array_equal(report.min_ranks, report.ranks)
+        np.testing.assert_array_equal(report.max_ranks, report.ranks)
+
+    def test_rank_flips(self):
+        ds = dataset.Dataset(name="Guitars")
+        for name, a, b in [("A", 100, 0), ("B", 0, 90), ("C", 50, 40)]:
+            ds.add_data_point(
+                dataset.DataPoint(
+                    name=name,
+                    parameter_datas=[
+                        dataset.ParameterData(name="a", value=a, score=None),
+                        dataset.ParameterData(name="b", value=b, score=None),
+                    ],
+                )
+            )
+        parameters = [parameter.NumericalParameter(name="a", unit=""), parameter.NumericalParameter(name="b", unit="")]
+        model = self.create_model(ds=ds, parameters=parameters)
+        flips = sensitivity.analyze_weights(model, model.datasets[0], n_samples=1).rank_flips
+        self.assertEqual(flips[0].parameter, "a")
+        self.assertAlmostEqual(flips[0].lower_weight, 0.9)
+        self.assertEqual(flips[0].lower_best, "B")
+        self.assertIsNone(flips[0].upper_weight)
+        self.assertAlmostEqual(flips[1].upper_weight, 1 + 10 / 90)
+        self.assertEqual(flips[1].upper_best, "B")
+        self.assertIsNone(flips[1].lower_weight)
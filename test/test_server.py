@@ -0,0 +1,109 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+import dataset
+import normalization.normalization as normalization
+import parameter
+import scoring
+import server
+from fixtures import StorageTestCase, create_test_dataset, create_test_parameters
+from model import Model
+
+
+class TestServer(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.parameters = create_test_parameters() + [
+            parameter.NumericalParameter(
+                name="reviews", unit="", weight=0.9, normalizer=normalization.RelativeAscending()
+            )
+        ]
+        ds = create_test_dataset(100)
+        for i, dp in enumerate(ds.data_points):
+            dp.parameter_datas.append(dataset.ParameterData(name="reviews", value=i % 17, score=0))
+        self.create_model(ds=ds, parameters=self.parameters).store_binary()
+
+        self.server = server.ScoringServer(port=0, check_interval=0)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def request(self, path: str, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        try:
+            with urllib.request.urlopen(self.url + path, data) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    def test_score_and_rank(self):
+        alternatives = [
+            {"name": "new 1", "price": "700", "year": "2001", "rating": "4", "in_stock": "true", "reviews": "8"},
+            {"name": "new 2", "price": 4000, "year": 1980, "rating": 1, "in_stock": False, "reviews": 20},
+        ]
+        status, body = self.request("/models/Guitars/score", {"dataset": "Guitars", "alternatives": alternatives})
+        self.assertEqual(status, 200)
+
+        # The same scores as if the alternatives were added to the dataset
+        ds = create_test_dataset(100)
+        for i, dp in enumerate(ds.data_points):
+            dp.parameter_datas.append(dataset.ParameterData(name="reviews", value=i % 17, score=0))
+        plan = scoring.ScoringPlan.compile(self.parameters)
+        scoring.evaluate_dataset(ds, plan)
+        scoring.add_data_points(ds, plan, [
+            dataset.DataPoint(
+                name=a["name"],
+                parameter_datas=[
+                    dataset.ParameterData(name=p.name, value=p.parse_value(a[p.name]), score=0)
+                    for p in self.parameters
+                ],
+                total_score=0,
+            )
+            for a in alternatives
+        ])
+        self.assertEqual([a["total_score"] for a in body["alternatives"]], ds.column("total_score")[100:].tolist())
+        self.assertEqual(body["alternatives"][1]["scores"]["reviews"], ds.column("reviews")[101])
+
+        status, body = self.request("/models/Guitars/rank", {"dataset": "Guitars", "alternatives": alternatives})
+        self.assertEqual(status, 200)
+        self.assertEqual([a["name"] for a in body["alternatives"]], ["new 1", "new 2"])
+        totals = ds.column("total_score")[:100]
+        self.assertEqual(body["alternatives"][0]["rank"], int(np.sum(totals > body["alternatives"][0]["total_score"])))
+
+        status, body = self.request("/models/Guitars/score", {"alternatives": [{"price": -1}]})
+        self.assertEqual(status, 400)
+        self.assertIn("price", body["error"])
+
+    def test_top_and_stats(self):
+        status, body = self.request("/models/Guitars/datasets/Guitars/top?k=3")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body["data_points"]), 3)
+        totals = [dp["total_score"] for dp in body["data_points"]]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+
+        self.assertEqual(self.request("/models/Violins")[0], 404)
+        self.assertEqual(self.request("/models/Guitars/datasets/Violins/top")[0], 404)
+        status, body = self.request("/stats")
+        self.assertEqual(body["endpoints"]["top"]["requests"], 2)
+        self.assertEqual(body["endpoints"]["top"]["errors"], 1)
+        self.assertIn("p99_ms", body["endpoints"]["model"])
+
+    def test_model_is_reloaded_when_changed(self):
+        self.assertEqual(self.request("/models/Guitars")[1]["parameters"][1]["weight"], 0.7)
+        model = Model.load_binary("Guitars")
+        model.change_parameter_weight("year", 3.0)
+        model.parameters_by_name["year"].store_json()
+        model.store_binary()
+
+        status, body = self.request("/models/Guitars")
+        self.assertEqual(body["parameters"][1]["weight"], 3.0)
+        self.assertEqual(self.request("/stats")[1]["models"]["Guitars"]["reloads"], 1)
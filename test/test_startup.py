@@ -0,0 +1,12 @@
+import unittest
+
+from benchmarks import startup
+
+
+class TestStartup(unittest.TestCase):
+    def test_cli_does_not_import_lazy_modules(self):
+        for name, (args, _) in startup.COMMANDS.items():
+            modules, _ = startup.import_times(args)
+            self.assertIn("user_interaction", modules, name)
+            for module in startup.LAZY_MODULES:
+                self.assertNotIn(module, modules, name)
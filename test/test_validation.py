@@ -0,0 +1,90 @@
+import datetime
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+import numpy as np
+
+import dataset
+import normalization.normalization as normalization
+import parameter
+import scoring
+import validation
+from fixtures import create_test_dataset, create_test_parameters
+
+
+class TestValidation(unittest.TestCase):
+    def validate(self, p: parameter.Parameter, values) -> list:
+        return [(r.row, r.reason) for r in validation.validate_column(p.name, p.validate_values, values)]
+
+    def test_numerical(self):
+        p = parameter.NumericalParameter(name="price", unit="EUR", value_range=(0, 100))
+        self.assertEqual(
+            self.validate(p, np.array([5, -1, 101, 100])),
+            [(1, "is below the minimum 0.0"), (2, "is above the maximum 100.0")],
+        )
+        self.assertEqual(
+            self.validate(p, [5, "abc", None, 200.5]),
+            [(1, "is not a number"), (2, "is not a number"), (3, "is above the maximum 100.0")],
+        )
+
+    def test_boolean_and_enum(self):
+        p = parameter.BooleanParameter(name="in_stock", unit="")
+        self.assertEqual(self.validate(p, [True, "yes", np.bool_(False)]), [(1, "is not a boolean")])
+        self.assertEqual(self.validate(p, np.array([True, False])), [])
+        p = parameter.EnumParameter(name="color", unit="", labels={"red": 100, "blue": 50})
+        self.assertEqual(self.validate(p, ["red", "green", "blue"]), [(1, "is not one of the labels")])
+
+    def test_time(self):
+        start, end = datetime.date(2000, 1, 1), datetime.date(2010, 1, 1)
+        p = parameter.TimeParameter(
+            name="built", unit="", value_range=(start, end),
+            normalizer=normalization.StepAbsoluteTimeNormalizer(start_date=start, end_date=end),
+        )
+        values = [datetime.date(2005, 1, 1), datetime.datetime(1999, 12, 31, 23), "2005", datetime.date(2011, 1, 1)]
+        self.assertEqual([row for row, _ in self.validate(p, values)], [1, 2, 3])
+        dates = np.array(["2005-01-01", "2011-01-01"], dtype="datetime64[D]")
+        self.assertEqual([row for row, _ in self.validate(p, dates)], [1])
+
+    def test_base_parameter_uses_check_value(self):
+        class EvenParameter(parameter.Parameter):
+            def is_value_valid(self, value):
+                print("Value must be even.")
+                return value % 2 == 0
+
+            def check_value(self, value):
+                return isinstance(value, int) and value % 2 == 0
+
+        output = StringIO()
+        with redirect_stdout(output):
+            rejections = self.validate(EvenParameter(name="even", unit=""), [2, 3, "4"])
+        self.assertEqual(rejections, [(1, "is not valid"), (2, "is not valid")])
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(self.validate(parameter.Parameter(name="any", unit=""), [1, "a"]), [])
+
+    def test_evaluate_dataset_skips_invalid_rows(self):
+        parameters = create_test_parameters()
+        plan = scoring.ScoringPlan.compile(parameters)
+        expected = create_test_dataset(20)
+        scoring.evaluate_dataset(expected, plan)
+
+        ds = create_test_dataset(20)
+        ds.data_points[3].parameter_datas[0] = dataset.ParameterData(name="price", value=-1, score=0)
+        ds.data_points[7].parameter_datas[3] = dataset.ParameterData(name="in_stock", value="yes", score=0)
+        with self.assertRaises(ValueError):
+            scoring.evaluate_dataset(ds, plan)
+
+        output = StringIO()
+        with redirect_stdout(output):
+            report = scoring.evaluate_dataset(ds, plan, on_invalid="skip")
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual([(r.row, r.parameter) for r in report.rejections], [(3, "price"), (7, "in_stock")])
+        self.assertEqual(report.rejected_rows().tolist(), [3, 7])
+        totals = [dp.total_score for dp in ds.data_points]
+        self.assertTrue(np.isnan(totals[3]) and np.isnan(totals[7]))
+        valid = report.valid_mask()
+        self.assertEqual(
+            np.array(totals)[valid].tolist(),
+            np.array([dp.total_score for dp in expected.data_points])[valid].tolist(),
+        )
+        self.assertIsNone(ds.score_fingerprints)
@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+
+import weight_fitting
+from fixtures import StorageTestCase
+
+
+class TestWeightFitting(StorageTestCase):
+    def test_project_to_simplex(self):
+        u = weight_fitting.project_to_simplex(np.array([0.5, 2.0, -1.0]))
+        np.testing.assert_allclose(u, [0.0, 1.0, 0.0])
+        u = weight_fitting.project_to_simplex(np.array([0.2, 0.3, 0.5]))
+        np.testing.assert_allclose(u, [0.2, 0.3, 0.5])
+
+    def test_fit_weights_reproduces_order(self):
+        model = self.create_model(300)
+        ds = model.datasets[0]
+        model.evaluate_datasets()
+        # The order produced by other weights, for every 30th data point
+        for name, weight in zip(["price", "year", "rating", "in_stock"], [0.5, 3.0, 0.2, 1.0]):
+            model.change_parameter_weight(name, weight)
+        order = [dp.name for dp in ds.top_k(300)][::30]
+        for name, weight in zip(["price", "year", "rating", "in_stock"], [2.5, 0.7, 1.3, 0.1]):
+            model.change_parameter_weight(name, weight)
+        preferences = weight_fitting.preferences_from_order(order)
+
+        fit = weight_fitting.fit_weights(model, ds, preferences)
+        self.assertEqual(fit.satisfied, fit.preferences)
+        self.assertEqual(fit.violated, [])
+        self.assertAlmostEqual(sum(fit.weights.values()), 4.6)
+        self.assertEqual({p.name: p.weight for p in model.parameters}, fit.weights)
+        ranked = [dp.name for dp in ds.top_k(300) if dp.name in order]
+        self.assertEqual(ranked, order)
+
+    def test_fit_weights_scales(self):
+        model = self.create_model(2000)
+        ds = model.datasets[0]
+        rng = np.random.default_rng(0)
+        names = ds.data_point_names()
+        preferences = [tuple(rng.choice(names, 2, replace=False)) for _ in range(5000)]
+        start = time.perf_counter()
+        fit = weight_fitting.fit_weights(model, ds, preferences, write_back=False)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertTrue(all(w >= 0 for w in fit.weights.values()))
+        self.assertEqual(fit.satisfied + len(fit.violated), 5000)
+
+    def test_unknown_data_point(self):
+        model = self.create_model(10)
+        with self.assertRaises(ValueError):
+            weight_fitting.fit_weights(model, model.datasets[0], [("guitar 1", "violin")])
@@ -1,11 +1,14 @@
+import os
 from ast import literal_eval
 from typing import List, Optional, Tuple, Any
 
 from colorama import Fore, Style
 
 import dataset
+import ingestion
 import normalization.normalization as normalization
 import parameter
+import weight_fitting
 from helpers import (get_class_fields_and_their_description, indent_n_chars,
                      wrap_text_to_80_chars)
 from model import Model
@@ -170,11 +173,11 @@ def create_dataset() -> Optional[dataset.Dataset]:
             name=dataset_name,
             description=dataset_description,
         )
-        d.store_json()
+        d.store()
         return d
     elif answer == "1":
         answer = input("Please enter the name of the dataset: ")
-        d = dataset.Dataset(**dataset.Dataset.load_json(answer))
+        d = dataset.Dataset.load(answer)
         return d
     elif answer == "2":
         return None
@@ -221,7 +224,7 @@ def list_class(t) -> None:
             subsequent_indent)
         print(f'{DESCRIPTION}{text}')
 
-        d = subclass.get_fields_and_their_description()
+        d = get_class_fields_and_their_description(subclass)
         if not d:
             print()
             continue
@@ -264,9 +267,33 @@ def edit_model_name(model_name: str) -> None:
 def change_model_parameter_weight(model_name: str, param_name: str, new_weight: float) -> None:
     model = Model.load_binary(model_name)
     model.change_parameter_weight(param_name, float(new_weight))
+    # Parameters are reloaded from their json files when the model is loaded
+    model.parameters_by_name[param_name].store_json()
     model.store_binary()
     print(f"The weight of {param_name} has been changed to {new_weight}.")
 
+def fit_model_weights(model_name: str, dataset_name: str, preferred_order: List[str]) -> None:
+    """Fits the parameter weights so that the data points of the dataset are ranked in the
+    preferred order, best first, and stores them.
+    """
+    model = Model.load_binary(model_name)
+    datasets = [d for d in model.datasets or [] if d.name == dataset_name]
+    if not datasets:
+        raise ValueError(f"Dataset {dataset_name} not found in model {model_name}")
+    fit = weight_fitting.fit_weights(
+        model, datasets[0].get(), weight_fitting.preferences_from_order(preferred_order)
+    )
+    for p in model.parameters:
+        p.store_json()
+    datasets[0].store()
+    model.store_binary()
+    for name, weight in fit.weights.items():
+        print(f"{name}: {weight}")
+    print(f"{fit.satisfied} of {fit.preferences} preferences are satisfied.")
+    for better, worse in fit.violated:
+        print(f"{Fore.RED}{better} is not ranked above {worse}.{Style.RESET_ALL}")
+
+
 def delete_model_param(model_name: str, param_name: str) -> None:
     model = Model.load_binary(model_name)
     model.delete_parameter(param_name)
@@ -292,10 +319,13 @@ def list_model_datasets(model_name: str) -> None:
         print(f"There are no datasets for {model_name}.")
 
 
-def evaluate_model_datasets(model_name: str) -> None:
+def evaluate_model_datasets(model_name: str, jobs: Optional[int] = 1, skip_invalid: bool = False) -> None:
     model = Model.load_binary(model_name)
-    model.evaluate_datasets()
+    reports = model.evaluate_datasets(jobs=jobs, on_invalid="skip" if skip_invalid else "raise")
     model.store_binary()
+    for name, report in reports.items():
+        if report.rejections:
+            print(f"{Fore.RED}{name}: {report}{Style.RESET_ALL}")
 
 
 def add_model_dataset(model_name: str) -> None:
@@ -310,3 +340,73 @@ def delete_model_dataset(model_name: str, dataset_name: str) -> None:
     model.delete_dataset(dataset_name)
     model.store_binary()
     print(f"The dataset {dataset_name} has been deleted from {model_name}.")
+
+
+def import_dataset(
+    dataset_name: str,
+    model_name: str,
+    path: str,
+    file_format: Optional[str] = None,
+    chunk_size: int = 10_000,
+    name_column: str = "name",
+) -> None:
+    """Appends the rows of a csv or jsonl file to the dataset, creating it if it does not exist.
+    The columns are mapped to the parameters of the model by name. The dataset is stored in the
+    binary columnar format if it already was, see store_dataset_columns, otherwise as json, which
+    builds every data point: large files are better imported into a dataset stored as columns.
+    """
+    model = Model.load_binary(model_name)
+    d = dataset.ColumnarDataset(name=dataset_name)
+    if os.path.isfile(d.get_path() + ".json") or d.stored_columns_path(dataset_name) is not None:
+        d = load_columnar_dataset(dataset_name)
+
+    report = ingestion.import_file(
+        path, d, model.parameters, file_format, chunk_size, name_column,
+        progress=lambda r: print(f"\r{r}", end="", flush=True),
+    )
+    print()
+    d.store()
+    model.update_dataset(d)
+    print(f"Imported {report.imported} data points from {path} into {dataset_name}.")
+    if d.stored_columns_path(dataset_name) is None:
+        print(
+            f"{dataset_name} is stored as json, run 'dataset --name {dataset_name} --store-columns' "
+            f"to store it as binary columns, which are much faster to import into and load."
+        )
+    if report.rejected:
+        print(f"{Fore.RED}{report.rejected} rows were rejected.{Style.RESET_ALL}")
+
+
+def load_columnar_dataset(dataset_name: str) -> dataset.ColumnarDataset:
+    d = dataset.Dataset.load(dataset_name)
+    if isinstance(d, dataset.ColumnarDataset):
+        return d
+    return dataset.ColumnarDataset.from_dataset(d)
+
+
+def store_dataset_columns(dataset_name: str, model_name: Optional[str] = None) -> None:
+    """Stores the dataset in the binary columnar format and, if a model is given, updates its catalog."""
+    d = load_columnar_dataset(dataset_name)
+    d.store_columns()
+    if model_name is not None:
+        Model.load_binary(model_name).update_dataset(d)
+    print(f"The dataset {dataset_name} has been stored in {d.columns_path(dataset_name)}.")
+
+
+def show_pareto_frontier(dataset_name: str, parameter_names: Optional[List[str]] = None, layers: int = 1) -> None:
+    d = dataset.Dataset.load(dataset_name)
+    parameter_names = parameter_names or d.parameter_names()
+    for layer, data_points in enumerate(d.pareto_layers(parameter_names, layers)):
+        print(f"Pareto layer {layer}: {len(data_points)} data points")
+        for dp in data_points:
+            scores = {p.name: p.score for p in dp.parameter_datas}
+            print(f"  {dp.name}: " + ", ".join(f"{name} {scores[name]}" for name in parameter_names))
+
+
+def serve_models(
+    host: str, port: int, model_names: List[str], check_interval: float = 1.0, verbose: bool = False
+) -> None:
+    # The http server is only imported by this command
+    import server
+
+    server.serve(host, port, model_names, check_interval, verbose)
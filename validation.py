@@ -0,0 +1,73 @@
+"""
+Validation of whole value columns. Each parameter checks a column at once with numpy masks, see
+Parameter.validate_values, and the invalid values are collected in a report instead of being
+printed, so that the valid rows can be scored and the others dropped or quarantined.
+"""
+from collections import Counter, namedtuple
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from helpers import column_length
+from parameter import VALUE_CHECK
+
+Rejection = namedtuple("Rejection", ["row", "parameter", "reason"])
+
+
+class ValidationReport(BaseModel):
+    rows: int = 0
+    # At most one rejection per row and parameter, ordered by parameter and row
+    rejections: List[Rejection] = []
+
+    def rejected_rows(self) -> np.ndarray:
+        """Returns the sorted indices of the rows with at least one invalid value."""
+        return np.unique(np.array([r.row for r in self.rejections], dtype=np.intp))
+
+    def valid_mask(self) -> np.ndarray:
+        is_valid = np.ones(self.rows, dtype=bool)
+        is_valid[self.rejected_rows()] = False
+        return is_valid
+
+    def reason_counts(self) -> Dict[Tuple[str, str], int]:
+        """Returns the number of rejections of each (parameter, reason)."""
+        return dict(Counter((r.parameter, r.reason) for r in self.rejections))
+
+    def __str__(self) -> str:
+        lines = [f"{len(self.rejected_rows())} of {self.rows} rows rejected"]
+        for (parameter, reason), n in self.reason_counts().items():
+            lines.append(f"  {parameter}: {n} values {reason}")
+        return "\n".join(lines)
+
+
+def validate_column(
+    parameter_name: str, validate: Callable[[Sequence[Any]], List[VALUE_CHECK]], values: Sequence[Any]
+) -> List[Rejection]:
+    """Validates a column with a Parameter.validate_values method. A value failing several checks
+    is rejected for the first of them.
+    """
+    is_rejected = np.zeros(column_length(values), dtype=bool)
+    rows = []
+    reasons = []
+    for is_invalid, reason in validate(values):
+        new = np.flatnonzero(is_invalid & ~is_rejected)
+        rows.append(new)
+        reasons.extend([reason] * len(new))
+        is_rejected |= is_invalid
+    if not reasons:
+        return []
+    rows = np.concatenate(rows)
+    order = np.argsort(rows, kind="stable")
+    return [Rejection(int(rows[i]), parameter_name, reasons[i]) for i in order]
+
+
+def validate_columns(
+    names: Sequence[str],
+    validators: Sequence[Callable[[Sequence[Any]], List[VALUE_CHECK]]],
+    value_columns: Sequence[Sequence[Any]],
+) -> ValidationReport:
+    """Validates each value column with the validator of the same position."""
+    report = ValidationReport(rows=column_length(value_columns[0]) if value_columns else 0)
+    for name, validate, values in zip(names, validators, value_columns):
+        report.rejections.extend(validate_column(name, validate, values))
+    return report
@@ -0,0 +1,100 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+import scoring
+from dataset import Dataset
+from model import Model
+
+# (preferred data point, other data point)
+PREFERENCE = Tuple[str, str]
+
+
+class WeightFit(BaseModel):
+    weights: Dict[str, float]
+    preferences: int
+    satisfied: int
+    violated: List[PREFERENCE]
+    iterations: int
+
+
+def preferences_from_order(names: Sequence[str]) -> List[PREFERENCE]:
+    """Turns an ordering of data point names, best first, into pairwise preferences."""
+    return list(zip(names[:-1], names[1:]))
+
+
+def project_to_simplex(v: np.ndarray) -> np.ndarray:
+    """Returns the closest point to v whose coordinates are non-negative and sum to one."""
+    u = np.sort(v)[::-1]
+    cumulative = np.cumsum(u) - 1
+    k = np.arange(1, len(v) + 1)
+    rho = k[u - cumulative / k > 0][-1]
+    return np.maximum(v - cumulative[rho - 1] / rho, 0)
+
+
+def fit_weights(
+    model: Model,
+    dataset: Dataset,
+    preferences: Sequence[PREFERENCE],
+    margin: float = 1.0,
+    regularization: float = 1e-3,
+    max_iterations: int = 5000,
+    tolerance: float = 1e-10,
+    write_back: bool = True,
+) -> WeightFit:
+    """Finds non-negative weights for which the preferred data point of each pair has a higher total
+    score than the other one, by at least margin score points where possible.
+    The sum of the weights is kept. The fitted weights u, scaled to sum to one, minimize
+        sum over the pairs of max(0, margin - (s_better - s_worse) . u)^2 + regularization * |u - u0|^2
+    where s are the score vectors of the data points and u0 the current weights, by accelerated
+    projected gradient descent. The regularization picks the solution closest to the current
+    weights. With write_back, the weights are changed in the model and its total scores updated.
+    """
+    plan = model.scoring_plan()
+    scoring.evaluate_dataset(dataset, plan)
+    names = dataset.parameter_names()
+    scores = dataset.score_matrix(names)
+    index = {name: i for i, name in enumerate(dataset.data_point_names())}
+    for pair in preferences:
+        for name in pair:
+            if name not in index:
+                raise ValueError(f"Data point {name} not found in dataset {dataset.name}")
+    better = np.array([index[b] for b, _ in preferences], dtype=np.intp)
+    worse = np.array([index[w] for _, w in preferences], dtype=np.intp)
+    differences = scores[better] - scores[worse]
+
+    weights = plan.weights[[plan.positions[name] for name in names]]
+    weight_sum = weights.sum()
+    if weight_sum <= 0:
+        raise ValueError("The sum of the parameter weights must be positive.")
+    u0 = weights / weight_sum
+
+    # Lipschitz constant of the gradient, the largest singular value of the differences squared
+    lipschitz = 2 * (np.linalg.norm(differences, 2) ** 2 + regularization) if len(differences) else 1.0
+    u = y = u0
+    t = 1.0
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        hinge = np.maximum(margin - differences @ y, 0)
+        gradient = -2 * differences.T @ hinge + 2 * regularization * (y - u0)
+        u_next = project_to_simplex(y - gradient / lipschitz)
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = u_next + (t - 1) / t_next * (u_next - u)
+        converged = np.sum((u_next - u) ** 2) < tolerance
+        u, t = u_next, t_next
+        if converged:
+            break
+
+    is_satisfied = differences @ u > 0
+    fitted = dict(zip(names, (u * weight_sum).tolist()))
+    if write_back:
+        for name, weight in fitted.items():
+            model.change_parameter_weight(name, weight)
+    return WeightFit(
+        weights=fitted,
+        preferences=len(preferences),
+        satisfied=int(is_satisfied.sum()),
+        violated=[tuple(p) for p, s in zip(preferences, is_satisfied) if not s],
+        iterations=iterations,
+    )